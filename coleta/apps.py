@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ColetaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coleta'
+
+    def ready(self):
+        from . import bancos, metricas, orcamento, signals  # noqa: F401
@@ -0,0 +1,93 @@
+"""
+Perfil de produção do SQLite e separação de leituras e escritas
+
+Com COLETA_SQLITE_PRODUCAO ligado, config/settings.py torna as conexões
+persistentes (CONN_MAX_AGE), cria o alias LEITURA (o mesmo arquivo aberto
+somente leitura, mode=ro) e instala o RoteadorBancos. Cada conexão nova
+recebe os PRAGMAs de pragmas():
+
+- journal_mode=WAL: os leitores não esperam o escritor, nem o escritor
+  os leitores (só as escritas continuam em fila);
+- synchronous=NORMAL: sem fsync a cada commit; em WAL o banco continua
+  íntegro, e uma queda de energia pode perder só os últimos commits;
+- busy_timeout, cache_size e mmap_size (COLETA_SQLITE_*);
+- query_only na conexão de leitura.
+
+Os PRAGMAs são executados na conexão do sqlite3, fora dos
+execute_wrappers, para não entrarem nas métricas nem no orçamento de
+consultas da requisição que abriu a conexão.
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+
+LEITURA = 'leitura'
+
+
+def ativo():
+    return getattr(settings, 'COLETA_SQLITE_PRODUCAO', False)
+
+
+def pragmas(leitura=False):
+    """
+    PRAGMAs do perfil de produção para uma conexão de escrita ou de leitura
+    """
+    comuns = [
+        f"PRAGMA busy_timeout = {getattr(settings, 'COLETA_SQLITE_BUSY_TIMEOUT', 5000)}",
+        # Negativo: tamanho em KiB em vez de páginas
+        f"PRAGMA cache_size = -{getattr(settings, 'COLETA_SQLITE_CACHE_KB', 65536)}",
+        f"PRAGMA mmap_size = {getattr(settings, 'COLETA_SQLITE_MMAP_MB', 256) * 1024 * 1024}",
+    ]
+    if leitura:
+        return comuns + ['PRAGMA query_only = ON']
+    # O modo WAL fica gravado no arquivo; a conexão de leitura não pode alterá-lo
+    return ['PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL'] + comuns
+
+
+def aplicar_pragmas(conexao, leitura=False):
+    """
+    Executa os PRAGMAs em uma conexão do sqlite3
+    """
+    for pragma in pragmas(leitura):
+        conexao.execute(pragma).fetchall()
+
+
+def _configurar(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not ativo():
+        return
+    leitura = connection.alias == LEITURA
+    if leitura:
+        # A conexão principal passa o arquivo para WAL antes da primeira leitura
+        connections[DEFAULT_DB_ALIAS].ensure_connection()
+    aplicar_pragmas(connection.connection, leitura=leitura)
+
+
+connection_created.connect(_configurar, dispatch_uid='coleta_bancos')
+
+
+class RoteadorBancos:
+    """
+    Leituras na conexão somente leitura, escritas e migrações no banco
+    principal
+
+    Dentro de um bloco atômico do banco principal as leituras também vão
+    para ele: a conexão de leitura não vê o que a transação ainda não
+    gravou (e em WAL continuaria vendo o banco de antes do BEGIN).
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return LEITURA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Os dois aliases são o mesmo arquivo
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
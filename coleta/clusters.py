@@ -0,0 +1,225 @@
+"""
+Índice em memória de agrupamentos (clusters) de imóveis por nível de zoom
+
+Os pontos são agrupados em uma grade hierárquica sobre a projeção Web
+Mercator: no zoom z cada tile de 256 px é dividido em células de 64 px, e
+cada célula do zoom z contém exatamente 4 células do zoom z + 1. Cada
+célula guarda a quantidade de imóveis, a soma das coordenadas (para o
+centroide) e um imóvel representativo. Quando o representante é removido,
+o novo é escolhido em memória (células filhas ou, no zoom máximo, os
+pontos da célula), sem consultar o banco sob o lock do índice.
+
+O índice é mantido por processo (ver coleta.indices) e atualizado de forma
+incremental: cada escrita ajusta apenas as células que contêm a posição
+antiga e a nova do imóvel.
+"""
+
+import numpy as np
+
+from .espacial import mercator
+from .indices import IndiceEmMemoria
+
+
+class IndiceClusters(IndiceEmMemoria):
+    """
+    Grade hierárquica de clusters do processo atual
+    """
+
+    # Acima deste zoom os pontos são retornados individualmente
+    ZOOM_MAXIMO = 16
+
+    # Células de 64 px em tiles de 256 px
+    CELULAS_POR_TILE = 4
+
+    def _limpar_dados(self):
+        # Por nível: chave da célula -> [quantidade, soma_lat, soma_lng, representante]
+        self._niveis = [{} for _ in range(self.ZOOM_MAXIMO + 1)]
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lats = np.empty(0, dtype=np.float64)
+        self._lngs = np.empty(0, dtype=np.float64)
+        # Ids da construção ordenados por célula do zoom máximo (e por id)
+        self._chaves_maximo = np.empty(0, dtype=np.int64)
+        self._ids_por_celula = np.empty(0, dtype=np.int64)
+        # Posições alteradas desde a construção (None para removidos)
+        self._alterados = {}
+
+    def _celulas(self, lats, lngs, zoom):
+        """
+        Retorna os índices (coluna, linha) das células que contêm os pontos
+        """
+        x, y = mercator(lats, lngs)
+        n = self.CELULAS_POR_TILE << zoom
+        return (
+            np.minimum((x * n).astype(np.int64), n - 1),
+            np.minimum((y * n).astype(np.int64), n - 1),
+        )
+
+    def _chave(self, coluna, linha, zoom):
+        return coluna * (self.CELULAS_POR_TILE << zoom) + linha
+
+    def _construir_dados(self, ids, lats, lngs):
+        ordem = np.argsort(ids)
+        self._ids, self._lats, self._lngs = ids[ordem], lats[ordem], lngs[ordem]
+
+        colunas, linhas = self._celulas(self._lats, self._lngs, self.ZOOM_MAXIMO)
+        chaves = self._chave(colunas, linhas, self.ZOOM_MAXIMO)
+        ordem = np.lexsort((self._ids, chaves))
+        self._chaves_maximo, self._ids_por_celula = chaves[ordem], self._ids[ordem]
+        for zoom in range(self.ZOOM_MAXIMO, -1, -1):
+            deslocamento = self.ZOOM_MAXIMO - zoom
+            chaves = self._chave(colunas >> deslocamento, linhas >> deslocamento, zoom)
+            unicas, inverso = np.unique(chaves, return_inverse=True)
+            quantidades = np.bincount(inverso, minlength=len(unicas))
+            somas_lat = np.bincount(inverso, weights=self._lats, minlength=len(unicas))
+            somas_lng = np.bincount(inverso, weights=self._lngs, minlength=len(unicas))
+            representantes = np.zeros(len(unicas), dtype=np.int64)
+            np.maximum.at(representantes, inverso, self._ids)
+            self._niveis[zoom] = {
+                chave: [quantidade, soma_lat, soma_lng, representante]
+                for chave, quantidade, soma_lat, soma_lng, representante in zip(
+                    unicas.tolist(), quantidades.tolist(), somas_lat.tolist(),
+                    somas_lng.tolist(), representantes.tolist()
+                )
+            }
+
+    def _precisa_reconstruir(self):
+        return len(self._alterados) > max(1000, len(self._ids) // 20)
+
+    def _posicao(self, pk):
+        if pk in self._alterados:
+            return self._alterados[pk]
+        posicao = np.searchsorted(self._ids, pk)
+        if posicao < len(self._ids) and self._ids[posicao] == pk:
+            return float(self._lats[posicao]), float(self._lngs[posicao])
+        return None
+
+    def _aplicar(self, pk, lat, lng, sinal):
+        """
+        Soma (sinal=1) ou subtrai (sinal=-1) um ponto de todos os níveis
+        """
+        colunas, linhas = self._celulas([lat], [lng], self.ZOOM_MAXIMO)
+        coluna, linha = int(colunas[0]), int(linhas[0])
+        for zoom in range(self.ZOOM_MAXIMO, -1, -1):
+            deslocamento = self.ZOOM_MAXIMO - zoom
+            chave = self._chave(coluna >> deslocamento, linha >> deslocamento, zoom)
+            nivel = self._niveis[zoom]
+            celula = nivel.get(chave)
+            if sinal > 0:
+                if celula is None:
+                    nivel[chave] = [1, lat, lng, pk]
+                    continue
+                celula[0] += 1
+                celula[1] += lat
+                celula[2] += lng
+                if celula[3] is None or pk > celula[3]:
+                    celula[3] = pk
+            elif celula is not None:
+                celula[0] -= 1
+                if celula[0] <= 0:
+                    del nivel[chave]
+                    continue
+                celula[1] -= lat
+                celula[2] -= lng
+                if celula[3] == pk:
+                    celula[3] = None
+
+    def _remover(self, pk):
+        posicao = self._posicao(pk)
+        if posicao is None:
+            return
+        self._aplicar(pk, posicao[0], posicao[1], -1)
+        self._alterados[pk] = None
+
+    def _inserir(self, pk, lat, lng):
+        self._remover(pk)
+        self._aplicar(pk, lat, lng, 1)
+        self._alterados[pk] = (lat, lng)
+
+    def _representante(self, zoom, coluna, linha):
+        """
+        Retorna o imóvel representativo da célula, escolhendo um novo
+        (a partir das células filhas ou dos pontos da célula) se o anterior
+        foi removido
+        """
+        celula = self._niveis[zoom][self._chave(coluna, linha, zoom)]
+        if celula[3] is not None:
+            return celula[3]
+
+        if zoom < self.ZOOM_MAXIMO:
+            for filha_coluna in (2 * coluna, 2 * coluna + 1):
+                for filha_linha in (2 * linha, 2 * linha + 1):
+                    if self._chave(filha_coluna, filha_linha, zoom + 1) in self._niveis[zoom + 1]:
+                        celula[3] = self._representante(zoom + 1, filha_coluna, filha_linha)
+                        return celula[3]
+            return None
+
+        celula[3] = self._maior_id_da_celula(coluna, linha)
+        return celula[3]
+
+    def _maior_id_da_celula(self, coluna, linha):
+        """
+        Maior id entre os pontos atuais de uma célula do zoom máximo: os da
+        construção que não mudaram e os alterados que estão nela
+        """
+        chave = self._chave(coluna, linha, self.ZOOM_MAXIMO)
+        inicio, fim = np.searchsorted(self._chaves_maximo, [chave, chave + 1])
+        maior = None
+        for pk in self._ids_por_celula[inicio:fim][::-1].tolist():
+            if pk not in self._alterados:
+                maior = pk
+                break
+
+        alterados = [(pk, posicao) for pk, posicao in self._alterados.items() if posicao is not None]
+        if alterados:
+            pks, posicoes = zip(*alterados)
+            lats, lngs = zip(*posicoes)
+            colunas, linhas = self._celulas(lats, lngs, self.ZOOM_MAXIMO)
+            na_celula = np.asarray(pks)[(colunas == coluna) & (linhas == linha)]
+            if len(na_celula) and (maior is None or na_celula.max() > maior):
+                maior = int(na_celula.max())
+        return maior
+
+    def buscar(self, min_lng, min_lat, max_lng, max_lat, zoom):
+        """
+        Retorna os clusters do nível de zoom que intersectam o retângulo
+        """
+        zoom = min(max(int(zoom), 0), self.ZOOM_MAXIMO)
+        n = self.CELULAS_POR_TILE << zoom
+
+        with self._lock:
+            self._garantir_atualizado()
+
+            colunas, linhas = self._celulas([max_lat, min_lat], [min_lng, max_lng], zoom)
+            coluna_min, coluna_max = int(colunas[0]), int(colunas[1])
+            linha_min, linha_max = int(linhas[0]), int(linhas[1])
+
+            nivel = self._niveis[zoom]
+            area = (coluna_max - coluna_min + 1) * (linha_max - linha_min + 1)
+            if area <= len(nivel):
+                celulas = (
+                    (coluna, linha)
+                    for coluna in range(coluna_min, coluna_max + 1)
+                    for linha in range(linha_min, linha_max + 1)
+                    if self._chave(coluna, linha, zoom) in nivel
+                )
+            else:
+                celulas = (
+                    (coluna, linha)
+                    for coluna, linha in (divmod(chave, n) for chave in nivel)
+                    if coluna_min <= coluna <= coluna_max and linha_min <= linha <= linha_max
+                )
+
+            clusters = []
+            for coluna, linha in celulas:
+                quantidade, soma_lat, soma_lng, _ = nivel[self._chave(coluna, linha, zoom)]
+                clusters.append({
+                    'latitude': round(soma_lat / quantidade, 6),
+                    'longitude': round(soma_lng / quantidade, 6),
+                    'quantidade': quantidade,
+                    'id': self._representante(zoom, coluna, linha),
+                })
+        return clusters
+
+
+# Instância única por processo
+indice_clusters = IndiceClusters()
@@ -0,0 +1,156 @@
+"""
+Requisições condicionais (ETag / Last-Modified) da API de imóveis
+
+- Detalhe: ETag e Last-Modified vêm de data_atualizacao do imóvel, lida
+  por chave primária antes de serializar, junto com o que a representação
+  traz de fora da linha ou além dela: o nome do agente, a foto, a marca
+  das miniaturas e o servidor acessado (as URLs são absolutas).
+- Listagens e estatísticas: só a ETag, de uma versão do conjunto de dados, a
+  maior data_atualizacao da tabela (índice (data_atualizacao, id), lida
+  pelo SQLite direto na ponta do índice) somada às contagens do contador
+  total materializado (índice único de EstatisticaColeta). Toda escrita
+  em Imovel avança data_atualizacao (auto_now) e toda remoção altera os
+  contadores, então a versão muda a cada alteração; a ETag combina a
+  versão com os parâmetros da requisição, o formato aceito, o servidor
+  acessado e, quando a resposta depende dele, o usuário. Não há
+  Last-Modified: a data, em segundos inteiros, não muda com remoções nem
+  com duas escritas no mesmo segundo, e If-Modified-Since responderia 304
+  com dados antigos.
+
+Se o If-None-Match do cliente confere, a resposta 304 é devolvida sem
+consultar nem serializar os imóveis.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def _consultas_versao():
+    from .models import EstatisticaColeta, Imovel
+
+    return (
+        Imovel.objects,
+        EstatisticaColeta.objects.filter(dimensao='total', chave='').values_list('ativos', 'inativos'),
+    )
+
+
+def versao_imoveis():
+    """
+    Retorna (última alteração, ativos, inativos) do conjunto de imóveis
+    """
+    imoveis, contagens = _consultas_versao()
+    ultima = imoveis.aggregate(ultima=Max('data_atualizacao'))['ultima']
+    return (ultima, *(contagens.first() or (0, 0)))
+
+
+async def aversao_imoveis():
+    """
+    Versão assíncrona de versao_imoveis (ORM assíncrono)
+    """
+    imoveis, contagens = _consultas_versao()
+    ultima = (await imoveis.aaggregate(ultima=Max('data_atualizacao')))['ultima']
+    return (ultima, *(await contagens.afirst() or (0, 0)))
+
+
+def _etag(*partes):
+    resumo = hashlib.sha1(repr(partes).encode()).hexdigest()[:24]
+    return quote_etag(resumo)
+
+
+def _parametros(request):
+    return sorted(request.query_params.lists())
+
+
+def _validadores_colecao(view, request, versao, por_usuario):
+    ultima, ativos, inativos = versao
+    etag = _etag(
+        view.action,
+        ultima.isoformat() if ultima else None,
+        ativos,
+        inativos,
+        _parametros(request),
+        request.accepted_media_type,
+        request.build_absolute_uri('/'),
+        request.user.pk if por_usuario else None,
+    )
+    return etag, None
+
+
+def validadores_colecao(view, request, por_usuario=False):
+    """
+    (ETag, None) de uma listagem, a partir da versão do conjunto (sem
+    Last-Modified)
+    """
+    return _validadores_colecao(view, request, versao_imoveis(), por_usuario)
+
+
+async def avalidadores_colecao(view, request, por_usuario=False):
+    """
+    Versão assíncrona de validadores_colecao
+    """
+    return _validadores_colecao(view, request, await aversao_imoveis(), por_usuario)
+
+
+def validadores_detalhe(view, request, pk=None):
+    """
+    (ETag, Last-Modified) do detalhe de um imóvel, ou (None, None) se ele
+    não existe (a view responde 404 normalmente)
+    """
+    linha = (
+        view.get_queryset()
+        .filter(pk=pk)
+        .order_by()
+        .values_list('pk', 'data_atualizacao', 'agente_coleta__username', 'foto', 'miniaturas_geradas')
+        .first()
+    )
+    if linha is None:
+        return None, None
+    etag = _etag(view.action, *linha, request.accepted_media_type, request.build_absolute_uri('/'))
+    return etag, linha[1]
+
+
+def nao_modificado(request, etag, ultima):
+    """
+    Resposta 304 se o cliente já tem a versão atual, ou None
+    """
+    resposta = get_conditional_response(request, etag=etag, last_modified=_timestamp(ultima))
+    if resposta is not None:
+        incluir_validadores(resposta, etag, ultima)
+    return resposta
+
+
+def incluir_validadores(resposta, etag, ultima):
+    resposta['ETag'] = etag
+    if ultima is not None:
+        resposta['Last-Modified'] = http_date(_timestamp(ultima))
+
+
+def _timestamp(ultima):
+    return int(ultima.timestamp()) if ultima else None
+
+
+def condicional(validadores, **opcoes):
+    """
+    Decorator de actions GET: calcula os validadores antes da action,
+    responde 304 quando o cliente já tem a versão atual e, nas respostas
+    200, inclui os cabeçalhos ETag e Last-Modified
+    """
+    def decorator(metodo):
+        @wraps(metodo)
+        def envolvido(self, request, *args, **kwargs):
+            etag, ultima = validadores(self, request, *args, **kwargs, **opcoes)
+            if etag is None:
+                return metodo(self, request, *args, **kwargs)
+
+            resposta = nao_modificado(request, etag, ultima)
+            if resposta is None:
+                resposta = metodo(self, request, *args, **kwargs)
+                if resposta.status_code == 200:
+                    incluir_validadores(resposta, etag, ultima)
+            return resposta
+        return envolvido
+    return decorator
@@ -0,0 +1,165 @@
+"""
+Funções espaciais do aplicativo de coleta
+
+Cálculo de distâncias (ponto a ponto e vetorizado com NumPy), projeção
+Web Mercator usada pelos mapas e índice de grade fixa (células de tamanho
+constante em graus) usado para restringir as buscas por proximidade sem
+depender de GeoDjango/PostGIS.
+"""
+
+from math import asin, cos, degrees, floor, isfinite, pi, radians, sin, sqrt
+
+import numpy as np
+from django.db.models import Q
+
+
+# Raio médio da Terra em metros (mesmo valor usado por Imovel.get_distancia_para)
+RAIO_TERRA_M = 6371 * 1000
+
+# Tamanho da célula da grade em graus (~1,1 km no equador).
+# Alterar este valor exige recalcular Imovel.celula_grade para todos os registros.
+TAMANHO_CELULA_GRAUS = 0.01
+
+LINHAS_GRADE = int(round(180 / TAMANHO_CELULA_GRAUS))
+COLUNAS_GRADE = int(round(360 / TAMANHO_CELULA_GRAUS))
+
+# Acima deste número de linhas a busca usa um único intervalo de células
+# (superconjunto) em vez de um intervalo por linha
+MAXIMO_LINHAS_FILTRO = 64
+
+
+def distancia_haversine(lat1, lng1, lat2, lng2):
+    """
+    Distância em metros entre dois pontos pela fórmula de Haversine
+    """
+    lng1, lat1, lng2, lat2 = map(radians, [lng1, lat1, lng2, lat2])
+    dlng = lng2 - lng1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
+    return 2 * asin(sqrt(a)) * RAIO_TERRA_M
+
+
+def distancias_haversine(lats, lngs, lat, lng):
+    """
+    Versão vetorizada de distancia_haversine: calcula a distância em metros
+    de cada ponto dos arrays (lats, lngs) até (lat, lng)
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    lat, lng = radians(lat), radians(lng)
+    a = np.sin((lat - lats) / 2) ** 2 + np.cos(lats) * cos(lat) * np.sin((lng - lngs) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * RAIO_TERRA_M
+
+
+def filtrar_por_raio(lats, lngs, lat, lng, distancia):
+    """
+    Calcula de uma só vez as distâncias, a máscara dos pontos dentro do
+    raio e a ordem (índices dos pontos dentro do raio, do mais próximo ao
+    mais distante; empates mantêm a ordem original)
+
+    Retorna a tupla (distancias, mascara, ordem).
+    """
+    distancias = distancias_haversine(lats, lngs, lat, lng)
+    mascara = distancias <= distancia
+    dentro = np.flatnonzero(mascara)
+    ordem = dentro[np.argsort(distancias[dentro], kind='stable')]
+    return distancias, mascara, ordem
+
+
+# Latitude máxima representável na projeção Web Mercator
+LATITUDE_MAXIMA_MERCATOR = 85.0511287798066
+
+
+def mercator(lats, lngs):
+    """
+    Projeta latitude/longitude (graus) em coordenadas Web Mercator
+    normalizadas: x e y entre 0 e 1, com y crescendo para o sul
+    """
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -LATITUDE_MAXIMA_MERCATOR, LATITUDE_MAXIMA_MERCATOR)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    x = (lngs + 180) / 360
+    seno = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * pi)
+    return np.clip(x, 0.0, 1.0), np.clip(y, 0.0, 1.0)
+
+
+def mercator_inverso(x, y):
+    """
+    Converte coordenadas Web Mercator normalizadas em (latitude, longitude)
+    """
+    lng = np.asarray(x, dtype=np.float64) * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(pi * (1 - 2 * np.asarray(y, dtype=np.float64)))))
+    return lat, lng
+
+
+def _linha(lat):
+    return min(max(int(floor((lat + 90) / TAMANHO_CELULA_GRAUS)), 0), LINHAS_GRADE - 1)
+
+
+def _coluna(lng):
+    return min(max(int(floor((lng + 180) / TAMANHO_CELULA_GRAUS)), 0), COLUNAS_GRADE - 1)
+
+
+def celula_da_grade(lat, lng):
+    """
+    Retorna a chave inteira da célula da grade que contém a coordenada
+    """
+    if lat is None or lng is None:
+        return None
+    lat = float(lat)
+    lng = float(lng)
+    if not (isfinite(lat) and isfinite(lng)):
+        return None
+    return _linha(lat) * COLUNAS_GRADE + _coluna(lng)
+
+
+def filtro_celulas_no_raio(lat, lng, distancia):
+    """
+    Retorna um Q que seleciona os registros cujas células da grade
+    intersectam o círculo (lat, lng, distancia em metros).
+
+    O filtro é um superconjunto: o resultado ainda precisa passar pelo
+    cálculo exato de Haversine. Retorna None quando não é possível
+    restringir a busca (coordenadas inválidas, raio enorme, etc.).
+    """
+    if not (isfinite(lat) and isfinite(lng) and isfinite(distancia)) or distancia < 0:
+        return None
+
+    angulo = distancia / RAIO_TERRA_M
+    if angulo >= pi / 2:
+        return None
+
+    # Margem para erros de arredondamento nas bordas das células
+    margem = 1e-9
+    delta_lat = degrees(angulo) + margem
+    lat_min = max(lat - delta_lat, -90.0)
+    lat_max = min(lat + delta_lat, 90.0)
+
+    # Maior variação de longitude possível dentro do raio
+    cos_lat = cos(radians(lat))
+    if lat_min <= -90.0 or lat_max >= 90.0 or sin(angulo) >= cos_lat:
+        coluna_min, coluna_max = 0, COLUNAS_GRADE - 1
+    else:
+        delta_lng = degrees(asin(sin(angulo) / cos_lat)) + margem
+        if lng - delta_lng < -180 or lng + delta_lng > 180:
+            # Círculo cruza o antimeridiano
+            coluna_min, coluna_max = 0, COLUNAS_GRADE - 1
+        else:
+            coluna_min, coluna_max = _coluna(lng - delta_lng), _coluna(lng + delta_lng)
+
+    linha_min, linha_max = _linha(lat_min), _linha(lat_max)
+
+    # Registros ainda sem célula calculada entram sempre como candidatos
+    filtro = Q(celula_grade__isnull=True)
+    if linha_max - linha_min + 1 > MAXIMO_LINHAS_FILTRO:
+        return filtro | Q(celula_grade__range=(
+            linha_min * COLUNAS_GRADE + coluna_min,
+            linha_max * COLUNAS_GRADE + coluna_max,
+        ))
+
+    for linha in range(linha_min, linha_max + 1):
+        filtro |= Q(celula_grade__range=(
+            linha * COLUNAS_GRADE + coluna_min,
+            linha * COLUNAS_GRADE + coluna_max,
+        ))
+    return filtro
@@ -0,0 +1,213 @@
+"""
+Estatísticas de coleta materializadas
+
+Os contadores (total, por agente, por bairro e por cidade, separados em
+ativos e inativos) ficam na tabela EstatisticaColeta. Cada escrita em
+Imovel subtrai a contribuição do estado anterior e soma a do novo estado,
+na mesma transação da escrita (ver coleta.signals), com uma única
+instrução para todos os contadores alterados (somar_contadores). Linhas
+que chegam a zero são apagadas, como em recalcular(), que só cria linhas
+com alguma contagem.
+"""
+
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Count, Q
+
+
+def contribuicoes(agente_id, bairro, cidade, ativo):
+    """
+    Retorna as contagens (dimensao, chave, campo) de um imóvel no estado dado
+    """
+    campo = 'ativos' if ativo else 'inativos'
+    linhas = [
+        ('total', '', campo),
+        ('bairro', bairro or '', campo),
+        ('cidade', cidade or '', campo),
+    ]
+    if agente_id is not None:
+        linhas.append(('agente', str(agente_id), campo))
+    return linhas
+
+
+def somar_contadores(modelo, campos_chave, campos_soma, linhas):
+    """
+    Soma deltas aos contadores de um modelo, criando as linhas que ainda
+    não existem, em um único INSERT ... ON CONFLICT DO UPDATE (SQLite e
+    PostgreSQL): o número de consultas de uma escrita não depende de os
+    contadores já existirem, e escritas concorrentes não colidem. Depois
+    de deltas negativos, as linhas com todos os campos_soma zerados são
+    apagadas
+
+    linhas: tuplas com os valores de campos_chave seguidos dos deltas de
+    campos_soma; campos_chave deve ser uma restrição única do modelo
+    """
+    if not linhas:
+        return
+    conexao = connections[router.db_for_write(modelo)]
+    nome = conexao.ops.quote_name
+    tabela = nome(modelo._meta.db_table)
+    chave = [nome(modelo._meta.get_field(campo).column) for campo in campos_chave]
+    soma = [nome(modelo._meta.get_field(campo).column) for campo in campos_soma]
+    sql = (
+        f"INSERT INTO {tabela} ({', '.join(chave + soma)}) VALUES ({', '.join(['%s'] * (len(chave) + len(soma)))}) "
+        f"ON CONFLICT ({', '.join(chave)}) DO UPDATE SET "
+        + ', '.join(f'{coluna} = {tabela}.{coluna} + excluded.{coluna}' for coluna in soma)
+    )
+    zeradas = [linha[:len(chave)] for linha in linhas if any(delta < 0 for delta in linha[len(chave):])]
+    with conexao.cursor() as cursor:
+        cursor.executemany(sql, linhas)
+        if zeradas:
+            cursor.executemany(
+                f"DELETE FROM {tabela} WHERE "
+                + ' AND '.join([f'{coluna} = %s' for coluna in chave] + [f'{coluna} = 0' for coluna in soma]),
+                zeradas,
+            )
+
+
+def variacao_alteracao(antes, depois):
+    """
+    Variação dos contadores pela mudança de estado de um imóvel
+    antes/depois: tuplas (agente_id, bairro, cidade, ativo) ou None
+    """
+    variacao = Counter()
+    if antes is not None:
+        variacao.subtract(contribuicoes(*antes))
+    if depois is not None:
+        variacao.update(contribuicoes(*depois))
+    return variacao
+
+
+def aplicar_variacao(variacao):
+    """
+    Grava nos contadores uma variação (dimensao, chave, campo) -> delta
+    """
+    from .models import EstatisticaColeta
+
+    deltas = {}
+    for (dimensao, chave, campo), delta in variacao.items():
+        if delta:
+            ativos, inativos = deltas.get((dimensao, chave), (0, 0))
+            deltas[dimensao, chave] = (ativos + delta, inativos) if campo == 'ativos' else (ativos, inativos + delta)
+    somar_contadores(
+        EstatisticaColeta, ('dimensao', 'chave'), ('ativos', 'inativos'),
+        [(*chave, *valores) for chave, valores in deltas.items() if any(valores)],
+    )
+
+
+def registrar_alteracao(antes, depois):
+    """
+    Aplica aos contadores a mudança de estado de um imóvel
+    antes/depois: tuplas (agente_id, bairro, cidade, ativo) ou None
+    """
+    aplicar_variacao(variacao_alteracao(antes, depois))
+
+
+def recalcular(imovel_model=None, estatistica_model=None):
+    """
+    Recalcula todos os contadores a partir da tabela de imóveis
+    (os modelos podem ser passados para uso em migrações)
+    """
+    if imovel_model is None or estatistica_model is None:
+        from .models import EstatisticaColeta, Imovel
+        imovel_model = imovel_model or Imovel
+        estatistica_model = estatistica_model or EstatisticaColeta
+
+    contagem = {
+        'ativos': Count('id', filter=Q(ativo=True)),
+        'inativos': Count('id', filter=Q(ativo=False)),
+    }
+    linhas = []
+    total = imovel_model.objects.aggregate(**contagem)
+    if total['ativos'] or total['inativos']:
+        linhas.append(estatistica_model(dimensao='total', chave='', **total))
+    for dimensao, campo in (('agente', 'agente_coleta_id'), ('bairro', 'bairro'), ('cidade', 'cidade')):
+        grupos = Counter()
+        for valores in imovel_model.objects.order_by().values(campo).annotate(**contagem):
+            if dimensao == 'agente' and valores[campo] is None:
+                continue
+            chave = str(valores[campo]) if dimensao == 'agente' else (valores[campo] or '')
+            # bairro nulo e vazio caem na mesma chave
+            grupos[(chave, 'ativos')] += valores['ativos']
+            grupos[(chave, 'inativos')] += valores['inativos']
+        for chave in sorted({chave for chave, _ in grupos}):
+            linhas.append(estatistica_model(
+                dimensao=dimensao,
+                chave=chave,
+                ativos=grupos[(chave, 'ativos')],
+                inativos=grupos[(chave, 'inativos')],
+            ))
+
+    with transaction.atomic():
+        estatistica_model.objects.all().delete()
+        estatistica_model.objects.bulk_create(linhas, batch_size=500)
+    return len(linhas)
+
+
+def ler_estatisticas(usuario):
+    """
+    Monta a resposta de /api/imoveis/estatisticas/ a partir dos contadores
+    """
+    from .models import EstatisticaColeta
+
+    contagens = _agrupar(EstatisticaColeta.objects.values_list('dimensao', 'chave', 'ativos', 'inativos'))
+    nomes = dict(User.objects.filter(pk__in=contagens['por_agente_id']).values_list('pk', 'username'))
+    return _resposta(contagens, nomes, usuario)
+
+
+async def aler_estatisticas(usuario):
+    """
+    Versão assíncrona de ler_estatisticas (ORM assíncrono)
+    """
+    from .models import EstatisticaColeta
+
+    contagens = _agrupar([
+        linha async for linha in
+        EstatisticaColeta.objects.values_list('dimensao', 'chave', 'ativos', 'inativos')
+    ])
+    nomes = {
+        pk: username async for pk, username in
+        User.objects.filter(pk__in=contagens['por_agente_id']).values_list('pk', 'username')
+    }
+    return _resposta(contagens, nomes, usuario)
+
+
+def _agrupar(linhas):
+    total = {'ativos': 0, 'inativos': 0}
+    por_agente_id = {}
+    por_bairro = {}
+    por_cidade = {}
+    for dimensao, chave, ativos, inativos in linhas:
+        if dimensao == 'total':
+            total = {'ativos': ativos, 'inativos': inativos}
+        elif ativos <= 0:
+            continue
+        elif dimensao == 'agente':
+            por_agente_id[int(chave)] = ativos
+        elif dimensao == 'bairro' and chave:
+            por_bairro[chave] = ativos
+        elif dimensao == 'cidade' and chave:
+            por_cidade[chave] = ativos
+    return {
+        'total': total,
+        'por_agente_id': por_agente_id,
+        'por_bairro': por_bairro,
+        'por_cidade': por_cidade,
+    }
+
+
+def _resposta(contagens, nomes, usuario):
+    return {
+        'total_imoveis': contagens['total']['ativos'],
+        'meus_imoveis': contagens['por_agente_id'].get(usuario.pk, 0),
+        'por_agente': {
+            nomes[pk]: quantidade
+            for pk, quantidade in contagens['por_agente_id'].items()
+            if pk in nomes
+        },
+        'imoveis_inativos': contagens['total']['inativos'],
+        'por_bairro': contagens['por_bairro'],
+        'por_cidade': contagens['por_cidade'],
+    }
@@ -0,0 +1,115 @@
+"""
+Normalização das fotos enviadas pelos agentes de campo
+
+Antes de gravar Imovel.foto, a imagem é:
+- reduzida para no máximo COLETA_FOTO_LADO_MAXIMO px no maior lado;
+- recodificada em JPEG progressivo ou WebP (COLETA_FOTO_FORMATO) com
+  qualidade COLETA_FOTO_QUALIDADE;
+- gravada sem metadados EXIF, exceto a orientação.
+
+As coordenadas GPS do EXIF são extraídas antes de descartar os metadados,
+para preencher latitude/longitude quando o envio não as traz.
+
+Fotos HEIC (iPhone) são aceitas quando o pacote pillow-heif está
+instalado.
+"""
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import ExifTags, Image
+
+try:
+    from pillow_heif import register_heif_opener
+except ImportError:
+    register_heif_opener = None
+
+if register_heif_opener is not None:
+    register_heif_opener()
+
+
+FORMATOS = {
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+}
+
+_ORIENTACAO = ExifTags.Base.Orientation
+_GPS = ExifTags.IFD.GPSInfo
+
+
+def _configuracao():
+    formato = getattr(settings, 'COLETA_FOTO_FORMATO', 'JPEG').upper()
+    if formato not in FORMATOS:
+        formato = 'JPEG'
+    return (
+        getattr(settings, 'COLETA_FOTO_LADO_MAXIMO', 2048),
+        getattr(settings, 'COLETA_FOTO_QUALIDADE', 82),
+        formato,
+    )
+
+
+def _graus(valor, referencia):
+    """
+    Converte (graus, minutos, segundos) do EXIF em graus decimais
+    """
+    graus, minutos, segundos = (float(parte) for parte in valor)
+    decimal = graus + minutos / 60 + segundos / 3600
+    if referencia in ('S', 'W'):
+        decimal = -decimal
+    return decimal
+
+
+def coordenadas_gps(exif):
+    """
+    Retorna (latitude, longitude) das tags GPS do EXIF, ou None
+    """
+    gps = exif.get_ifd(_GPS)
+    try:
+        latitude = _graus(gps[ExifTags.GPS.GPSLatitude], gps.get(ExifTags.GPS.GPSLatitudeRef, 'N'))
+        longitude = _graus(gps[ExifTags.GPS.GPSLongitude], gps.get(ExifTags.GPS.GPSLongitudeRef, 'E'))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude, longitude) == (0, 0):
+        return None
+    return round(latitude, 7), round(longitude, 7)
+
+
+def normalizar_foto(arquivo):
+    """
+    Retorna (foto normalizada como ContentFile, coordenadas GPS ou None)
+
+    A imagem é lida diretamente do arquivo enviado; para JPEG a
+    decodificação já é feita em escala reduzida (draft), sem manter em
+    memória uma cópia em resolução total.
+    """
+    lado_maximo, qualidade, formato = _configuracao()
+
+    arquivo.seek(0)
+    with Image.open(arquivo) as imagem:
+        exif = imagem.getexif()
+        coordenadas = coordenadas_gps(exif)
+        orientacao = exif.get(_ORIENTACAO)
+
+        imagem.draft('RGB', (lado_maximo, lado_maximo))
+        if imagem.mode not in ('RGB', 'L'):
+            imagem = imagem.convert('RGB')
+        # thumbnail() reduz no lugar e mantém a proporção
+        imagem.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+        # Apenas a orientação é mantida; os pixels não são girados
+        metadados = Image.Exif()
+        if orientacao:
+            metadados[_ORIENTACAO] = orientacao
+
+        conteudo = BytesIO()
+        opcoes = {'quality': qualidade, 'exif': metadados.tobytes()}
+        if formato == 'JPEG':
+            opcoes.update(optimize=True, progressive=True)
+        else:
+            opcoes.update(method=4)
+        imagem.save(conteudo, formato, **opcoes)
+
+    raiz, _ = os.path.splitext(os.path.basename(arquivo.name or 'foto'))
+    return ContentFile(conteudo.getvalue(), name=raiz + FORMATOS[formato]), coordenadas
@@ -0,0 +1,152 @@
+"""
+Cache de fragmentos: JSON já renderizado de cada imóvel
+
+A representação de cada imóvel, codificada pelo ORJSONRenderer, é guardada
+no cache do Django (COLETA_FRAGMENTOS_CACHE) com a chave
+
+    (serializer e seus campos, endereço do servidor, id, data_atualizacao)
+
+Como toda alteração avança data_atualizacao, uma entrada nunca fica
+desatualizada: a versão antiga apenas deixa de ser lida e expira. Isso
+inclui o nome do agente (agente_nome), que vem de outra tabela: renomear ou
+excluir o usuário avança data_atualizacao dos imóveis dele (ver
+coleta.signals). Para uma
+página, as entradas são lidas de uma vez (get_many), somente as faltantes
+são serializadas, e os fragmentos são copiados para a resposta sem nova
+codificação.
+
+Os fragmentos só são usados quando a resposta é renderizada pelo
+ORJSONRenderer sem indentação; nos demais formatos a serialização é a de
+sempre. Acertos e faltas entram no contador coleta_fragmentos_total das
+métricas (coleta.metricas), somado entre todos os workers mesmo com
+COLETA_METRICAS_ATIVO desligado (que só desliga a exposição).
+"""
+
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metricas
+from .renderers import FragmentoJSON, ORJSONRenderer
+from .serializacao import float_json
+
+
+ROTULO_ACERTOS = 'resultado="acerto"'
+ROTULO_FALTAS = 'resultado="falta"'
+
+_renderer = ORJSONRenderer()
+
+
+def cache_fragmentos():
+    return caches[getattr(settings, 'COLETA_FRAGMENTOS_CACHE', 'default')]
+
+
+def ativo():
+    return getattr(settings, 'COLETA_FRAGMENTOS_ATIVO', True)
+
+
+def usar_fragmentos(request):
+    """
+    Indica se a resposta desta requisição pode receber fragmentos
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    return (ativo() and isinstance(renderer, ORJSONRenderer)
+            and renderer.aceita_fragmentos(request.accepted_media_type))
+
+
+@lru_cache(maxsize=None)
+def _campos(serializer_class):
+    # Os nomes dos campos entram na chave: mudar o serializer descarta o
+    # que foi gravado com a versão anterior
+    return ','.join(serializer_class().fields)
+
+
+def _prefixo(serializer_class, request):
+    # URLs das fotos são absolutas: o servidor acessado também faz parte da chave
+    origem = f'{serializer_class.__name__}|{_campos(serializer_class)}|{request.build_absolute_uri("/")}'
+    return 'fr:' + hashlib.md5(origem.encode()).hexdigest()[:10]
+
+
+def _chave(prefixo, pk, data_atualizacao):
+    # Chaves curtas: o backend confere cada caractere da chave a cada leitura
+    return f'{prefixo}:{pk}:{int(data_atualizacao.timestamp() * 1_000_000)}'
+
+
+def _identificar_objeto(objeto):
+    return objeto.pk, objeto.data_atualizacao
+
+
+def renderizar(representacao):
+    """
+    Bytes JSON de uma representação, como o ORJSONRenderer os escreveria
+    """
+    dados = {
+        nome: float_json(valor) if type(valor) is float else valor
+        for nome, valor in representacao.items()
+    }
+    return _renderer.render(dados)
+
+
+def representar(request, serializer_class, itens, serializar, identificar=_identificar_objeto):
+    """
+    Representações dos itens, usando o cache de fragmentos quando possível
+
+    serializar(itens) deve retornar as representações (dicts) dos itens
+    na mesma ordem; identificar(item) retorna (id, data_atualizacao).
+
+    As listagens servidas por SerializacaoRapida não passam por aqui: ler
+    o fragmento do cache custa o mesmo que montá-lo a partir de values().
+    """
+    itens = list(itens)
+    if not itens or not usar_fragmentos(request):
+        return serializar(itens)
+
+    cache = cache_fragmentos()
+    prefixo = _prefixo(serializer_class, request)
+    chaves = [_chave(prefixo, *identificar(item)) for item in itens]
+
+    encontrados = cache.get_many(chaves)
+    faltantes = [(chave, item) for chave, item in zip(chaves, itens) if chave not in encontrados]
+    if faltantes:
+        novos = {
+            chave: renderizar(representacao)
+            for (chave, _), representacao in zip(
+                faltantes, serializar([item for _, item in faltantes]))
+        }
+        cache.set_many(novos, timeout=getattr(settings, 'COLETA_FRAGMENTOS_TIMEOUT', 86400))
+        encontrados.update(novos)
+
+    _contar(ROTULO_ACERTOS, len(chaves) - len(faltantes))
+    _contar(ROTULO_FALTAS, len(faltantes))
+    return [FragmentoJSON(encontrados[chave]) for chave in chaves]
+
+
+def _contar(rotulo, quantidade):
+    if quantidade:
+        metricas.acumulador.incrementar(metricas.CONTADOR_FRAGMENTOS, rotulo, quantidade)
+
+
+def contadores():
+    """
+    Acertos e faltas do cache de fragmentos, de todos os workers, desde a
+    última limpeza
+    """
+    valores = {
+        rotulos: int(valor)
+        for nome, rotulos, _, valor in metricas.acumulador.ler()
+        if nome == metricas.CONTADOR_FRAGMENTOS
+    }
+    acertos = valores.get(ROTULO_ACERTOS, 0)
+    faltas = valores.get(ROTULO_FALTAS, 0)
+    total = acertos + faltas
+    return {
+        'acertos': acertos,
+        'faltas': faltas,
+        'taxa_acerto': round(acertos / total, 4) if total else None,
+    }
+
+
+def zerar_contadores():
+    metricas.acumulador.zerar(metricas.CONTADOR_FRAGMENTOS)
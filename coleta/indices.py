@@ -0,0 +1,135 @@
+"""
+Base dos índices em memória do aplicativo de coleta
+
+Cada processo (worker do gunicorn) mantém sua própria cópia dos índices,
+construída sob demanda na primeira consulta a partir dos imóveis ativos.
+Escritas feitas no próprio processo chegam pelos signals (coleta.signals);
+escritas feitas por outros workers são aplicadas periodicamente a partir
+de Imovel.data_atualizacao.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+
+class IndiceEmMemoria:
+    """
+    Índice por processo sobre as coordenadas dos imóveis ativos
+
+    Subclasses implementam _limpar_dados, _construir_dados, _inserir e
+    _remover; este último deve aceitar ids que não estão no índice.
+    """
+
+    # Margem de segurança ao ler alterações de outros workers, cobrindo
+    # transações que gravaram data_atualizacao antes de serem confirmadas
+    MARGEM_SINCRONIA = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._limpar()
+
+    def _limpar(self):
+        self._construido = False
+        self._marca = None
+        self._ultima_sincronia = 0.0
+        self._limpar_dados()
+
+    def _limpar_dados(self):
+        raise NotImplementedError
+
+    def _construir_dados(self, ids, lats, lngs):
+        raise NotImplementedError
+
+    def _inserir(self, pk, lat, lng):
+        raise NotImplementedError
+
+    def _remover(self, pk):
+        raise NotImplementedError
+
+    def _precisa_reconstruir(self):
+        return False
+
+    @property
+    def construido(self):
+        return self._construido
+
+    def invalidar(self):
+        """
+        Descarta o índice; ele será reconstruído na próxima consulta
+        """
+        with self._lock:
+            self._limpar()
+
+    def _construir(self):
+        from .models import Imovel
+
+        # A marca é lida antes dos dados para que escritas concorrentes
+        # sejam reaplicadas na próxima sincronização
+        marca = Imovel.objects.aggregate(marca=Max('data_atualizacao'))['marca']
+        linhas = np.array(
+            list(Imovel.objects.filter(ativo=True).values_list('id', 'latitude', 'longitude')),
+            dtype=np.float64
+        ).reshape(-1, 3)
+        self._limpar()
+        self._construir_dados(linhas[:, 0].astype(np.int64), linhas[:, 1], linhas[:, 2])
+        self._construido = True
+        self._marca = marca
+        self._ultima_sincronia = time.monotonic()
+
+    def _sincronizar(self):
+        """
+        Aplica as alterações gravadas por outros processos desde a última marca
+        """
+        from .models import Imovel
+
+        intervalo = getattr(settings, 'COLETA_INDICES_SINCRONIA_SEGUNDOS', 2)
+        agora = time.monotonic()
+        if agora - self._ultima_sincronia < intervalo:
+            return
+        self._ultima_sincronia = agora
+
+        alterados = Imovel.objects.all()
+        if self._marca is not None:
+            alterados = alterados.filter(data_atualizacao__gte=self._marca - self.MARGEM_SINCRONIA)
+        for pk, lat, lng, ativo, data_atualizacao in alterados.values_list(
+                'id', 'latitude', 'longitude', 'ativo', 'data_atualizacao').iterator():
+            if ativo:
+                self._inserir(pk, lat, lng)
+            else:
+                self._remover(pk)
+            if self._marca is None or data_atualizacao > self._marca:
+                self._marca = data_atualizacao
+
+    def _garantir_atualizado(self):
+        """
+        Constrói ou sincroniza o índice antes de uma consulta
+        (deve ser chamado com o lock adquirido)
+        """
+        if not self._construido or self._precisa_reconstruir():
+            self._construir()
+            return
+        self._sincronizar()
+        if self._precisa_reconstruir():
+            self._construir()
+
+    def atualizar(self, pk, lat, lng, ativo=True):
+        """
+        Registra a posição atual de um imóvel (ou sua remoção, se inativo)
+        """
+        with self._lock:
+            if not self._construido:
+                return
+            if ativo:
+                self._inserir(pk, lat, lng)
+            else:
+                self._remover(pk)
+
+    def remover(self, pk):
+        with self._lock:
+            if self._construido:
+                self._remover(pk)
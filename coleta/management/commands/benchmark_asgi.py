@@ -0,0 +1,176 @@
+"""
+Compara os endpoints de leitura servidos pelo gunicorn com workers
+síncronos (WSGI, /api/imoveis/) e com workers do uvicorn (ASGI,
+/api/assincrono/imoveis/), com o mesmo número de processos
+
+Para cada modo o comando sobe o servidor em 127.0.0.1, dispara as
+requisições (mistura de listagem, bbox, proximos e estatisticas) com
+--concorrencia clientes simultâneos mantendo a conexão aberta e mostra a
+vazão e a latência. Os clientes rodam neste processo: em máquinas com
+poucos núcleos eles disputam CPU com o servidor.
+
+Uso: python manage.py benchmark_asgi --processos 2 --concorrencia 64 --requisicoes 2000
+"""
+
+import http.client
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from importlib import import_module
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg
+
+from coleta.models import Imovel
+
+
+MODOS = (
+    ('wsgi (sync)', 'config.wsgi:application', 'sync', '/api/imoveis/'),
+    ('asgi (uvicorn)', 'config.asgi:application', 'uvicorn.workers.UvicornWorker', '/api/assincrono/imoveis/'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara a vazão dos endpoints de leitura nos workers síncronos (WSGI) e ASGI do gunicorn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=2, help='Workers do gunicorn em cada modo')
+        parser.add_argument('--concorrencia', type=int, default=64, help='Clientes simultâneos')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições medidas por modo')
+        parser.add_argument('--usuario', help='Usuário autenticado nas requisições (padrão: o primeiro ativo)')
+        parser.add_argument('--porta', type=int, default=8701)
+
+    def handle(self, *args, **options):
+        if min(options['processos'], options['concorrencia'], options['requisicoes']) < 1:
+            raise CommandError('processos, concorrencia e requisicoes devem ser positivos')
+
+        centro = Imovel.objects.filter(ativo=True).aggregate(lat=Avg('latitude'), lng=Avg('longitude'))
+        if centro['lat'] is None:
+            raise CommandError('Não há imóveis ativos (use gerar_dados_sinteticos ou cadastre imóveis)')
+        sessao = self._criar_sessao(options['usuario'])
+        cookie = f'{settings.SESSION_COOKIE_NAME}={sessao.session_key}'
+
+        try:
+            for nome, aplicacao, worker, prefixo in MODOS:
+                caminhos = self._caminhos(prefixo, centro['lat'], centro['lng'])
+                servidor = self._iniciar(aplicacao, worker, options['processos'], options['porta'])
+                try:
+                    self._aguardar(options['porta'], prefixo + 'estatisticas/', cookie)
+                    # Aquecimento: importações, conexões e caches de cada worker
+                    self._disparar(options['porta'], cookie, caminhos * 10, options['concorrencia'])
+                    resultado = self._disparar(
+                        options['porta'], cookie,
+                        (caminhos * (options['requisicoes'] // len(caminhos) + 1))[:options['requisicoes']],
+                        options['concorrencia'],
+                    )
+                finally:
+                    servidor.terminate()
+                    servidor.wait(timeout=30)
+                self._mostrar(nome, resultado, options)
+        finally:
+            sessao.delete()
+
+    def _criar_sessao(self, username):
+        usuarios = User.objects.filter(is_active=True).order_by('pk')
+        usuario = usuarios.filter(username=username).first() if username else usuarios.first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado')
+        sessao = import_module(settings.SESSION_ENGINE).SessionStore()
+        sessao[SESSION_KEY] = str(usuario.pk)
+        sessao[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sessao.create()
+        return sessao
+
+    def _caminhos(self, prefixo, lat, lng):
+        delta = 0.02
+        return [
+            prefixo,
+            f'{prefixo}?bbox={lng - delta},{lat - delta},{lng + delta},{lat + delta}',
+            f'{prefixo}proximos/?lat={lat}&lng={lng}&distancia=1000',
+            f'{prefixo}estatisticas/',
+        ]
+
+    def _iniciar(self, aplicacao, worker, processos, porta):
+        comando = [
+            sys.executable, '-m', 'gunicorn', aplicacao,
+            '--workers', str(processos),
+            '--worker-class', worker,
+            '--bind', f'127.0.0.1:{porta}',
+            '--log-level', 'warning',
+            '--timeout', '120',
+        ]
+        ambiente = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        return subprocess.Popen(comando, cwd=settings.BASE_DIR, env=ambiente)
+
+    def _aguardar(self, porta, caminho, cookie, limite=30):
+        fim = time.monotonic() + limite
+        while time.monotonic() < fim:
+            try:
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+                conexao.request('GET', caminho, headers={'Cookie': cookie})
+                if conexao.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'O servidor não respondeu em {limite} s')
+
+    def _disparar(self, porta, cookie, caminhos, concorrencia):
+        fila = queue.SimpleQueue()
+        for caminho in caminhos:
+            fila.put(caminho)
+        latencias = []
+        erros = []
+        lock = threading.Lock()
+
+        def cliente():
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+            proprias, falhas = [], 0
+            while True:
+                try:
+                    caminho = fila.get_nowait()
+                except queue.Empty:
+                    break
+                inicio = time.perf_counter()
+                try:
+                    conexao.request('GET', caminho, headers={'Cookie': cookie})
+                    resposta = conexao.getresponse()
+                    resposta.read()
+                    if resposta.status != 200:
+                        falhas += 1
+                except (OSError, http.client.HTTPException):
+                    falhas += 1
+                    conexao.close()
+                    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+                proprias.append(time.perf_counter() - inicio)
+            conexao.close()
+            with lock:
+                latencias.extend(proprias)
+                erros.append(falhas)
+
+        threads = [threading.Thread(target=cliente) for _ in range(concorrencia)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        return {'latencias': np.array(latencias) * 1000, 'duracao': duracao, 'erros': sum(erros)}
+
+    def _mostrar(self, nome, resultado, options):
+        latencias = resultado['latencias']
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+        self.stdout.write(
+            f"{nome:<16} {options['processos']} processos, {options['concorrencia']} clientes: "
+            f"{len(latencias) / resultado['duracao']:8.1f} req/s  "
+            f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  "
+            f"erros {resultado['erros']}"
+        )
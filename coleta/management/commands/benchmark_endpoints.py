@@ -0,0 +1,297 @@
+"""
+Benchmark reproduzível dos endpoints da API de imóveis
+
+Para cada tamanho de base (--tamanhos) o comando usa um banco SQLite
+próprio em --diretorio, criado uma única vez com gerar_dados_sinteticos
+(mesma semente, mesmos dados), e mede pelo cliente de testes do Django:
+
+- list, retrieve, proximos, meus_imoveis, estatisticas e create;
+- latências p50/p95/p99 e média (ms) de --repeticoes requisições, após
+  --aquecimento requisições descartadas;
+- número de consultas SQL de uma requisição;
+- pico de memória alocada (tracemalloc) em uma requisição, medido em uma
+  passada separada para não afetar as latências.
+
+O resultado vai para um arquivo JSON com o commit, as versões e os
+parâmetros; com --comparar, as latências p50 são comparadas com as de um
+resultado anterior e as variações acima de --tolerancia são destacadas.
+Os imóveis criados pelo benchmark são removidos ao final.
+
+Uso:
+    python manage.py benchmark_endpoints --tamanhos 10000,100000,1000000
+    python manage.py benchmark_endpoints --comparar benchmark_1a2b3c4d.json
+    python manage.py benchmark_endpoints --banco-atual
+"""
+
+import json
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from coleta import fragmentos
+from coleta.management.commands.gerar_dados_sinteticos import BAIRROS_BELEM
+from coleta.models import Imovel
+from coleta.signals import INDICES
+
+
+ENDPOINTS = ('list', 'retrieve', 'proximos', 'meus_imoveis', 'estatisticas', 'create')
+
+
+class Command(BaseCommand):
+    help = 'Mede latência, consultas e memória dos endpoints da API em bases sintéticas de vários tamanhos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default='10000,100000',
+                            help='Quantidades de imóveis separadas por vírgula (padrão: 10000,100000)')
+        parser.add_argument('--repeticoes', type=int, default=50, help='Requisições medidas por endpoint')
+        parser.add_argument('--aquecimento', type=int, default=5, help='Requisições descartadas por endpoint')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--diretorio', default=None,
+                            help='Onde ficam os bancos sintéticos (padrão: BASE_DIR/benchmark)')
+        parser.add_argument('--banco-atual', action='store_true',
+                            help='Mede o banco configurado, sem gerar bases sintéticas')
+        parser.add_argument('--saida', default=None,
+                            help='Arquivo JSON do resultado (padrão: benchmark_<commit>.json)')
+        parser.add_argument('--comparar', default=None, help='Resultado anterior para comparação')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Variação de p50 considerada regressão (padrão: 0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1 or options['aquecimento'] < 0:
+            raise CommandError('repeticoes deve ser positivo e aquecimento não negativo')
+
+        commit = self._commit()
+        resultado = {
+            'commit': commit,
+            'data': timezone.now().isoformat(),
+            'ambiente': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'plataforma': platform.platform(),
+                'processador': platform.processor() or platform.machine(),
+            },
+            'parametros': {
+                'repeticoes': options['repeticoes'],
+                'aquecimento': options['aquecimento'],
+                'semente': options['semente'],
+            },
+            'resultados': {},
+        }
+
+        # DEBUG desligado: com DEBUG o Django guarda todas as consultas, o
+        # que pesa nas latências e enche o registro usado na contagem
+        setup_test_environment(debug=False)
+        try:
+            if options['banco_atual']:
+                chave = f'atual-{Imovel.objects.count()}'
+                resultado['resultados'][chave] = self._medir(options)
+            else:
+                for tamanho in self._tamanhos(options['tamanhos']):
+                    with self._banco_sintetico(tamanho, options):
+                        resultado['resultados'][str(tamanho)] = self._medir(options)
+        finally:
+            teardown_test_environment()
+
+        resultado['pico_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        saida = Path(options['saida'] or f'benchmark_{(commit or "local")[:8]}.json')
+        saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {saida}'))
+
+        if options['comparar']:
+            self._comparar(resultado, options['comparar'], options['tolerancia'])
+
+    def _tamanhos(self, texto):
+        try:
+            tamanhos = [int(valor) for valor in texto.split(',') if valor.strip()]
+        except ValueError:
+            raise CommandError('--tamanhos deve ser uma lista de inteiros separados por vírgula')
+        if not tamanhos or min(tamanhos) < 1:
+            raise CommandError('--tamanhos deve ter ao menos um valor positivo')
+        return tamanhos
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _banco_sintetico(self, tamanho, options):
+        """
+        Context manager que troca o banco default pelo banco sintético do
+        tamanho informado (gerado na primeira vez)
+        """
+        comando = self
+
+        class Troca:
+            def __enter__(self):
+                conexao = connections['default']
+                if conexao.vendor != 'sqlite':
+                    raise CommandError('As bases sintéticas usam SQLite; use --banco-atual com outros bancos')
+                diretorio = Path(options['diretorio'] or Path(settings.BASE_DIR) / 'benchmark')
+                diretorio.mkdir(parents=True, exist_ok=True)
+                caminho = diretorio / f'coleta_{tamanho}_{options["semente"]}.sqlite3'
+                novo = not caminho.exists()
+
+                self.original = conexao.settings_dict['NAME']
+                comando._trocar_banco(caminho)
+                call_command('migrate', verbosity=0)
+                if novo:
+                    comando.stdout.write(f'Gerando base sintética com {tamanho} imóveis em {caminho}')
+                    call_command('gerar_dados_sinteticos', quantidade=tamanho,
+                                 semente=options['semente'], verbosity=0)
+
+            def __exit__(self, *exc):
+                comando._trocar_banco(self.original)
+
+        return Troca()
+
+    def _trocar_banco(self, nome):
+        conexao = connections['default']
+        conexao.close()
+        conexao.settings_dict['NAME'] = str(nome)
+        # Índices em memória e fragmentos pertencem ao banco anterior
+        for indice in INDICES:
+            indice.invalidar()
+        fragmentos.cache_fragmentos().clear()
+
+    def _medir(self, options):
+        agente = (
+            Imovel.objects.filter(ativo=True, agente_coleta__isnull=False)
+            .values_list('agente_coleta', flat=True).first()
+        )
+        if agente is None:
+            raise CommandError('Não há imóveis ativos com agente (use gerar_dados_sinteticos)')
+        cliente = Client()
+        cliente.force_login(User.objects.get(pk=agente))
+
+        aleatorio = random.Random(options['semente'])
+        ids = list(Imovel.objects.filter(ativo=True).order_by('id').values_list('id', flat=True)[:5000])
+        marca = Imovel.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        requisicoes = {
+            'list': lambda: cliente.get('/api/imoveis/'),
+            'retrieve': lambda: cliente.get(f'/api/imoveis/{aleatorio.choice(ids)}/'),
+            'proximos': lambda: cliente.get('/api/imoveis/proximos/', self._ponto(aleatorio)),
+            'meus_imoveis': lambda: cliente.get('/api/imoveis/meus_imoveis/'),
+            'estatisticas': lambda: cliente.get('/api/imoveis/estatisticas/'),
+            'create': lambda: cliente.post(
+                '/api/imoveis/', self._novo_imovel(aleatorio), content_type='application/json'
+            ),
+        }
+
+        medidas = {}
+        try:
+            for nome in ENDPOINTS:
+                medidas[nome] = self._medir_endpoint(nome, requisicoes[nome], options)
+                self.stdout.write(
+                    f"{nome:<13} p50 {medidas[nome]['p50_ms']:8.2f} ms  p95 {medidas[nome]['p95_ms']:8.2f} ms  "
+                    f"p99 {medidas[nome]['p99_ms']:8.2f} ms  consultas {medidas[nome]['consultas']:3d}  "
+                    f"pico {medidas[nome]['pico_memoria_kb']:8.1f} KiB"
+                )
+        finally:
+            # Remove os imóveis criados (pelos signals, mantendo os derivados coerentes)
+            for imovel in Imovel.objects.filter(id__gt=marca, numero_imovel__startswith='BENCH-'):
+                imovel.delete()
+        return medidas
+
+    def _medir_endpoint(self, nome, requisicao, options):
+        for _ in range(options['aquecimento']):
+            self._conferir(nome, requisicao())
+
+        latencias = []
+        for _ in range(options['repeticoes']):
+            inicio = time.perf_counter()
+            resposta = requisicao()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            self._conferir(nome, resposta)
+
+        reset_queries()
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = requisicao()
+        self._conferir(nome, resposta)
+        # Lidas já: a próxima requisição limpa o registro de consultas
+        consultas = len(capturadas.captured_queries)
+
+        tracemalloc.start()
+        try:
+            self._conferir(nome, requisicao())
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+        return {
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'media_ms': round(float(np.mean(latencias)), 3),
+            'consultas': consultas,
+            'pico_memoria_kb': round(pico / 1024, 1),
+            'bytes_resposta': len(resposta.content),
+        }
+
+    def _conferir(self, nome, resposta):
+        if resposta.status_code not in (200, 201):
+            raise CommandError(f'{nome}: status {resposta.status_code}: {resposta.content[:200]!r}')
+
+    def _ponto(self, aleatorio):
+        _, lat, lng, _ = aleatorio.choice(BAIRROS_BELEM)
+        return {'lat': lat, 'lng': lng, 'distancia': 500}
+
+    def _novo_imovel(self, aleatorio):
+        _, lat, lng, _ = aleatorio.choice(BAIRROS_BELEM)
+        return {
+            'numero_imovel': f'BENCH-{aleatorio.randrange(10 ** 6)}',
+            'endereco': 'Imóvel criado pelo benchmark',
+            'bairro': 'Benchmark',
+            'cidade': 'Belém',
+            'latitude': round(lat + aleatorio.uniform(-0.004, 0.004), 7),
+            'longitude': round(lng + aleatorio.uniform(-0.004, 0.004), 7),
+            'ativo': True,
+        }
+
+    def _comparar(self, resultado, arquivo, tolerancia):
+        try:
+            anterior = json.loads(Path(arquivo).read_text())
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {arquivo}: {erro}')
+
+        self.stdout.write(f"Comparação com {arquivo} (commit {(anterior.get('commit') or '?')[:8]}):")
+        regressoes = 0
+        for tamanho, medidas in resultado['resultados'].items():
+            for nome, atual in medidas.items():
+                antes = anterior.get('resultados', {}).get(tamanho, {}).get(nome)
+                if not antes:
+                    continue
+                variacao = atual['p50_ms'] / antes['p50_ms'] - 1 if antes['p50_ms'] else 0
+                linha = (
+                    f"  {tamanho:>8} {nome:<13} p50 {antes['p50_ms']:8.2f} -> {atual['p50_ms']:8.2f} ms "
+                    f"({variacao:+.0%})  consultas {antes['consultas']} -> {atual['consultas']}"
+                )
+                if variacao > tolerancia or atual['consultas'] > antes['consultas']:
+                    regressoes += 1
+                    self.stdout.write(self.style.ERROR(linha))
+                else:
+                    self.stdout.write(linha)
+        if regressoes:
+            self.stdout.write(self.style.WARNING(f'{regressoes} possíveis regressões'))
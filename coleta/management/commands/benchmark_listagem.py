@@ -0,0 +1,69 @@
+"""
+Compara a listagem de imóveis pelo caminho padrão do DRF (instâncias +
+serializer + JSONRenderer) com SerializacaoRapida + ORJSONRenderer
+
+Uso: python manage.py benchmark_listagem --tamanho 100 --repeticoes 50
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from coleta.models import Imovel
+from coleta.renderers import ORJSONRenderer
+from coleta.serializacao import serializacao_rapida
+from coleta.serializers import ImovelListSerializer, ImovelSerializer
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão da serialização padrão e da serialização rápida das listagens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanho', type=int, default=100,
+                            help='Imóveis por resposta (padrão: 100, o tamanho da página)')
+        parser.add_argument('--repeticoes', type=int, default=50)
+
+    def handle(self, *args, **options):
+        tamanho, repeticoes = options['tamanho'], options['repeticoes']
+        if tamanho < 1 or repeticoes < 1:
+            raise CommandError('tamanho e repeticoes devem ser positivos')
+
+        request = Request(RequestFactory().get('/api/imoveis/'))
+        queryset = (
+            Imovel.objects.filter(ativo=True)
+            .select_related('agente_coleta')
+            .order_by('-data_coleta', '-id')
+        )
+        ids = list(queryset.values_list('id', flat=True)[:tamanho])
+        if not ids:
+            raise CommandError('Não há imóveis ativos (use gerar_dados_sinteticos ou cadastre imóveis)')
+
+        for serializer_class in (ImovelListSerializer, ImovelSerializer):
+            serializacao = serializacao_rapida(serializer_class)
+
+            def padrao():
+                imoveis = list(queryset[:tamanho])
+                dados = serializer_class(imoveis, many=True, context={'request': request}).data
+                return JSONRenderer().render(dados)
+
+            def rapido():
+                linhas = list(serializacao.valores(queryset)[:tamanho])
+                return ORJSONRenderer().render(serializacao.representar(linhas, request))
+
+            if padrao() != rapido():
+                raise CommandError(f'{serializer_class.__name__}: as saídas não são idênticas')
+
+            tempos = {}
+            for nome, funcao in (('padrão', padrao), ('rápida', rapido)):
+                inicio = time.perf_counter()
+                for _ in range(repeticoes):
+                    funcao()
+                tempos[nome] = (time.perf_counter() - inicio) / repeticoes
+
+            self.stdout.write(f'{serializer_class.__name__} ({len(ids)} imóveis por resposta, saídas idênticas)')
+            for nome, tempo in tempos.items():
+                self.stdout.write(f'  {nome:7} {tempo * 1000:8.2f} ms/resposta  {1 / tempo:8.1f} respostas/s')
+            self.stdout.write(self.style.SUCCESS(f'  ganho: {tempos["padrão"] / tempos["rápida"]:.1f}x'))
@@ -0,0 +1,29 @@
+"""
+Mostra os contadores de acertos e faltas do cache de fragmentos, somados
+entre os workers no arquivo de métricas (COLETA_METRICAS_ARQUIVO)
+
+Uso: python manage.py cache_fragmentos [--zerar]
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.fragmentos import contadores, zerar_contadores
+
+
+class Command(BaseCommand):
+    help = 'Mostra (ou zera) os acertos e faltas do cache de fragmentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zerar', action='store_true',
+                            help='Zera os contadores depois de mostrá-los')
+
+    def handle(self, *args, **options):
+        valores = contadores()
+        taxa = valores['taxa_acerto']
+        self.stdout.write(
+            f"acertos: {valores['acertos']}  faltas: {valores['faltas']}  "
+            f"taxa de acerto: {'-' if taxa is None else f'{taxa:.1%}'}"
+        )
+        if options['zerar']:
+            zerar_contadores()
+            self.stdout.write(self.style.SUCCESS('Contadores zerados'))
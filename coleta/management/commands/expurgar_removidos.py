@@ -0,0 +1,20 @@
+"""
+Apaga os registros de imóveis excluídos (tombstones) mais antigos que
+COLETA_REMOVIDOS_RETENCAO_DIAS; tokens de sincronização anteriores a isso
+passam a exigir sincronização completa
+
+Uso: python manage.py expurgar_removidos
+(agendar periodicamente, por exemplo no cron)
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.sincronizacao import expurgar_removidos
+
+
+class Command(BaseCommand):
+    help = 'Apaga os registros de imóveis excluídos anteriores à retenção da sincronização'
+
+    def handle(self, *args, **options):
+        apagados = expurgar_removidos()
+        self.stdout.write(self.style.SUCCESS(f'{apagados} registros de remoção apagados'))
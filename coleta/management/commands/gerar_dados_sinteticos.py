@@ -0,0 +1,193 @@
+"""
+Gera imóveis sintéticos para testes de carga e benchmarks
+
+Os imóveis ficam agrupados em torno dos centros de bairros de Belém
+(distribuição normal, com mais imóveis nos bairros mais populosos), são
+atribuídos a vários agentes de coleta e têm datas de coleta espalhadas
+pelos últimos 365 dias; uma parte tem foto (um pequeno conjunto de fotos
+geradas, com miniaturas) e uma parte é inativa.
+
+Com a mesma --semente, os mesmos dados são gerados. A gravação usa
+bulk_create, sem signals; ao final os contadores de estatísticas e as
+séries diárias são recalculados e o cache de tiles é descartado.
+
+Uso: python manage.py gerar_dados_sinteticos --quantidade 100000
+"""
+
+import shutil
+from datetime import timedelta
+from io import BytesIO
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from coleta.estatisticas import recalcular
+from coleta.miniaturas import gerar_miniaturas
+from coleta.models import ColetaDiaria, Imovel
+from coleta.series import recalcular_series
+from coleta.tiles import diretorio_tiles
+
+
+# (bairro, latitude, longitude, peso relativo)
+BAIRROS_BELEM = (
+    ('Marco', -1.4340, -48.4620, 9),
+    ('Pedreira', -1.4280, -48.4750, 8),
+    ('Guamá', -1.4690, -48.4630, 10),
+    ('Jurunas', -1.4700, -48.4950, 7),
+    ('Marambaia', -1.4100, -48.4500, 7),
+    ('Sacramenta', -1.4200, -48.4720, 6),
+    ('Terra Firme', -1.4590, -48.4470, 6),
+    ('Cremação', -1.4650, -48.4810, 4),
+    ('Telégrafo', -1.4330, -48.4840, 4),
+    ('Souza', -1.4380, -48.4470, 3),
+    ('Canudos', -1.4480, -48.4640, 2),
+    ('São Brás', -1.4530, -48.4720, 2),
+    ('Umarizal', -1.4450, -48.4880, 3),
+    ('Nazaré', -1.4530, -48.4870, 2),
+    ('Batista Campos', -1.4578, -48.4942, 2),
+    ('Cidade Velha', -1.4590, -48.5030, 1),
+    ('Campina', -1.4520, -48.4990, 1),
+    ('Reduto', -1.4470, -48.4960, 1),
+    ('Val-de-Cans', -1.3940, -48.4760, 2),
+    ('Coqueiro', -1.3900, -48.4400, 4),
+)
+
+LOGRADOUROS = (
+    'Travessa', 'Rua', 'Avenida', 'Passagem', 'Alameda', 'Vila',
+)
+
+NOMES_LOGRADOUROS = (
+    'Padre Eutíquio', 'Almirante Barroso', 'Duque de Caxias', 'Mundurucus', 'Pariquis',
+    'Tamoios', 'Conselheiro Furtado', 'José Bonifácio', 'Roberto Camelier', 'Pedro Miranda',
+    'Marquês de Herval', 'Senador Lemos', 'Mauriti', 'Angustura', 'Lomas Valentinas',
+    'Humaitá', 'Perebebuí', 'Timbiras', 'Bernal do Couto', 'Curuzu',
+)
+
+OBSERVACOES = (
+    'Hidrômetro com lacre rompido',
+    'Imóvel fechado, coleta pela fachada',
+    'Ligação clandestina aparente',
+    'Morador ausente',
+    'Hidrômetro embaçado',
+)
+
+# Dispersão em torno do centro do bairro (graus, ~450 m)
+DISPERSAO_GRAUS = 0.004
+FOTOS_SINTETICAS = 12
+LOTE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Gera imóveis sintéticos agrupados nos bairros de Belém (para testes de carga)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=10000)
+        parser.add_argument('--agentes', type=int, default=20, help='Agentes de coleta (padrão: 20)')
+        parser.add_argument('--inativos', type=float, default=0.05,
+                            help='Proporção de imóveis inativos (padrão: 0.05)')
+        parser.add_argument('--com-foto', type=float, default=0.3,
+                            help='Proporção de imóveis com foto (padrão: 0.3)')
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **options):
+        quantidade, semente = options['quantidade'], options['semente']
+        if quantidade < 1 or options['agentes'] < 1:
+            raise CommandError('quantidade e agentes devem ser positivos')
+        prefixo = f'sintetico-{semente}-'
+        if Imovel.objects.filter(chave_idempotencia__startswith=prefixo).exists():
+            raise CommandError(
+                f'Já existem imóveis sintéticos da semente {semente}; '
+                'use outra --semente ou um banco novo'
+            )
+
+        rng = np.random.default_rng(semente)
+        agentes = self._agentes(options['agentes'])
+        fotos = self._fotos()
+        agora = timezone.now()
+
+        bairros = [bairro for bairro, *_ in BAIRROS_BELEM]
+        centros = np.array([(lat, lng) for _, lat, lng, _ in BAIRROS_BELEM])
+        pesos = np.array([peso for *_, peso in BAIRROS_BELEM], dtype=np.float64)
+        pesos /= pesos.sum()
+
+        for inicio in range(0, quantidade, LOTE):
+            tamanho = min(LOTE, quantidade - inicio)
+            indices_bairro = rng.choice(len(bairros), size=tamanho, p=pesos)
+            coordenadas = centros[indices_bairro] + rng.normal(0, DISPERSAO_GRAUS, size=(tamanho, 2))
+            indices_agente = rng.integers(0, len(agentes), size=tamanho)
+            ativos = rng.random(tamanho) >= options['inativos']
+            com_foto = rng.random(tamanho) < options['com_foto']
+            segundos = rng.integers(0, 365 * 24 * 3600, size=tamanho)
+            logradouros = rng.integers(0, len(LOGRADOUROS), size=tamanho)
+            nomes = rng.integers(0, len(NOMES_LOGRADOUROS), size=tamanho)
+            numeros = rng.integers(1, 3000, size=tamanho)
+            observacoes = rng.integers(0, len(OBSERVACOES) * 4, size=tamanho)
+
+            imoveis = []
+            for i in range(tamanho):
+                n = inicio + i
+                imovel = Imovel(
+                    numero_imovel=f'S{n:07d}',
+                    numero_hidrometro=f'H{semente:02d}{n:08d}' if n % 10 else None,
+                    endereco=f'{LOGRADOUROS[logradouros[i]]} {NOMES_LOGRADOUROS[nomes[i]]}, {numeros[i]}',
+                    bairro=bairros[indices_bairro[i]],
+                    cidade='Belém',
+                    latitude=round(float(coordenadas[i, 0]), 7),
+                    longitude=round(float(coordenadas[i, 1]), 7),
+                    observacoes=OBSERVACOES[observacoes[i]] if observacoes[i] < len(OBSERVACOES) else None,
+                    foto=fotos[n % len(fotos)] if com_foto[i] else None,
+                    miniaturas_geradas=bool(com_foto[i]),
+                    agente_coleta=agentes[indices_agente[i]],
+                    data_coleta=agora - timedelta(seconds=int(segundos[i])),
+                    ativo=bool(ativos[i]),
+                    chave_idempotencia=f'{prefixo}{n}',
+                )
+                imovel.atualizar_celula_grade()
+                imoveis.append(imovel)
+            with transaction.atomic():
+                Imovel.objects.bulk_create(imoveis)
+            self.stdout.write(f'{inicio + tamanho}/{quantidade} imóveis gravados')
+
+        # bulk_create não dispara os signals: os dados derivados são refeitos
+        recalcular()
+        recalcular_series(Imovel, ColetaDiaria)
+        shutil.rmtree(diretorio_tiles(), ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{quantidade} imóveis sintéticos gerados ({len(agentes)} agentes, semente {semente})'
+        ))
+
+    def _agentes(self, quantidade):
+        agentes = []
+        for numero in range(1, quantidade + 1):
+            agente, criado = User.objects.get_or_create(username=f'agente_sintetico_{numero:03d}')
+            if criado:
+                agente.set_unusable_password()
+                agente.save(update_fields=['password'])
+            agentes.append(agente)
+        return agentes
+
+    def _fotos(self):
+        """
+        Pequeno conjunto de fotos (com miniaturas) compartilhado pelos imóveis
+        """
+        nomes = []
+        for numero in range(FOTOS_SINTETICAS):
+            nome = f'imoveis/sinteticos/fachada_{numero:02d}.jpg'
+            if not default_storage.exists(nome):
+                imagem = Image.new('RGB', (1024, 768), (40 + numero * 15, 120, 200 - numero * 10))
+                desenho = ImageDraw.Draw(imagem)
+                desenho.rectangle((312, 300, 712, 768), fill=(230, 220, 200))
+                desenho.polygon(((262, 300), (512, 120), (762, 300)), fill=(150, 60, 40))
+                conteudo = BytesIO()
+                imagem.save(conteudo, 'JPEG', quality=80)
+                nome = default_storage.save(nome, ContentFile(conteudo.getvalue()))
+            gerar_miniaturas(nome)
+            nomes.append(nome)
+        return nomes
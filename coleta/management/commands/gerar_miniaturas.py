@@ -0,0 +1,34 @@
+"""
+Gera as miniaturas das fotos já existentes (por exemplo, enviadas antes
+da geração automática ou que falharam em segundo plano)
+
+Uso: python manage.py gerar_miniaturas [--forcar]
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.miniaturas import gerar_miniaturas
+from coleta.models import Imovel
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas das fotos dos imóveis que ainda não as têm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcar', action='store_true',
+                            help='Regera miniaturas que já existem')
+
+    def handle(self, *args, **options):
+        fotos = (
+            Imovel.objects.exclude(foto='').exclude(foto__isnull=True)
+            .order_by('id')
+            .values_list('foto', flat=True)
+        )
+        geradas = falhas = 0
+        for nome in fotos.iterator():
+            try:
+                geradas += gerar_miniaturas(nome, forcar=options['forcar'])
+            except Exception as erro:
+                falhas += 1
+                self.stderr.write(f'{nome}: {erro}')
+        self.stdout.write(self.style.SUCCESS(f'{geradas} miniaturas geradas ({falhas} falhas)'))
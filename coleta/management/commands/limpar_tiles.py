@@ -0,0 +1,20 @@
+"""
+Apaga do cache em disco os tiles vetoriais expirados (mais antigos que
+COLETA_TILES_VALIDADE) com suas gerações, e as gerações e temporários
+deixados por gerações de tiles interrompidas
+
+Uso: python manage.py limpar_tiles
+(agendar periodicamente, por exemplo no cron)
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.tiles import limpar_tiles
+
+
+class Command(BaseCommand):
+    help = 'Apaga tiles expirados e arquivos órfãos do cache de tiles'
+
+    def handle(self, *args, **options):
+        tiles, arquivos = limpar_tiles()
+        self.stdout.write(self.style.SUCCESS(f'{tiles} tiles expirados e {arquivos} arquivos órfãos apagados'))
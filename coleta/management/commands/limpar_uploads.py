@@ -0,0 +1,19 @@
+"""
+Apaga os envios de fotos em partes abandonados (sem atividade há mais
+de COLETA_UPLOADS_EXPIRACAO_HORAS) e seus arquivos
+
+Uso: python manage.py limpar_uploads
+(agendar periodicamente, por exemplo no cron)
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.uploads import limpar_expirados
+
+
+class Command(BaseCommand):
+    help = 'Apaga envios de fotos em partes expirados e arquivos de partes órfãos'
+
+    def handle(self, *args, **options):
+        envios, arquivos = limpar_expirados()
+        self.stdout.write(self.style.SUCCESS(f'{envios} envios expirados e {arquivos} arquivos órfãos apagados'))
@@ -0,0 +1,20 @@
+"""
+Recalcula do zero os contadores de estatísticas e a série temporal de coleta
+
+Uso: python manage.py recalcular_estatisticas
+"""
+
+from django.core.management.base import BaseCommand
+
+from coleta.estatisticas import recalcular
+from coleta.series import recalcular_series
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de estatísticas e a série temporal a partir da tabela de imóveis'
+
+    def handle(self, *args, **options):
+        linhas = recalcular()
+        self.stdout.write(self.style.SUCCESS(f'{linhas} contadores recalculados'))
+        linhas = recalcular_series()
+        self.stdout.write(self.style.SUCCESS(f'{linhas} linhas da série temporal recalculadas'))
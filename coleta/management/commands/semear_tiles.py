@@ -0,0 +1,50 @@
+"""
+Pré-gera os tiles vetoriais da área da cidade nos zooms mais baixos
+
+Uso: python manage.py semear_tiles --zoom-min 0 --zoom-max 14
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coleta.tiles import ZOOM_MAXIMO_TILES, gerar_e_salvar_tile, tile_do_ponto, tile_em_cache
+
+
+# Extensão aproximada de Belém (minLng, minLat, maxLng, maxLat)
+BBOX_PADRAO = '-48.62,-1.56,-48.30,-1.20'
+
+
+class Command(BaseCommand):
+    help = 'Pré-gera o cache de tiles vetoriais para a área informada'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bbox', default=BBOX_PADRAO,
+                            help=f'minLng,minLat,maxLng,maxLat (padrão: {BBOX_PADRAO})')
+        parser.add_argument('--zoom-min', type=int, default=0)
+        parser.add_argument('--zoom-max', type=int, default=14)
+        parser.add_argument('--forcar', action='store_true',
+                            help='Regera tiles que já estão no cache')
+
+    def handle(self, *args, **options):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(valor) for valor in options['bbox'].split(','))
+        except ValueError:
+            raise CommandError('bbox deve ter o formato minLng,minLat,maxLng,maxLat')
+
+        zoom_min, zoom_max = options['zoom_min'], options['zoom_max']
+        if not 0 <= zoom_min <= zoom_max <= ZOOM_MAXIMO_TILES:
+            raise CommandError(f'Zooms devem estar entre 0 e {ZOOM_MAXIMO_TILES}')
+
+        for z in range(zoom_min, zoom_max + 1):
+            x_min, y_min = tile_do_ponto(max_lat, min_lng, z)
+            x_max, y_max = tile_do_ponto(min_lat, max_lng, z)
+            gerados = 0
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    if not options['forcar'] and tile_em_cache(z, x, y) is not None:
+                        continue
+                    gerar_e_salvar_tile(z, x, y)
+                    gerados += 1
+            total = (x_max - x_min + 1) * (y_max - y_min + 1)
+            self.stdout.write(f'Zoom {z}: {gerados} de {total} tiles gerados')
+
+        self.stdout.write(self.style.SUCCESS('Cache de tiles atualizado'))
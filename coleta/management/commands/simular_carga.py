@@ -0,0 +1,408 @@
+"""
+Carga mista contra um servidor em execução: agentes de campo e usuários
+do mapa ao mesmo tempo
+
+As sessões chegam em intervalos aleatórios (processo de Poisson, --taxa
+sessões novas por segundo) durante --duracao segundos; --proporcao-agentes
+define a mistura. Cada sessão faz login por /api-auth/login/ com um dos
+--usuarios usuários de carga e repete --ciclos vezes, com uma pausa
+aleatória (média --pausa s) entre os ciclos:
+
+- agente: proximos no ponto da coleta, POST /api/imoveis/ com foto
+  (multipart) e meus_imoveis;
+- mapa: listagem, bbox de uma área do mapa e estatisticas.
+
+A cada --intervalo segundos são mostradas a vazão, as latências e a taxa
+de erros da janela; ao final, um resumo por tipo de requisição (e, com
+--saida, um JSON com a série e o resumo). Se --max-sessoes sessões já
+estão ativas, as novas chegadas são recusadas e contadas.
+
+Os usuários de carga (carga_usuario_NNN, com a senha --senha) são criados
+ou atualizados no banco configurado, que deve ser o mesmo do servidor;
+os imóveis criados e suas fotos são apagados ao final, exceto com
+--manter.
+
+Uso:
+    gunicorn config.wsgi:application -c gunicorn_config.py
+    python manage.py simular_carga --url http://127.0.0.1:8000 --taxa 5 --duracao 120
+"""
+
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from coleta.management.commands.gerar_dados_sinteticos import BAIRROS_BELEM
+from coleta.miniaturas import TAMANHOS, nome_miniatura
+from coleta.models import Imovel
+
+
+PREFIXO_USUARIOS = 'carga_usuario_'
+PREFIXO_IMOVEIS = 'CARGA-'
+
+_CSRF_FORMULARIO = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class Registro:
+    """
+    Amostras (fim, tipo, latência em ms, erro) de todas as sessões
+    """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.amostras = []
+        self.lock = threading.Lock()
+        self.ativas = 0
+        self.iniciadas = 0
+        self.recusadas = 0
+
+    def anotar(self, tipo, inicio, fim, erro):
+        with self.lock:
+            self.amostras.append((fim - self.inicio, tipo, (fim - inicio) * 1000, erro))
+
+    def janela(self, desde, ate):
+        with self.lock:
+            return [amostra for amostra in self.amostras if desde <= amostra[0] < ate]
+
+
+class Sessao:
+    """
+    Cliente HTTP de uma sessão: conexão reaproveitada e cookies próprios
+    """
+
+    def __init__(self, url, registro, timeout):
+        partes = urlsplit(url)
+        classe = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.conexao = classe(partes.hostname, partes.port, timeout=timeout)
+        self.registro = registro
+        self.cookies = {}
+
+    def requisitar(self, tipo, metodo, caminho, corpo=None, cabecalhos=None, esperados=(200,)):
+        cabecalhos = dict(cabecalhos or {})
+        if self.cookies:
+            cabecalhos['Cookie'] = '; '.join(f'{nome}={valor}' for nome, valor in self.cookies.items())
+
+        inicio = time.perf_counter()
+        try:
+            self.conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            self.registro.anotar(tipo, inicio, time.perf_counter(), True)
+            return None, b''
+        self.registro.anotar(tipo, inicio, time.perf_counter(), resposta.status not in esperados)
+
+        for cabecalho in resposta.headers.get_all('Set-Cookie') or ():
+            for nome, morsel in SimpleCookie(cabecalho).items():
+                self.cookies[nome] = morsel.value
+        return resposta.status, conteudo
+
+    def entrar(self, usuario, senha):
+        status, pagina = self.requisitar('login', 'GET', '/api-auth/login/')
+        encontrado = _CSRF_FORMULARIO.search(pagina.decode('utf-8', 'replace')) if status == 200 else None
+        if encontrado is None:
+            return False
+        corpo = urlencode({
+            'username': usuario,
+            'password': senha,
+            'csrfmiddlewaretoken': encontrado.group(1),
+            'next': '/api/imoveis/estatisticas/',
+        })
+        status, _ = self.requisitar(
+            'login', 'POST', '/api-auth/login/', corpo,
+            {'Content-Type': 'application/x-www-form-urlencoded'}, esperados=(302,),
+        )
+        return status == 302 and 'sessionid' in self.cookies
+
+    def enviar(self, tipo, caminho, corpo, tipo_conteudo, esperados=(201,)):
+        # O token CSRF troca no login; vale o do último cookie recebido
+        cabecalhos = {'Content-Type': tipo_conteudo, 'X-CSRFToken': self.cookies.get('csrftoken', '')}
+        return self.requisitar(tipo, 'POST', caminho, corpo, cabecalhos, esperados)
+
+    def fechar(self):
+        self.conexao.close()
+
+
+def _multipart(campos, arquivo, nome_arquivo, conteudo):
+    fronteira = uuid.uuid4().hex
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+        )
+    partes.append(
+        f'--{fronteira}\r\nContent-Disposition: form-data; name="{arquivo}"; filename="{nome_arquivo}"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode() + conteudo + b'\r\n'
+    )
+    partes.append(f'--{fronteira}--\r\n'.encode())
+    return b''.join(partes), f'multipart/form-data; boundary={fronteira}'
+
+
+class Command(BaseCommand):
+    help = 'Simula agentes de campo e usuários do mapa ao mesmo tempo contra um servidor em execução'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor (padrão: http://127.0.0.1:8000)')
+        parser.add_argument('--duracao', type=float, default=60, help='Segundos com chegada de sessões novas')
+        parser.add_argument('--taxa', type=float, default=2, help='Sessões novas por segundo')
+        parser.add_argument('--proporcao-agentes', type=float, default=0.5,
+                            help='Fração das sessões que são de agentes de campo (padrão: 0.5)')
+        parser.add_argument('--ciclos', type=int, default=5, help='Ciclos de requisições por sessão')
+        parser.add_argument('--pausa', type=float, default=2, help='Pausa média entre ciclos, em segundos')
+        parser.add_argument('--usuarios', type=int, default=200, help='Usuários de carga (padrão: 200)')
+        parser.add_argument('--senha', default='carga-local', help='Senha dos usuários de carga')
+        parser.add_argument('--max-sessoes', type=int, default=500, help='Sessões ativas ao mesmo tempo')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre os relatórios parciais')
+        parser.add_argument('--timeout', type=float, default=60, help='Timeout de cada requisição, em segundos')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--saida', default=None, help='Arquivo JSON com a série e o resumo')
+        parser.add_argument('--manter', action='store_true', help='Não apaga os imóveis criados')
+
+    def handle(self, *args, **options):
+        if min(options['duracao'], options['taxa'], options['ciclos'], options['usuarios'],
+               options['max_sessoes'], options['intervalo']) <= 0:
+            raise CommandError('duracao, taxa, ciclos, usuarios, max-sessoes e intervalo devem ser positivos')
+        if not 0 <= options['proporcao_agentes'] <= 1:
+            raise CommandError('--proporcao-agentes deve estar entre 0 e 1')
+
+        usuarios = self._preparar_usuarios(options['usuarios'], options['senha'])
+        self.foto = self._foto()
+        self.marca = f'{PREFIXO_IMOVEIS}{uuid.uuid4().hex[:8]}-'
+        self._verificar(options)
+
+        registro = Registro()
+        self.serie = []
+        parar = threading.Event()
+        relatorio = threading.Thread(target=self._relatar, args=(registro, parar, options), daemon=True)
+        relatorio.start()
+
+        aleatorio = random.Random(options['semente'])
+        sessoes = []
+        try:
+            fim = registro.inicio + options['duracao']
+            while True:
+                espera = aleatorio.expovariate(options['taxa'])
+                if time.monotonic() + espera >= fim:
+                    break
+                time.sleep(espera)
+
+                agente = aleatorio.random() < options['proporcao_agentes']
+                with registro.lock:
+                    if registro.ativas >= options['max_sessoes']:
+                        registro.recusadas += 1
+                        continue
+                    registro.ativas += 1
+                    registro.iniciadas += 1
+                sessao = threading.Thread(
+                    target=self._sessao,
+                    args=(agente, aleatorio.choice(usuarios), random.Random(aleatorio.random()),
+                          registro, parar, options),
+                    daemon=True,
+                )
+                sessao.start()
+                sessoes.append(sessao)
+
+            # Sem chegadas novas: as sessões em andamento terminam seus ciclos
+            for sessao in sessoes:
+                sessao.join()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrompido; encerrando as sessões ativas'))
+            parar.set()
+            for sessao in sessoes:
+                sessao.join(options['timeout'])
+        finally:
+            parar.set()
+            relatorio.join()
+
+        resumo = self._resumir(registro)
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                json.dump({
+                    'parametros': {
+                        chave: options[chave] for chave in (
+                            'url', 'duracao', 'taxa', 'proporcao_agentes', 'ciclos', 'pausa',
+                            'usuarios', 'max_sessoes', 'intervalo', 'semente',
+                        )
+                    },
+                    'serie': self.serie,
+                    'resumo': resumo,
+                }, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}"))
+
+        if not options['manter']:
+            removidos = self._limpar()
+            self.stdout.write(f'{removidos} imóveis criados pela carga removidos')
+
+    def _preparar_usuarios(self, quantidade, senha):
+        """
+        Cria (ou atualiza a senha dos) usuários de carga; um único hash para
+        todos, já que gerar cada um custa caro
+        """
+        nomes = [f'{PREFIXO_USUARIOS}{numero:03d}' for numero in range(1, quantidade + 1)]
+        hash_senha = make_password(senha)
+        existentes = set(User.objects.filter(username__in=nomes).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=nome, password=hash_senha) for nome in nomes if nome not in existentes
+        ])
+        User.objects.filter(username__in=existentes).update(password=hash_senha, is_active=True)
+        return nomes
+
+    def _foto(self):
+        """
+        Foto de 1024x768 com ruído, perto do tamanho de uma foto de celular
+        reduzida (a normalização no servidor tem trabalho de verdade)
+        """
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(60, 200, size=(768, 1024, 3), dtype=np.uint8)
+        conteudo = BytesIO()
+        Image.fromarray(pixels).save(conteudo, 'JPEG', quality=80)
+        return conteudo.getvalue()
+
+    def _verificar(self, options):
+        """
+        Um login antes de começar: servidor no ar, usuários no mesmo banco
+        """
+        sessao = Sessao(options['url'], Registro(), options['timeout'])
+        try:
+            if not sessao.entrar(f'{PREFIXO_USUARIOS}001', options['senha']):
+                raise CommandError(
+                    f"Não foi possível fazer login em {options['url']}: o servidor está no ar "
+                    'e usa o mesmo banco deste comando?'
+                )
+        finally:
+            sessao.fechar()
+
+    def _sessao(self, agente, usuario, aleatorio, registro, parar, options):
+        sessao = Sessao(options['url'], registro, options['timeout'])
+        try:
+            if not sessao.entrar(usuario, options['senha']):
+                return
+            ciclo = self._ciclo_agente if agente else self._ciclo_mapa
+            for numero in range(options['ciclos']):
+                if parar.is_set():
+                    break
+                ciclo(sessao, aleatorio)
+                if numero + 1 == options['ciclos']:
+                    break
+                pausa = aleatorio.expovariate(1 / options['pausa']) if options['pausa'] > 0 else 0
+                if parar.wait(pausa):
+                    break
+        finally:
+            sessao.fechar()
+            with registro.lock:
+                registro.ativas -= 1
+
+    def _ponto(self, aleatorio, dispersao=0.004):
+        bairro, lat, lng, _ = aleatorio.choice(BAIRROS_BELEM)
+        return bairro, lat + aleatorio.gauss(0, dispersao), lng + aleatorio.gauss(0, dispersao)
+
+    def _ciclo_agente(self, sessao, aleatorio):
+        bairro, lat, lng = self._ponto(aleatorio)
+        parametros = urlencode({'lat': f'{lat:.7f}', 'lng': f'{lng:.7f}', 'distancia': 200})
+        sessao.requisitar('proximos', 'GET', f'/api/imoveis/proximos/?{parametros}')
+        corpo, tipo_conteudo = _multipart({
+            'numero_imovel': f'{self.marca}{aleatorio.randrange(10 ** 9)}',
+            'endereco': f'Imóvel da simulação de carga, {aleatorio.randrange(1, 3000)}',
+            'bairro': bairro,
+            'cidade': 'Belém',
+            'latitude': f'{lat:.7f}',
+            'longitude': f'{lng:.7f}',
+            # Em formulários o DRF lê booleano ausente como falso
+            'ativo': 'true',
+        }, 'foto', 'fachada.jpg', self.foto)
+        sessao.enviar('create', '/api/imoveis/', corpo, tipo_conteudo)
+        sessao.requisitar('meus_imoveis', 'GET', '/api/imoveis/meus_imoveis/')
+
+    def _ciclo_mapa(self, sessao, aleatorio):
+        _, lat, lng = self._ponto(aleatorio)
+        delta = aleatorio.choice((0.005, 0.01, 0.02))
+        bbox = f'{lng - delta:.6f},{lat - delta:.6f},{lng + delta:.6f},{lat + delta:.6f}'
+        sessao.requisitar('list', 'GET', '/api/imoveis/')
+        sessao.requisitar('bbox', 'GET', f'/api/imoveis/?bbox={bbox}')
+        sessao.requisitar('estatisticas', 'GET', '/api/imoveis/estatisticas/')
+
+    def _relatar(self, registro, parar, options):
+        desde = 0
+        while True:
+            encerrado = parar.wait(max(0, registro.inicio + desde + options['intervalo'] - time.monotonic()))
+            ate = time.monotonic() - registro.inicio
+            amostras = registro.janela(desde, ate)
+            if amostras or not encerrado:
+                ponto = self._estatisticas(amostras, ate - desde)
+                ponto.update({'t': round(ate, 1), 'sessoes_ativas': registro.ativas})
+                self.serie.append(ponto)
+                self.stdout.write(
+                    f"{ponto['t']:7.1f}s  sessões {ponto['sessoes_ativas']:4d}  {ponto['vazao']:8.1f} req/s  "
+                    f"p50 {ponto['p50_ms']:7.1f} ms  p95 {ponto['p95_ms']:7.1f} ms  "
+                    f"p99 {ponto['p99_ms']:7.1f} ms  erros {ponto['erros']:.1%}"
+                )
+            if encerrado:
+                return
+            desde = ate
+
+    def _estatisticas(self, amostras, duracao):
+        if not amostras:
+            return {'requisicoes': 0, 'vazao': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'erros': 0.0}
+        latencias = np.array([amostra[2] for amostra in amostras])
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+        return {
+            'requisicoes': len(amostras),
+            'vazao': round(len(amostras) / duracao, 2),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'erros': round(sum(amostra[3] for amostra in amostras) / len(amostras), 4),
+        }
+
+    def _resumir(self, registro):
+        duracao = time.monotonic() - registro.inicio
+        amostras = registro.amostras
+        tipos = sorted({amostra[1] for amostra in amostras})
+        resumo = {
+            'duracao_s': round(duracao, 1),
+            'sessoes_iniciadas': registro.iniciadas,
+            'sessoes_recusadas': registro.recusadas,
+            'total': self._estatisticas(amostras, duracao),
+            'por_tipo': {
+                tipo: self._estatisticas([amostra for amostra in amostras if amostra[1] == tipo], duracao)
+                for tipo in tipos
+            },
+        }
+
+        self.stdout.write(
+            f"\n{resumo['duracao_s']} s, {registro.iniciadas} sessões iniciadas, {registro.recusadas} recusadas"
+        )
+        for tipo, medidas in (*resumo['por_tipo'].items(), ('total', resumo['total'])):
+            linha = (
+                f"{tipo:<13} {medidas['requisicoes']:7d} req  {medidas['vazao']:8.1f} req/s  "
+                f"p50 {medidas['p50_ms']:7.1f} ms  p95 {medidas['p95_ms']:7.1f} ms  "
+                f"p99 {medidas['p99_ms']:7.1f} ms  erros {medidas['erros']:.1%}"
+            )
+            self.stdout.write(self.style.ERROR(linha) if medidas['erros'] else linha)
+        return resumo
+
+    def _limpar(self):
+        removidos = 0
+        for imovel in Imovel.objects.filter(numero_imovel__startswith=self.marca):
+            foto = imovel.foto.name if imovel.foto else None
+            # delete() pelo modelo: os signals mantêm os dados derivados coerentes
+            imovel.delete()
+            if foto:
+                for nome in (foto, *(nome_miniatura(foto, tamanho) for tamanho in TAMANHOS)):
+                    default_storage.delete(nome)
+            removidos += 1
+        return removidos
@@ -0,0 +1,204 @@
+"""
+Mede se as leituras esperam pelas escritas em lote no SQLite
+
+O banco configurado é copiado (API de backup do SQLite) para um diretório
+temporário, e a mesma carga roda em dois perfis:
+
+- padrao: journal de rollback (DELETE) e PRAGMAs padrão, como o Django
+  abre o SQLite sem o perfil de produção;
+- producao: os PRAGMAs de coleta/bancos.py (WAL, synchronous=NORMAL...),
+  com os leitores em conexões somente leitura.
+
+Uma thread escreve lotes de imóveis (uma transação por lote, como em
+POST /api/imoveis/lote/) enquanto outras repetem as leituras do mapa
+(página da listagem e pontos de um bbox). Para cada perfil são
+mostrados os percentis da latência das leituras, as leituras que
+falharam (database is locked) e os lotes gravados.
+
+Termina com erro se, no perfil de produção, alguma leitura falhar ou o p99
+passar de --limite-ms, para uso em integração contínua.
+
+Uso:
+    python manage.py verificar_concorrencia
+    python manage.py verificar_concorrencia --duracao 10 --leitores 8 --lote 1000
+"""
+
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Avg
+
+from coleta.bancos import aplicar_pragmas
+from coleta.models import Imovel
+
+
+PERFIS = ('padrao', 'producao')
+
+
+class Command(BaseCommand):
+    help = 'Compara a latência das leituras durante escritas em lote, sem e com o perfil de produção do SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duracao', type=float, default=5, help='Segundos de carga em cada perfil (padrão: 5)')
+        parser.add_argument('--leitores', type=int, default=4, help='Threads de leitura (padrão: 4)')
+        parser.add_argument('--lote', type=int, default=500, help='Imóveis por transação de escrita (padrão: 500)')
+        parser.add_argument('--pausa', type=float, default=0.05,
+                            help='Segundos entre as transações de escrita (padrão: 0,05)')
+        parser.add_argument('--limite-ms', type=float, default=100,
+                            help='p99 máximo das leituras no perfil de produção (padrão: 100)')
+
+    def handle(self, *args, **options):
+        conexao = connections[DEFAULT_DB_ALIAS]
+        if conexao.vendor != 'sqlite':
+            raise CommandError('A verificação compara perfis do SQLite')
+        if not Imovel.objects.using(DEFAULT_DB_ALIAS).exists():
+            raise CommandError('Não há imóveis no banco (use gerar_dados_sinteticos)')
+        leituras = self._leituras()
+        escrita = self._escrita()
+
+        resultados = {}
+        with tempfile.TemporaryDirectory(prefix='coleta_concorrencia_') as diretorio:
+            for perfil in PERFIS:
+                caminho = Path(diretorio) / f'{perfil}.sqlite3'
+                self._copiar(conexao, caminho, perfil)
+                resultados[perfil] = self._executar(caminho, perfil, leituras, escrita, options)
+
+        self.stdout.write(
+            f"{'perfil':<10} {'leituras':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8} "
+            f"{'falhas':>7} {'lotes':>6}"
+        )
+        for perfil, resultado in resultados.items():
+            self.stdout.write(
+                f"{perfil:<10} {len(resultado['latencias']):>9} {self._percentil(resultado, 50):8.1f} "
+                f"{self._percentil(resultado, 95):8.1f} {self._percentil(resultado, 99):8.1f} "
+                f"{self._percentil(resultado, 100):8.1f} {resultado['falhas']:>7} {resultado['lotes']:>6}"
+            )
+
+        producao = resultados['producao']
+        if producao['falhas'] or not producao['latencias']:
+            raise CommandError(f"{producao['falhas']} leituras falharam no perfil de produção")
+        p99 = self._percentil(producao, 99)
+        if p99 > options['limite_ms']:
+            raise CommandError(f"p99 das leituras no perfil de produção: {p99:.1f} ms (limite {options['limite_ms']:g} ms)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Leituras sem espera pelas escritas: p99 {p99:.1f} ms no perfil de produção"
+        ))
+
+    def _leituras(self):
+        """
+        SQL (com parâmetros) das leituras do mapa, gerado pelo ORM
+        """
+        centro = Imovel.objects.using(DEFAULT_DB_ALIAS).filter(ativo=True).aggregate(
+            lat=Avg('latitude'), lng=Avg('longitude'))
+        lat, lng, delta = centro['lat'] or 0, centro['lng'] or 0, 0.002
+        consultas = [
+            Imovel.objects.filter(ativo=True).select_related('agente_coleta').order_by('-data_coleta', '-id')[:50],
+            Imovel.objects.filter(
+                ativo=True, latitude__range=(lat - delta, lat + delta), longitude__range=(lng - delta, lng + delta),
+            ).order_by().values('id', 'latitude', 'longitude'),
+        ]
+        return [self._sql(consulta.query) for consulta in consultas]
+
+    def _escrita(self):
+        """
+        INSERT ... SELECT que copia um lote de imóveis com outros números
+        """
+        colunas = [campo.column for campo in Imovel._meta.concrete_fields if not campo.primary_key]
+        valores = {
+            'numero_imovel': "'CONC-' || id",
+            'chave_idempotencia': 'NULL',
+        }
+        tabela = Imovel._meta.db_table
+        return (
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) "
+            f"SELECT {', '.join(valores.get(coluna, coluna) for coluna in colunas)} "
+            f"FROM {tabela} ORDER BY id LIMIT ? OFFSET ?"
+        )
+
+    def _sql(self, query):
+        sql, parametros = query.sql_with_params()
+        # O ORM usa o estilo %s; o sqlite3, ?
+        return sql.replace('%s', '?'), parametros
+
+    def _copiar(self, conexao, caminho, perfil):
+        conexao.ensure_connection()
+        destino = sqlite3.connect(caminho)
+        try:
+            conexao.connection.backup(destino)
+            destino.execute('PRAGMA journal_mode = ' + ('WAL' if perfil == 'producao' else 'DELETE')).fetchall()
+        finally:
+            destino.close()
+
+    def _conectar(self, caminho, perfil, leitura):
+        if perfil == 'padrao':
+            # Como o Django abre o SQLite: timeout padrão do sqlite3 (5 s)
+            return sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        uri = caminho.resolve().as_uri() + ('?mode=ro' if leitura else '')
+        conexao = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        aplicar_pragmas(conexao, leitura=leitura)
+        return conexao
+
+    def _executar(self, caminho, perfil, leituras, escrita, options):
+        parar = threading.Event()
+        resultado = {'latencias': [], 'falhas': 0, 'lotes': 0}
+        lock = threading.Lock()
+
+        def escritor():
+            conexao = self._conectar(caminho, perfil, leitura=False)
+            deslocamento = 0
+            try:
+                while not parar.is_set():
+                    try:
+                        conexao.execute('BEGIN')
+                        cursor = conexao.execute(escrita, (options['lote'], deslocamento))
+                        conexao.execute('COMMIT')
+                    except sqlite3.OperationalError:
+                        if conexao.in_transaction:
+                            conexao.execute('ROLLBACK')
+                        continue
+                    deslocamento = deslocamento + options['lote'] if cursor.rowcount == options['lote'] else 0
+                    resultado['lotes'] += 1
+                    parar.wait(options['pausa'])
+            finally:
+                conexao.close()
+
+        def leitor():
+            conexao = self._conectar(caminho, perfil, leitura=True)
+            latencias, falhas = [], 0
+            try:
+                while not parar.is_set():
+                    for sql, parametros in leituras:
+                        inicio = time.perf_counter()
+                        try:
+                            conexao.execute(sql, parametros).fetchall()
+                        except sqlite3.OperationalError:
+                            falhas += 1
+                            continue
+                        latencias.append((time.perf_counter() - inicio) * 1000)
+            finally:
+                conexao.close()
+            with lock:
+                resultado['latencias'] += latencias
+                resultado['falhas'] += falhas
+
+        threads = [threading.Thread(target=escritor)]
+        threads += [threading.Thread(target=leitor) for _ in range(options['leitores'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duracao'])
+        parar.set()
+        for thread in threads:
+            thread.join()
+        return resultado
+
+    def _percentil(self, resultado, percentil):
+        latencias = resultado['latencias']
+        if len(latencias) < 2 or percentil == 100:
+            return max(latencias, default=0.0)
+        return statistics.quantiles(latencias, n=100, method='inclusive')[percentil - 1]
@@ -0,0 +1,170 @@
+"""
+Confere o orçamento de consultas SQL de todas as actions do ImovelViewSet
+
+Cada action é chamada pelo cliente de testes do Django, com um usuário
+que tem imóveis no banco configurado, e as consultas da requisição
+(inclusive as de respostas em streaming) passam pelas mesmas verificações
+do OrcamentoConsultasMiddleware (coleta/orcamento.py): orçamento declarado
+em ImovelViewSet.ORCAMENTO_CONSULTAS, consultas repetidas (N+1) e
+varreduras completas de coleta_imovel.
+
+As actions de leitura são chamadas uma vez antes da medição (construção
+dos índices em memória do processo). O imóvel e o lote criados para as
+actions de escrita são removidos ao final. Termina com erro se alguma
+action tiver problemas, para uso em integração contínua.
+
+Uso:
+    python manage.py verificar_consultas
+    python manage.py verificar_consultas --detalhar
+"""
+
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count
+from django.test import Client
+from django.test.utils import override_settings
+
+from coleta.models import Imovel
+from coleta.orcamento import analisar, registrar
+from coleta.views import ImovelViewSet
+
+
+class Command(BaseCommand):
+    help = 'Confere o número de consultas, N+1 e varreduras de cada action do ImovelViewSet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuário das requisições (padrão: o agente com mais imóveis)')
+        parser.add_argument('--detalhar', action='store_true', help='Mostra as consultas de cada action')
+
+    def handle(self, *args, **options):
+        usuario = self._usuario(options['usuario'])
+        centro = Imovel.objects.filter(ativo=True).aggregate(lat=Avg('latitude'), lng=Avg('longitude'))
+
+        # Os middlewares de orçamento e de métricas ficam fora: as
+        # verificações são feitas aqui, e as requisições não entram nas métricas
+        with override_settings(COLETA_ORCAMENTO_CONSULTAS=None, COLETA_METRICAS_ATIVO=False):
+            cliente = Client()
+            cliente.force_login(usuario)
+            resultados = self._verificar(cliente, centro['lat'], centro['lng'], options['detalhar'])
+
+        cobertas = {acao for acao, *_ in resultados}
+        sem_orcamento = sorted(set(ImovelViewSet.ORCAMENTO_CONSULTAS) - cobertas)
+        if sem_orcamento:
+            self.stdout.write(self.style.WARNING(f"Actions não verificadas: {', '.join(sem_orcamento)}"))
+
+        com_problemas = [resultado for resultado in resultados if resultado[3]]
+        if com_problemas:
+            raise CommandError(f'{len(com_problemas)} requisições com problemas de consultas')
+        self.stdout.write(self.style.SUCCESS(f'{len(resultados)} requisições dentro do orçamento'))
+
+    def _usuario(self, username):
+        if username:
+            usuario = User.objects.filter(username=username).first()
+        else:
+            agente = (
+                Imovel.objects.filter(ativo=True, agente_coleta__isnull=False)
+                .values('agente_coleta').annotate(quantidade=Count('id')).order_by('-quantidade')
+                .values_list('agente_coleta', flat=True).first()
+            )
+            usuario = User.objects.filter(pk=agente).first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado (são necessários imóveis ativos com agente)')
+        return usuario
+
+    def _verificar(self, cliente, lat, lng, detalhar):
+        if lat is None:
+            raise CommandError('Não há imóveis ativos (use gerar_dados_sinteticos)')
+        delta = 0.01
+        bbox = f'{lng - delta},{lat - delta},{lng + delta},{lat + delta}'
+        marca = f'VERIF-{uuid.uuid4().hex[:8]}'
+        imovel = {
+            'numero_imovel': f'{marca}-0',
+            'endereco': 'Imóvel da verificação de consultas',
+            'bairro': 'Verificação',
+            'cidade': 'Belém',
+            'latitude': round(lat, 7),
+            'longitude': round(lng, 7),
+            'ativo': True,
+        }
+        leituras = [
+            ('list', '/api/imoveis/'),
+            ('list', f'/api/imoveis/?bbox={bbox}'),
+            ('meus_imoveis', '/api/imoveis/meus_imoveis/'),
+            ('proximos', f'/api/imoveis/proximos/?lat={lat}&lng={lng}&distancia=500'),
+            ('vizinhos', f'/api/imoveis/vizinhos/?lat={lat}&lng={lng}&k=20'),
+            ('clusters', f'/api/imoveis/clusters/?bbox={bbox}&zoom=13'),
+            ('clusters', f'/api/imoveis/clusters/?bbox={bbox}&zoom=18'),
+            ('alteracoes', '/api/imoveis/alteracoes/'),
+            ('estatisticas', '/api/imoveis/estatisticas/'),
+            ('serie_temporal', '/api/imoveis/serie_temporal/'),
+            ('exportar_geojson', '/api/imoveis/export.geojson'),
+        ]
+        for _, caminho in leituras:
+            self._conferir_status(cliente.get(caminho), 200)
+
+        resultados = []
+        try:
+            for acao, caminho in leituras:
+                resultados.append(self._medir(acao, 'GET', caminho, cliente.get, 200, detalhar))
+
+            criado = self._medir('create', 'POST', '/api/imoveis/',
+                                 lambda caminho: cliente.post(caminho, imovel, content_type='application/json'),
+                                 201, detalhar)
+            resultados.append(criado)
+            pk = criado[4].json()['id']
+            detalhe = f'/api/imoveis/{pk}/'
+            lote = [
+                {**imovel, 'numero_imovel': f'{marca}-{numero}', 'chave_idempotencia': f'{marca}-{numero}'}
+                for numero in range(1, 21)
+            ]
+            escritas = [
+                ('retrieve', 'GET', detalhe, cliente.get, 200),
+                ('update', 'PUT', detalhe, lambda caminho: cliente.put(
+                    caminho, {**imovel, 'observacoes': 'Atualizado'}, content_type='application/json'), 200),
+                ('partial_update', 'PATCH', detalhe, lambda caminho: cliente.patch(
+                    caminho, {'observacoes': 'Atualizado de novo'}, content_type='application/json'), 200),
+                ('lote', 'POST', '/api/imoveis/lote/', lambda caminho: cliente.post(
+                    caminho, json.dumps(lote), content_type='application/json'), 200),
+                ('desativar', 'POST', f'{detalhe}desativar/', cliente.post, 200),
+            ]
+            for acao, metodo, caminho, requisicao, esperado in escritas:
+                resultados.append(self._medir(acao, metodo, caminho, requisicao, esperado, detalhar))
+
+            # destroy: o imóvel desativado não aparece mais no queryset da view
+            outro = cliente.post('/api/imoveis/', {**imovel, 'numero_imovel': f'{marca}-x'},
+                                 content_type='application/json')
+            self._conferir_status(outro, 201)
+            resultados.append(self._medir('destroy', 'DELETE', f"/api/imoveis/{outro.json()['id']}/",
+                                          cliente.delete, 204, detalhar))
+        finally:
+            for restante in Imovel.objects.filter(numero_imovel__startswith=marca):
+                restante.delete()
+        return resultados
+
+    def _medir(self, acao, metodo, caminho, requisicao, esperado, detalhar):
+        with registrar() as consultas:
+            resposta = requisicao(caminho)
+            if resposta.streaming:
+                # Respostas em streaming consultam o banco enquanto são enviadas
+                b''.join(resposta.streaming_content)
+        self._conferir_status(resposta, esperado)
+
+        orcamento, problemas = analisar(ImovelViewSet, acao, consultas)
+        linha = f"{acao:<17} {metodo:<6} {caminho[:60]:<60} {len(consultas):3d} / {orcamento if orcamento is not None else '-'}"
+        self.stdout.write(self.style.ERROR(linha) if problemas else linha)
+        for problema in problemas:
+            self.stdout.write(self.style.ERROR(f'    {problema}'))
+        if detalhar:
+            for alias, sql, _, _ in consultas:
+                self.stdout.write(f'    [{alias}] {sql[:200]}')
+        return acao, metodo, caminho, problemas, resposta
+
+    def _conferir_status(self, resposta, esperado):
+        if resposta.status_code != esperado:
+            raise CommandError(
+                f'{resposta.wsgi_request.method} {resposta.wsgi_request.get_full_path()}: '
+                f'status {resposta.status_code} (esperado {esperado})'
+            )
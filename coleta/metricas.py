@@ -0,0 +1,346 @@
+"""
+Métricas de desempenho por rota da API, no formato do Prometheus
+
+O MetricasMiddleware mede cada requisição resolvida para uma rota e
+acumula histogramas por rota (nome da URL), action do ViewSet e método:
+
+- coleta_requisicao_segundos: tempo total da requisição;
+- coleta_banco_segundos: tempo gasto nas consultas SQL;
+- coleta_consultas_sql: número de consultas SQL;
+- coleta_linhas_serializadas: itens da resposta (resultados da página,
+  pontos do bbox, features...);
+- coleta_resposta_bytes: tamanho do corpo da resposta;
+
+e o contador coleta_requisicoes_total, também por status. Outros módulos
+somam contadores próprios com incrementar() (coleta_fragmentos_total, os
+acertos e faltas do cache de fragmentos).
+
+As consultas são medidas por um execute_wrapper instalado em cada conexão
+nova (connection_created), que soma na medição da requisição atual
+(ContextVar, também vista pelas threads do sync_to_async). Cada worker
+acumula as observações em memória e uma thread do worker, a cada
+COLETA_METRICAS_INTERVALO segundos, soma os incrementos em um arquivo
+SQLite compartilhado (COLETA_METRICAS_ARQUIVO); GET /api/metricas/ lê os totais de todos os
+workers. Com COLETA_METRICAS_ATIVO desligado o middleware sai da pilha,
+nenhuma requisição é medida e /api/metricas/ responde 404; os contadores
+somados por outros módulos continuam sendo gravados (fragmentos.contadores()
+os lê do arquivo).
+"""
+
+import atexit
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BALDES_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+BALDES_LINHAS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+BALDES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# nome: (descrição, baldes); histogramas com os rótulos rota, acao e metodo
+HISTOGRAMAS = {
+    'coleta_requisicao_segundos': ('Tempo total da requisição', BALDES_SEGUNDOS),
+    'coleta_banco_segundos': ('Tempo gasto nas consultas SQL', BALDES_SEGUNDOS),
+    'coleta_consultas_sql': ('Consultas SQL por requisição', BALDES_CONSULTAS),
+    'coleta_linhas_serializadas': ('Itens serializados na resposta', BALDES_LINHAS),
+    'coleta_resposta_bytes': ('Tamanho do corpo da resposta', BALDES_BYTES),
+}
+CONTADOR_REQUISICOES = 'coleta_requisicoes_total'
+CONTADOR_FRAGMENTOS = 'coleta_fragmentos_total'
+
+# nome: descrição dos contadores
+CONTADORES = {
+    CONTADOR_REQUISICOES: 'Requisições por rota, action, método e status',
+    CONTADOR_FRAGMENTOS: 'Leituras do cache de fragmentos por resultado (acerto ou falta)',
+}
+
+# Chaves das respostas da API com a lista de itens
+CHAVES_ITENS = ('results', 'pontos', 'features', 'clusters', 'alterados')
+
+
+def ativo():
+    return getattr(settings, 'COLETA_METRICAS_ATIVO', False)
+
+
+class Medicao:
+    """
+    Consultas SQL de uma requisição
+    """
+    __slots__ = ('consultas', 'banco')
+
+    def __init__(self):
+        self.consultas = 0
+        self.banco = 0.0
+
+
+_medicao = ContextVar('coleta_metricas_medicao', default=None)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicao = _medicao.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.banco += time.perf_counter() - inicio
+        medicao.consultas += 1
+
+
+def _instalar(sender, connection, **kwargs):
+    if ativo() and _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+connection_created.connect(_instalar, dispatch_uid='coleta_metricas')
+
+
+class Acumulador:
+    """
+    Observações do processo ainda não gravadas no arquivo compartilhado
+
+    As requisições só somam em memória (sob lock, sem I/O). Uma thread do
+    processo grava os incrementos a cada COLETA_METRICAS_INTERVALO
+    segundos: troca o dicionário de pendentes sob o lock e escreve no
+    arquivo fora dele, então a gravação (e o busy timeout do SQLite) nunca
+    atrasa uma resposta.
+    """
+
+    def __init__(self):
+        # Protege pendentes; nunca é mantido durante I/O
+        self.lock = threading.Lock()
+        # Serializa o uso do arquivo (gravação, leitura e limpeza)
+        self.lock_arquivo = threading.Lock()
+        # (nome, rótulos, balde) -> incremento; balde é o limite "le",
+        # 'sum' ou 'count' nos histogramas e '' nos contadores
+        self.pendentes = {}
+        self.conexao = None
+        self.thread = None
+        self.pid = None
+
+    def observar(self, nome, rotulos, valor):
+        baldes = HISTOGRAMAS[nome][1]
+        indice = bisect_left(baldes, valor)
+        balde = _formatar(baldes[indice]) if indice < len(baldes) else '+Inf'
+        pendentes = self.pendentes
+        for chave, incremento in (((nome, rotulos, balde), 1), ((nome, rotulos, 'sum'), valor),
+                                  ((nome, rotulos, 'count'), 1)):
+            pendentes[chave] = pendentes.get(chave, 0) + incremento
+
+    def contar(self, nome, rotulos, quantidade=1):
+        chave = (nome, rotulos, '')
+        self.pendentes[chave] = self.pendentes.get(chave, 0) + quantidade
+
+    def incrementar(self, nome, rotulos, quantidade=1):
+        self._iniciar()
+        with self.lock:
+            self.contar(nome, rotulos, quantidade)
+
+    def registrar(self, rotulos, status, observacoes):
+        self._iniciar()
+        with self.lock:
+            for nome, valor in observacoes:
+                self.observar(nome, rotulos, valor)
+            self.contar(CONTADOR_REQUISICOES, f'{rotulos},status="{status}"')
+
+    def _iniciar(self):
+        # Uma thread por processo: após o fork (gunicorn --preload) a do pai não existe
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.conexao = None
+            self.thread = threading.Thread(target=self._gravar_periodicamente, name='metricas', daemon=True)
+            self.thread.start()
+
+    def _gravar_periodicamente(self):
+        while True:
+            time.sleep(getattr(settings, 'COLETA_METRICAS_INTERVALO', 5))
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava no arquivo os incrementos pendentes
+        """
+        with self.lock_arquivo:
+            with self.lock:
+                if not self.pendentes:
+                    return
+                pendentes, self.pendentes = self.pendentes, {}
+            try:
+                conexao = self._conectar()
+                with conexao:
+                    conexao.executemany(
+                        'INSERT INTO metricas (nome, rotulos, balde, valor) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (nome, rotulos, balde) DO UPDATE SET valor = valor + excluded.valor',
+                        [(*chave, valor) for chave, valor in pendentes.items()],
+                    )
+            except sqlite3.Error:
+                # Arquivo ocupado ou indisponível: os incrementos voltam para a próxima gravação
+                with self.lock:
+                    for chave, valor in pendentes.items():
+                        self.pendentes[chave] = self.pendentes.get(chave, 0) + valor
+
+    def _conectar(self):
+        if self.conexao is None:
+            caminho = getattr(
+                settings, 'COLETA_METRICAS_ARQUIVO', os.path.join(tempfile.gettempdir(), 'coleta_metricas.sqlite3')
+            )
+            conexao = sqlite3.connect(str(caminho), timeout=5, check_same_thread=False)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS metricas (nome TEXT NOT NULL, rotulos TEXT NOT NULL, '
+                'balde TEXT NOT NULL, valor REAL NOT NULL, PRIMARY KEY (nome, rotulos, balde))'
+            )
+            self.conexao = conexao
+        return self.conexao
+
+    def ler(self):
+        """
+        Totais de todos os workers (grava antes os pendentes deste)
+        """
+        self.gravar()
+        with self.lock_arquivo:
+            return self._conectar().execute('SELECT nome, rotulos, balde, valor FROM metricas').fetchall()
+
+    def zerar(self, nome):
+        """
+        Apaga de todos os workers os valores de uma métrica
+        """
+        with self.lock_arquivo:
+            with self.lock:
+                self.pendentes = {chave: valor for chave, valor in self.pendentes.items() if chave[0] != nome}
+            with self._conectar() as conexao:
+                conexao.execute('DELETE FROM metricas WHERE nome = ?', (nome,))
+
+
+acumulador = Acumulador()
+atexit.register(acumulador.gravar)
+
+
+def _formatar(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _rotulos(request):
+    correspondencia = request.resolver_match
+    # Rotas de ViewSet: a action que atende o método (list/create, retrieve/destroy...)
+    acoes = getattr(correspondencia.func, 'actions', None) or {}
+    acao = acoes.get(request.method.lower(), '')
+    return f'rota="{correspondencia.view_name}",acao="{acao}",metodo="{request.method}"'
+
+
+def _linhas(resposta):
+    """
+    Itens serializados em uma resposta do DRF, ou None se não se aplica
+    """
+    dados = getattr(resposta, 'data', None)
+    if isinstance(dados, list):
+        return len(dados)
+    if isinstance(dados, dict):
+        if 'error' in dados:
+            return 0
+        for chave in CHAVES_ITENS:
+            if isinstance(dados.get(chave), list):
+                return len(dados[chave])
+        return 1
+    return None
+
+
+class MetricasMiddleware:
+    """
+    Mede as requisições das rotas da aplicação (ver o docstring do módulo)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not ativo():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            resposta = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        self._registrar(request, resposta, inicio, medicao)
+        return resposta
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        self._registrar(request, resposta, inicio, medicao)
+        return resposta
+
+    def _registrar(self, request, resposta, inicio, medicao):
+        if request.resolver_match is None or request.resolver_match.url_name == 'metricas':
+            return
+        observacoes = [
+            ('coleta_requisicao_segundos', time.perf_counter() - inicio),
+            ('coleta_banco_segundos', medicao.banco),
+            ('coleta_consultas_sql', medicao.consultas),
+        ]
+        linhas = _linhas(resposta)
+        if linhas is not None:
+            observacoes.append(('coleta_linhas_serializadas', linhas))
+        if not resposta.streaming:
+            # Respostas em streaming: o corpo ainda não foi gerado
+            observacoes.append(('coleta_resposta_bytes', len(resposta.content)))
+        acumulador.registrar(_rotulos(request), resposta.status_code, observacoes)
+
+
+def exposicao():
+    """
+    Texto no formato de exposição do Prometheus com os totais de todos os workers
+    """
+    valores = {}
+    for nome, rotulos, balde, valor in acumulador.ler():
+        valores.setdefault(nome, {}).setdefault(rotulos, {})[balde] = valor
+
+    linhas = []
+    for nome, (descricao, baldes) in HISTOGRAMAS.items():
+        linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} histogram']
+        for rotulos, series in sorted(valores.get(nome, {}).items()):
+            acumulado = 0
+            for limite in (*(_formatar(balde) for balde in baldes), '+Inf'):
+                acumulado += series.get(limite, 0)
+                linhas.append(f'{nome}_bucket{{{rotulos},le="{limite}"}} {_numero(acumulado)}')
+            linhas.append(f'{nome}_sum{{{rotulos}}} {_numero(series.get("sum", 0))}')
+            linhas.append(f'{nome}_count{{{rotulos}}} {_numero(series.get("count", 0))}')
+
+    for nome, descricao in CONTADORES.items():
+        linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} counter']
+        for rotulos, series in sorted(valores.get(nome, {}).items()):
+            linhas.append(f'{nome}{{{rotulos}}} {_numero(series[""])}')
+    return '\n'.join(linhas) + '\n'
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
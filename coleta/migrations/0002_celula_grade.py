@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:54
+
+from django.db import migrations, models
+
+from coleta.espacial import celula_da_grade
+
+
+def preencher_celula_grade(apps, schema_editor):
+    Imovel = apps.get_model('coleta', 'Imovel')
+    lote = []
+    for imovel in Imovel.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        imovel.celula_grade = celula_da_grade(imovel.latitude, imovel.longitude)
+        lote.append(imovel)
+        if len(lote) >= 2000:
+            Imovel.objects.bulk_update(lote, ['celula_grade'])
+            lote = []
+    if lote:
+        Imovel.objects.bulk_update(lote, ['celula_grade'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovel',
+            name='celula_grade',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Célula da Grade'),
+        ),
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['celula_grade'], name='coleta_imov_celula__74205a_idx'),
+        ),
+        migrations.RunPython(preencher_celula_grade, migrations.RunPython.noop),
+    ]
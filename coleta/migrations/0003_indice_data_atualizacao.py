@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0002_celula_grade'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['data_atualizacao'], name='coleta_imov_data_at_c03bfe_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0003_indice_data_atualizacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['latitude', 'longitude', 'ativo'], name='coleta_imov_latitud_8b6cb9_idx'),
+        ),
+    ]
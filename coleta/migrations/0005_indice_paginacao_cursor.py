@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0004_indice_coordenadas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='imovel',
+            name='coleta_imov_data_co_060b85_idx',
+        ),
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['data_coleta', 'id', 'ativo'], name='coleta_imov_data_co_7073c1_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0005_indice_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImovelRemovido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imovel_id', models.BigIntegerField(verbose_name='ID do Imóvel')),
+                ('data_remocao', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data/Hora da Remoção')),
+            ],
+            options={
+                'verbose_name': 'Imóvel Removido',
+                'verbose_name_plural': 'Imóveis Removidos',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='imovel',
+            name='coleta_imov_data_at_c03bfe_idx',
+        ),
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['data_atualizacao', 'id'], name='coleta_imov_data_at_4c3237_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imovelremovido',
+            index=models.Index(fields=['data_remocao'], name='coleta_imov_data_re_068f23_idx'),
+        ),
+    ]
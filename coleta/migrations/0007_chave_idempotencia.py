@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0006_sincronizacao_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovel',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Chave de Idempotência'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+from coleta.estatisticas import recalcular
+
+
+def preencher_estatisticas(apps, schema_editor):
+    recalcular(apps.get_model('coleta', 'Imovel'), apps.get_model('coleta', 'EstatisticaColeta'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0007_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaColeta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimensao', models.CharField(choices=[('total', 'Total'), ('agente', 'Agente de Coleta'), ('bairro', 'Bairro'), ('cidade', 'Cidade')], max_length=20, verbose_name='Dimensão')),
+                ('chave', models.CharField(blank=True, default='', max_length=100, verbose_name='Chave')),
+                ('ativos', models.IntegerField(default=0, verbose_name='Imóveis Ativos')),
+                ('inativos', models.IntegerField(default=0, verbose_name='Imóveis Inativos')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Coleta',
+                'verbose_name_plural': 'Estatísticas de Coleta',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estatisticacoleta',
+            constraint=models.UniqueConstraint(fields=('dimensao', 'chave'), name='estatistica_dimensao_chave_unica'),
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
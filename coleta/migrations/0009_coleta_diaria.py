@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:08
+
+from django.db import migrations, models
+
+from coleta.series import recalcular_series
+
+
+def preencher_series(apps, schema_editor):
+    recalcular_series(apps.get_model('coleta', 'Imovel'), apps.get_model('coleta', 'ColetaDiaria'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0008_estatisticas_coleta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColetaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia da Coleta')),
+                ('agente_id', models.BigIntegerField(default=0, verbose_name='ID do Agente')),
+                ('bairro', models.CharField(blank=True, default='', max_length=100)),
+                ('quantidade', models.IntegerField(default=0, verbose_name='Imóveis Coletados')),
+            ],
+            options={
+                'verbose_name': 'Coleta Diária',
+                'verbose_name_plural': 'Coletas Diárias',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coletadiaria',
+            constraint=models.UniqueConstraint(fields=('dia', 'agente_id', 'bairro'), name='coleta_diaria_unica'),
+        ),
+        migrations.RunPython(preencher_series, migrations.RunPython.noop),
+    ]
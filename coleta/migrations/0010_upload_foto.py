@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('coleta', '0009_coleta_diaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadFoto',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome_arquivo', models.CharField(max_length=255, verbose_name='Nome do Arquivo')),
+                ('tamanho', models.BigIntegerField(verbose_name='Tamanho Total (bytes)')),
+                ('recebido', models.BigIntegerField(default=0, verbose_name='Bytes Recebidos')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Atualização')),
+                ('imovel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_foto', to='coleta.imovel', verbose_name='Imóvel')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_foto', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Upload de Foto',
+                'verbose_name_plural': 'Uploads de Fotos',
+            },
+        ),
+    ]
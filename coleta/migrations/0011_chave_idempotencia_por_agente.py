@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0010_upload_foto'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imovel',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Chave de Idempotência'),
+        ),
+        migrations.AddConstraint(
+            model_name='imovel',
+            constraint=models.UniqueConstraint(fields=('agente_coleta', 'chave_idempotencia'), name='imovel_chave_idempotencia_por_agente'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:10
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from coleta.miniaturas import TAMANHOS, nome_miniatura
+
+
+def marcar_miniaturas(apps, schema_editor):
+    Imovel = apps.get_model('coleta', 'Imovel')
+    fotos = (
+        Imovel.objects.exclude(foto='').exclude(foto__isnull=True)
+        .order_by().values_list('foto', flat=True).distinct()
+    )
+    geradas = [
+        nome for nome in fotos.iterator()
+        if all(default_storage.exists(nome_miniatura(nome, tamanho)) for tamanho in TAMANHOS)
+    ]
+    for inicio in range(0, len(geradas), 500):
+        Imovel.objects.filter(foto__in=geradas[inicio:inicio + 500]).update(miniaturas_geradas=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coleta', '0011_chave_idempotencia_por_agente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovel',
+            name='miniaturas_geradas',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Miniaturas Geradas'),
+        ),
+        migrations.RunPython(marcar_miniaturas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+"""
+Miniaturas das fotos dos imóveis
+
+Após o upload, as miniaturas (128 e 512 px no maior lado) são geradas em
+segundo plano por um pool de threads do processo, sem atrasar a resposta,
+e gravadas ao lado da foto original:
+
+    imoveis/2024/11/05/fachada.jpg
+    imoveis/2024/11/05/fachada_128.jpg
+    imoveis/2024/11/05/fachada_512.jpg
+
+O estado fica no imóvel (miniaturas_geradas): a serialização não consulta
+o storage. Enquanto as miniaturas não existem, a URL da foto original é
+usada no lugar; ao gravá-las, o campo é marcado e data_atualizacao avança
+para que a sincronização, os ETags e o cache de fragmentos reflitam a nova
+URL. Trocar a foto desmarca o campo (Imovel.save).
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+TAMANHOS = (128, 512)
+QUALIDADE_JPEG = 80
+
+_lock = threading.Lock()
+_executor = None
+# Fotos com geração agendada e ainda não concluída
+_pendentes = set()
+
+
+def nome_miniatura(nome, tamanho):
+    """
+    Nome da miniatura no storage, ao lado da foto original
+    """
+    raiz, _ = os.path.splitext(nome)
+    return f'{raiz}_{tamanho}.jpg'
+
+
+def urls_miniaturas(foto, geradas):
+    """
+    Retorna {tamanho: url} das miniaturas de uma foto (ImageField ou nome
+    no storage), com a URL da foto original enquanto as miniaturas não
+    foram geradas (None se o imóvel não tem foto)
+    """
+    nome = getattr(foto, 'name', foto)
+    if not nome:
+        return None
+    return {
+        str(tamanho): default_storage.url(nome_miniatura(nome, tamanho) if geradas else nome)
+        for tamanho in TAMANHOS
+    }
+
+
+def gerar_miniaturas(nome, forcar=False):
+    """
+    Gera as miniaturas de uma foto do storage; retorna quantas foram gravadas
+    """
+    with default_storage.open(nome, 'rb') as arquivo:
+        imagem = Image.open(arquivo)
+        imagem = ImageOps.exif_transpose(imagem)
+        if imagem.mode != 'RGB':
+            imagem = imagem.convert('RGB')
+
+        geradas = 0
+        for tamanho in sorted(TAMANHOS, reverse=True):
+            miniatura = nome_miniatura(nome, tamanho)
+            if not forcar and default_storage.exists(miniatura):
+                continue
+            # Cada tamanho é reduzido a partir do anterior (maior)
+            imagem.thumbnail((tamanho, tamanho), Image.LANCZOS)
+            conteudo = BytesIO()
+            imagem.save(conteudo, 'JPEG', quality=QUALIDADE_JPEG, optimize=True)
+            if default_storage.exists(miniatura):
+                default_storage.delete(miniatura)
+            default_storage.save(miniatura, ContentFile(conteudo.getvalue()))
+            geradas += 1
+
+    from .models import Imovel
+
+    # update() não passa pelos signals: só a representação mudou
+    Imovel.objects.filter(foto=nome, miniaturas_geradas=False).update(
+        miniaturas_geradas=True, data_atualizacao=timezone.now())
+    return geradas
+
+
+def _executar(nome):
+    try:
+        gerar_miniaturas(nome)
+    except Exception:
+        # Sem miniatura a API continua usando a foto original
+        logger.exception('Falha ao gerar miniaturas de %s', nome)
+    finally:
+        with _lock:
+            _pendentes.discard(nome)
+        # Cada thread do pool tem as próprias conexões com o banco
+        connections.close_all()
+
+
+def agendar_miniaturas(nome):
+    """
+    Agenda a geração das miniaturas de uma foto no pool do processo
+    """
+    global _executor
+
+    with _lock:
+        if nome in _pendentes:
+            return
+        _pendentes.add(nome)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'COLETA_MINIATURAS_WORKERS', 2),
+                thread_name_prefix='miniaturas',
+            )
+        _executor.submit(_executar, nome)
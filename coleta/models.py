@@ -2,10 +2,14 @@
 Modelos para o aplicativo de coleta de dados geográficos de imóveis
 """
 
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .espacial import celula_da_grade, distancia_haversine
+
 
 class Imovel(models.Model):
     """
@@ -70,6 +74,13 @@ class Imovel(models.Model):
         verbose_name='Foto do Imóvel'
     )
     
+    # Marcado quando as miniaturas da foto atual foram gravadas (coleta/miniaturas.py)
+    miniaturas_geradas = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Miniaturas Geradas'
+    )
+    
     # Metadados
     agente_coleta = models.ForeignKey(
         User,
@@ -94,18 +105,98 @@ class Imovel(models.Model):
         verbose_name='Registro Ativo'
     )
     
+    # Chave gerada pelo dispositivo para reenvios idempotentes (POST /api/imoveis/lote/),
+    # única por agente de coleta
+    chave_idempotencia = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name='Chave de Idempotência'
+    )
+    
+    # Índice espacial (célula da grade fixa calculada a partir de latitude/longitude)
+    celula_grade = models.BigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Célula da Grade'
+    )
+    
     class Meta:
         verbose_name = 'Imóvel'
         verbose_name_plural = 'Imóveis'
         ordering = ['-data_coleta']
         indexes = [
             models.Index(fields=['numero_imovel']),
-            models.Index(fields=['data_coleta']),
+            models.Index(fields=['data_coleta', 'id', 'ativo']),
+            models.Index(fields=['celula_grade']),
+            models.Index(fields=['data_atualizacao', 'id']),
+            models.Index(fields=['latitude', 'longitude', 'ativo']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agente_coleta', 'chave_idempotencia'],
+                name='imovel_chave_idempotencia_por_agente',
+            ),
         ]
     
     def __str__(self):
         return f'Imóvel {self.numero_imovel} - {self.endereco}'
     
+    # Campos cujo valor anterior fica disponível para os signals (post_save)
+    CAMPOS_RASTREADOS = (
+        'latitude', 'longitude', 'ativo', 'agente_coleta_id', 'bairro', 'cidade', 'data_coleta', 'foto'
+    )
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._guardar_estado_original()
+        return instancia
+    
+    def _guardar_estado_original(self):
+        self._estado_original = {
+            campo: self.__dict__[campo]
+            for campo in self.CAMPOS_RASTREADOS
+            if campo in self.__dict__
+        }
+    
+    @property
+    def estado_original(self):
+        """
+        Valores dos campos rastreados como estavam no banco antes do save
+        atual (vazio para registros novos)
+        """
+        return getattr(self, '_estado_original', {})
+    
+    def atualizar_celula_grade(self):
+        """
+        Recalcula a célula da grade (necessário antes de bulk_create,
+        que não passa pelo save)
+        """
+        self.celula_grade = celula_da_grade(self.latitude, self.longitude)
+    
+    def save(self, *args, **kwargs):
+        """
+        Mantém a célula da grade sincronizada com as coordenadas (e a
+        marca das miniaturas com a foto) e grava o imóvel e as
+        estatísticas na mesma transação
+        """
+        self.atualizar_celula_grade()
+        foto_original = self.estado_original.get('foto')
+        if (self.foto.name or None) != (getattr(foto_original, 'name', foto_original) or None):
+            # Foto nova ou trocada: as miniaturas ainda serão geradas
+            self.miniaturas_geradas = False
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'celula_grade'}
+        if update_fields is not None and 'foto' in update_fields:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'miniaturas_geradas'}
+        # Os signals (post_save) atualizam as estatísticas na mesma transação
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._guardar_estado_original()
+    
     def get_coordenadas(self):
         """Retorna coordenadas formatadas"""
         return {
@@ -118,12 +209,188 @@ class Imovel(models.Model):
         Calcula a distância aproximada entre este imóvel e outro ponto
         Usa a fórmula de Haversine para cálculo aproximado
         """
-        from math import radians, cos, sin, asin, sqrt
-        
-        lon1, lat1, lon2, lat2 = map(radians, [self.longitude, self.latitude, lng, lat])
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        r = 6371  # Raio da Terra em km
-        return c * r * 1000  # Retorna em metros
+        return distancia_haversine(self.latitude, self.longitude, lat, lng)
+
+
+class ImovelRemovido(models.Model):
+    """
+    Registro de imóvel excluído do banco (tombstone), usado pela
+    sincronização incremental para avisar os dispositivos de campo
+    """
+    
+    imovel_id = models.BigIntegerField(
+        verbose_name='ID do Imóvel'
+    )
+    
+    data_remocao = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Data/Hora da Remoção'
+    )
+    
+    class Meta:
+        verbose_name = 'Imóvel Removido'
+        verbose_name_plural = 'Imóveis Removidos'
+        indexes = [
+            models.Index(fields=['data_remocao']),
+        ]
+    
+    def __str__(self):
+        return f'Imóvel {self.imovel_id} removido em {self.data_remocao}'
+
+
+class EstatisticaColeta(models.Model):
+    """
+    Contadores de imóveis mantidos pelos signals a cada escrita, para que
+    as estatísticas sejam lidas sem percorrer a tabela de imóveis
+    
+    Recalculados do zero com: python manage.py recalcular_estatisticas
+    """
+    
+    DIMENSOES = [
+        ('total', 'Total'),
+        ('agente', 'Agente de Coleta'),
+        ('bairro', 'Bairro'),
+        ('cidade', 'Cidade'),
+    ]
+    
+    dimensao = models.CharField(
+        max_length=20,
+        choices=DIMENSOES,
+        verbose_name='Dimensão'
+    )
+    
+    # id do agente, nome do bairro ou da cidade ('' para o total)
+    chave = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Chave'
+    )
+    
+    ativos = models.IntegerField(
+        default=0,
+        verbose_name='Imóveis Ativos'
+    )
+    
+    inativos = models.IntegerField(
+        default=0,
+        verbose_name='Imóveis Inativos'
+    )
+    
+    class Meta:
+        verbose_name = 'Estatística de Coleta'
+        verbose_name_plural = 'Estatísticas de Coleta'
+        constraints = [
+            models.UniqueConstraint(fields=['dimensao', 'chave'], name='estatistica_dimensao_chave_unica'),
+        ]
+    
+    def __str__(self):
+        return f'{self.dimensao} {self.chave}: {self.ativos} ativos, {self.inativos} inativos'
+
+
+class ColetaDiaria(models.Model):
+    """
+    Quantidade de imóveis ativos coletados por dia, agente e bairro,
+    mantida pelos signals para a série temporal de coleta
+    
+    O dia segue o fuso horário do projeto (TIME_ZONE).
+    Recalculada do zero com: python manage.py recalcular_estatisticas
+    """
+    
+    dia = models.DateField(
+        verbose_name='Dia da Coleta'
+    )
+    
+    # 0 quando o imóvel não tem agente de coleta
+    agente_id = models.BigIntegerField(
+        default=0,
+        verbose_name='ID do Agente'
+    )
+    
+    bairro = models.CharField(
+        max_length=100,
+        blank=True,
+        default=''
+    )
+    
+    quantidade = models.IntegerField(
+        default=0,
+        verbose_name='Imóveis Coletados'
+    )
+    
+    class Meta:
+        verbose_name = 'Coleta Diária'
+        verbose_name_plural = 'Coletas Diárias'
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'agente_id', 'bairro'], name='coleta_diaria_unica'),
+        ]
+    
+    def __str__(self):
+        return f'{self.dia} agente {self.agente_id} {self.bairro}: {self.quantidade}'
+
+
+class UploadFoto(models.Model):
+    """
+    Envio de foto em partes (retomável) para um imóvel existente
+
+    As partes são gravadas em um arquivo temporário em COLETA_UPLOADS_ROOT;
+    ao concluir, o arquivo é conferido pelo SHA-256 e anexado ao imóvel.
+    Envios abandonados são apagados com: python manage.py limpar_uploads
+    """
+    
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    
+    imovel = models.ForeignKey(
+        Imovel,
+        on_delete=models.CASCADE,
+        related_name='uploads_foto',
+        verbose_name='Imóvel'
+    )
+    
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='uploads_foto',
+        verbose_name='Usuário'
+    )
+    
+    nome_arquivo = models.CharField(
+        max_length=255,
+        verbose_name='Nome do Arquivo'
+    )
+    
+    tamanho = models.BigIntegerField(
+        verbose_name='Tamanho Total (bytes)'
+    )
+    
+    recebido = models.BigIntegerField(
+        default=0,
+        verbose_name='Bytes Recebidos'
+    )
+    
+    sha256 = models.CharField(
+        max_length=64,
+        verbose_name='SHA-256'
+    )
+    
+    data_criacao = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Data de Criação'
+    )
+    
+    data_atualizacao = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Última Atualização'
+    )
+    
+    class Meta:
+        verbose_name = 'Upload de Foto'
+        verbose_name_plural = 'Uploads de Fotos'
+    
+    def __str__(self):
+        return f'{self.nome_arquivo} ({self.recebido}/{self.tamanho} bytes)'
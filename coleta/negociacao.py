@@ -0,0 +1,18 @@
+"""
+Negociação de conteúdo da API REST do WebGIS de Coleta
+"""
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class NegociacaoFormato(DefaultContentNegotiation):
+    """
+    Aceita também ?formato= (ex.: ?formato=colunar, ?formato=msgpack) para
+    escolher o renderer, além de ?format= e do cabeçalho Accept
+    """
+
+    parametro_formato = 'formato'
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        formato = request.query_params.get(self.parametro_formato)
+        return super().select_renderer(request, renderers, format_suffix or formato)
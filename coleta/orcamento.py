@@ -0,0 +1,212 @@
+"""
+Orçamento de consultas SQL por requisição (desenvolvimento e testes)
+
+Com COLETA_ORCAMENTO_CONSULTAS = 'avisar' ou 'falhar', o
+OrcamentoConsultasMiddleware registra todas as consultas de cada
+requisição e procura:
+
+- orçamento excedido: mais consultas que o declarado para a action em
+  ORCAMENTO_CONSULTAS do ViewSet (contando sessão e usuário);
+- N+1: o mesmo SELECT (a menos dos parâmetros e do tamanho das listas
+  IN) repetido COLETA_ORCAMENTO_REPETICOES vezes ou mais (escritas
+  repetidas ficam por conta do orçamento);
+- varredura completa de coleta_imovel: no SQLite, EXPLAIN QUERY PLAN de
+  cada consulta distinta à tabela mostra "SCAN coleta_imovel" sem índice
+  (exceto nas actions de ACOES_VARREDURA do ViewSet).
+
+Em 'avisar' os problemas vão para o log (logger coleta.orcamento); em
+'falhar' a requisição termina com OrcamentoExcedido, o que faz o cliente
+de testes do Django levantar a exceção no teste. O cabeçalho
+X-Consultas-SQL traz o número de consultas e o orçamento.
+
+Consultas feitas durante o envio de respostas em streaming (exportação
+GeoJSON) acontecem depois do middleware e não entram na conta; o comando
+verificar_consultas consome essas respostas dentro do registro.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+MODOS = ('avisar', 'falhar')
+TABELA = 'coleta_imovel'
+
+_LISTA_PARAMETROS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_LIMITE = re.compile(r'\b(LIMIT|OFFSET)\s+\d+')
+_VARREDURA = re.compile(rf'^SCAN (?:TABLE )?"?{TABELA}"?(?: AS \w+)?$')
+
+# Planos já analisados: (alias, sql) -> detalhes com varredura completa
+_planos = {}
+
+
+class OrcamentoExcedido(Exception):
+    """
+    Requisição que excedeu o orçamento de consultas, repetiu consultas (N+1)
+    ou varreu coleta_imovel
+    """
+
+
+def modo():
+    valor = getattr(settings, 'COLETA_ORCAMENTO_CONSULTAS', '')
+    return valor if valor in MODOS else None
+
+
+_consultas = ContextVar('coleta_orcamento_consultas', default=None)
+
+
+def _registrar_consulta(execute, sql, params, many, context):
+    consultas = _consultas.get()
+    if consultas is not None:
+        consultas.append((context['connection'].alias, sql, params, many))
+    return execute(sql, params, many, context)
+
+
+def _instalar_em(conexao):
+    if _registrar_consulta not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(_registrar_consulta)
+
+
+def _instalar(sender, connection, **kwargs):
+    if modo():
+        _instalar_em(connection)
+
+
+connection_created.connect(_instalar, dispatch_uid='coleta_orcamento')
+
+
+@contextmanager
+def registrar():
+    """
+    Registra as consultas feitas no bloco: lista de (alias, sql, params, many)
+    """
+    for conexao in connections.all():
+        _instalar_em(conexao)
+    consultas = []
+    token = _consultas.set(consultas)
+    try:
+        yield consultas
+    finally:
+        _consultas.reset(token)
+
+
+def forma(sql):
+    """
+    A consulta sem o que muda entre repetições (listas IN, LIMIT/OFFSET)
+    """
+    return _LIMITE.sub(r'\1 N', _LISTA_PARAMETROS.sub('(...)', sql))
+
+
+def _leitura(sql):
+    return sql.lstrip()[:6].upper() == 'SELECT'
+
+
+def repetidas(consultas, limiar=None):
+    """
+    SELECTs repetidos limiar vezes ou mais: {forma: repetições}
+    """
+    if limiar is None:
+        limiar = getattr(settings, 'COLETA_ORCAMENTO_REPETICOES', 5)
+    contagem = Counter(forma(sql) for _, sql, _, many in consultas if not many and _leitura(sql))
+    return {sql: vezes for sql, vezes in contagem.items() if vezes >= limiar}
+
+
+def varreduras(consultas):
+    """
+    Consultas que varrem coleta_imovel inteira (EXPLAIN QUERY PLAN, SQLite)
+    """
+    encontradas = []
+    vistas = set()
+    for alias, sql, params, many in consultas:
+        if many or (alias, sql) in vistas or TABELA not in sql or not _leitura(sql):
+            continue
+        vistas.add((alias, sql))
+        conexao = connections[alias]
+        if conexao.vendor != 'sqlite':
+            continue
+        if (alias, sql) not in _planos:
+            if len(_planos) > 1000:
+                _planos.clear()
+            with conexao.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                _planos[alias, sql] = [linha[-1] for linha in cursor.fetchall() if _VARREDURA.match(linha[-1])]
+        if _planos[alias, sql]:
+            encontradas.append(sql)
+    return encontradas
+
+
+def acao_da_requisicao(request):
+    """
+    (classe da view, action) da rota resolvida, ou (None, None)
+    """
+    funcao = getattr(request.resolver_match, 'func', None)
+    classe = getattr(funcao, 'cls', None)
+    acoes = getattr(funcao, 'actions', None) or {}
+    return classe, acoes.get(request.method.lower())
+
+
+def analisar(classe, acao, consultas):
+    """
+    (orçamento ou None, lista de problemas) das consultas de uma requisição
+    """
+    orcamento = getattr(classe, 'ORCAMENTO_CONSULTAS', {}).get(acao)
+    problemas = []
+    if orcamento is not None and len(consultas) > orcamento:
+        problemas.append(f'{len(consultas)} consultas SQL, orçamento de {orcamento}')
+    for sql, vezes in repetidas(consultas).items():
+        problemas.append(f'consulta repetida {vezes} vezes (N+1?): {sql[:300]}')
+    if acao not in getattr(classe, 'ACOES_VARREDURA', ()):
+        for sql in varreduras(consultas):
+            problemas.append(f'varredura completa de {TABELA}: {sql[:300]}')
+    return orcamento, problemas
+
+
+class OrcamentoConsultasMiddleware:
+    """
+    Confere as consultas de cada requisição (ver o docstring do módulo)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if modo() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        with registrar() as consultas:
+            resposta = self.get_response(request)
+        return self._conferir(request, resposta, consultas)
+
+    async def __acall__(self, request):
+        with registrar() as consultas:
+            resposta = await self.get_response(request)
+        # EXPLAIN usa a conexão do banco, que não pode ser usada no loop
+        return await sync_to_async(self._conferir)(request, resposta, consultas)
+
+    def _conferir(self, request, resposta, consultas):
+        classe, acao = acao_da_requisicao(request)
+        orcamento, problemas = analisar(classe, acao, consultas)
+        resposta['X-Consultas-SQL'] = f'{len(consultas)}/{orcamento}' if orcamento is not None else str(len(consultas))
+        if problemas:
+            rota = f'{request.method} {request.path}' + (f' ({acao})' if acao else '')
+            if modo() == 'falhar':
+                raise OrcamentoExcedido(f'{rota}: ' + '; '.join(problemas))
+            for problema in problemas:
+                logger.warning('%s: %s', rota, problema)
+        return resposta
@@ -0,0 +1,126 @@
+"""
+Paginação da API do WebGIS de Coleta
+"""
+
+import base64
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorDataColetaPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) na ordem (-data_coleta, -id)
+
+    Cada página é lida a partir da posição do último item da página
+    anterior, usando o índice (data_coleta, id, ativo): o custo por página
+    é constante, não há COUNT(*) e inserções concorrentes não deslocam os
+    itens das páginas seguintes.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE or 100
+
+    def codificar_cursor(self, imovel):
+        # imovel pode ser uma instância ou uma linha de values()
+        if isinstance(imovel, dict):
+            data_coleta, pk = imovel['data_coleta'], imovel['id']
+        else:
+            data_coleta, pk = imovel.data_coleta, imovel.pk
+        valor = f'{data_coleta.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+    def decodificar_cursor(self, cursor):
+        try:
+            valor = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            data_coleta, pk = valor.rsplit('|', 1)
+            return datetime.fromisoformat(data_coleta), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound('Cursor inválido')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._concluir(list(self._consulta(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Versão assíncrona de paginate_queryset (ORM assíncrono)
+        """
+        return self._concluir([item async for item in self._consulta(queryset, request)])
+
+    def _consulta(self, queryset, request):
+        self.request = request
+        queryset = queryset.order_by('-data_coleta', '-id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            data_coleta, pk = self.decodificar_cursor(cursor)
+            # A primeira condição permite ao SQLite iniciar a leitura do
+            # índice diretamente na posição do cursor
+            queryset = queryset.filter(data_coleta__lte=data_coleta).filter(
+                Q(data_coleta__lt=data_coleta) | Q(id__lt=pk)
+            )
+        return queryset[:self.page_size + 1]
+
+    def _concluir(self, pagina):
+        self.proximo = None
+        if len(pagina) > self.page_size:
+            pagina = pagina[:self.page_size]
+            self.proximo = self.codificar_cursor(pagina[-1])
+        return pagina
+
+    def get_next_link(self):
+        if self.proximo is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.proximo)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ImovelPagination(BasePagination):
+    """
+    Paginação por cursor por padrão; com ?page=N usa a paginação
+    por número de página (com COUNT(*)), para telas administrativas
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._escolher(request)
+        return self.paginacao.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Versão assíncrona de paginate_queryset; a paginação por número de
+        página (Paginator do Django, síncrono) roda em uma thread
+        """
+        if isinstance(self._escolher(request), CursorDataColetaPagination):
+            return await self.paginacao.apaginate_queryset(queryset, request, view)
+        return await sync_to_async(self.paginacao.paginate_queryset)(queryset, request, view)
+
+    def _escolher(self, request):
+        if PageNumberPagination.page_query_param in request.query_params:
+            self.paginacao = PageNumberPagination()
+        else:
+            self.paginacao = CursorDataColetaPagination()
+        return self.paginacao
+
+    def get_paginated_response(self, data):
+        return self.paginacao.get_paginated_response(data)
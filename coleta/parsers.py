@@ -0,0 +1,50 @@
+"""
+Parsers adicionais da API REST do WebGIS de Coleta
+"""
+
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Lê um objeto JSON por linha (NDJSON) e retorna a lista de objetos
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        itens = []
+        for numero, linha in enumerate(stream, start=1):
+            linha = linha.decode(encoding).strip()
+            if not linha:
+                continue
+            try:
+                itens.append(json.loads(linha))
+            except ValueError as erro:
+                raise ParseError(f'NDJSON inválido na linha {numero}: {erro}')
+        return itens
+
+
+class BinarioParser(BaseParser):
+    """
+    Lê o corpo da requisição como bytes (partes de envios retomáveis),
+    limitado a COLETA_UPLOADS_PARTE_MAXIMA bytes
+    """
+
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        maximo = getattr(settings, 'COLETA_UPLOADS_PARTE_MAXIMA', 5 * 1024 * 1024)
+        if stream is None:
+            return b''
+        conteudo = stream.read(maximo + 1)
+        if len(conteudo) > maximo:
+            raise ParseError(f'Cada parte pode ter no máximo {maximo} bytes')
+        return conteudo
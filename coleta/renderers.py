@@ -0,0 +1,201 @@
+"""
+Renderers adicionais da API REST do WebGIS de Coleta
+"""
+
+import json
+
+import msgpack
+import numpy as np
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+
+class FragmentoJSON:
+    """
+    Trecho de JSON já renderizado, inserido como está pelo ORJSONRenderer
+    """
+
+    __slots__ = ('conteudo',)
+
+    def __init__(self, conteudo):
+        self.conteudo = conteudo
+
+
+class _EncoderFragmentos(encoders.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, FragmentoJSON):
+            return json.loads(obj.conteudo)
+        return super().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer que codifica com orjson
+
+    Gera os mesmos bytes do JSONRenderer padrão (separadores compactos,
+    UTF-8, U+2028/U+2029 escapados, datas pelo encoder do DRF) para os
+    dados produzidos por coleta.serializacao, onde os floats que o orjson
+    escreveria de outra forma chegam como FloatJSON. Com indentação
+    (API navegável, "application/json; indent=4") usa o renderer padrão.
+
+    Objetos FragmentoJSON (cache de fragmentos) são copiados para a saída
+    sem nova codificação.
+    """
+
+    encoder_class = _EncoderFragmentos
+    opcoes = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if (self.get_indent(accepted_media_type, renderer_context) is not None
+                or self.ensure_ascii or not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            conteudo = orjson.dumps(data, default=self._padrao, option=self.opcoes)
+        except orjson.JSONEncodeError:
+            # Inteiros acima de 64 bits, chaves não textuais etc.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'\xe2\x80' in conteudo:
+            conteudo = conteudo.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return conteudo
+
+    def aceita_fragmentos(self, accepted_media_type):
+        """
+        Indica se a resposta será codificada pelo orjson (sem indentação),
+        onde os fragmentos são inseridos direto nos bytes da saída
+        """
+        return (self.get_indent(accepted_media_type, {}) is None
+                and not self.ensure_ascii and self.compact)
+
+    def _padrao(self, valor):
+        if isinstance(valor, FragmentoJSON):
+            return orjson.Fragment(valor.conteudo)
+        if isinstance(valor, float):
+            # FloatJSON (subclasses de float não são escritas pelo orjson)
+            return orjson.Fragment(json.dumps(float(valor)).encode())
+        return self.encoder_class().default(valor)
+
+
+class ColunarRenderer(BaseRenderer):
+    """
+    Renderiza listas de registros em colunas, para clientes de mapa
+
+    As linhas são procuradas em "results" (paginação), "pontos" (listas
+    [id, latitude, longitude] do modo bbox) ou na própria lista retornada;
+    as demais chaves da resposta são mantidas. Cada coluna é codificada
+    conforme o conteúdo:
+
+    - coordenadas (campos_coordenadas): inteiros int32 com o valor
+      multiplicado por "escala";
+    - inteiros: int32 (ou int64, se necessário);
+    - campos_dicionario: lista de valores distintos ("dicionario") e, por
+      linha, o índice do valor ("indices", uint16 ou uint32);
+    - demais campos: lista de valores como no JSON.
+
+    Nesta versão JSON as colunas numéricas são listas de inteiros; em
+    ColunarMsgpackRenderer são bytes little-endian, lidos no cliente
+    diretamente como Int32Array/Uint16Array.
+    """
+
+    media_type = 'application/vnd.coleta.colunar+json'
+    format = 'colunar'
+    charset = None
+
+    campos_coordenadas = ('latitude', 'longitude')
+    campos_dicionario = ('bairro', 'cidade', 'agente_nome')
+    colunas_pontos = ('id', 'latitude', 'longitude')
+    # 1e-6 grau: cerca de 11 cm no equador
+    escala = 1_000_000
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.codificar(self.colunar(data))
+
+    def codificar(self, dados):
+        return orjson.dumps(dados, default=encoders.JSONEncoder().default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def numeros(self, valores, tipo):
+        """
+        Coluna numérica (array do NumPy) no formato de saída
+        """
+        return valores.astype(tipo).tolist()
+
+    def colunar(self, data):
+        if isinstance(data, list):
+            return self._colunas(data, None, {})
+        if isinstance(data, dict):
+            for chave, nomes in (('results', None), ('pontos', self.colunas_pontos)):
+                if isinstance(data.get(chave), list):
+                    resto = {nome: valor for nome, valor in data.items() if nome != chave}
+                    return self._colunas(data[chave], nomes, resto)
+        return data
+
+    def _colunas(self, linhas, nomes, resto):
+        if nomes is not None:
+            linhas = [dict(zip(nomes, linha)) for linha in linhas]
+        ordem = {}
+        for linha in linhas:
+            for nome in linha:
+                ordem.setdefault(nome, None)
+
+        colunas = {}
+        for nome in ordem:
+            colunas[nome] = self._coluna(nome, [linha.get(nome) for linha in linhas])
+
+        return {**resto, 'formato': 'colunar', 'quantidade': len(linhas), 'colunas': colunas}
+
+    def _coluna(self, nome, valores):
+        if nome in self.campos_coordenadas and self._todos(valores, (int, float)):
+            escalados = np.rint(np.asarray(valores, dtype=np.float64) * self.escala)
+            if np.all(np.isfinite(escalados)) and np.all(np.abs(escalados) < 2 ** 31):
+                return {'tipo': 'int32', 'escala': self.escala, 'valores': self.numeros(escalados, '<i4')}
+        elif nome in self.campos_dicionario:
+            dicionario = {}
+            indices = [dicionario.setdefault(valor, len(dicionario)) for valor in valores]
+            tipo = '<u2' if len(dicionario) <= 2 ** 16 else '<u4'
+            return {
+                'tipo': 'dicionario',
+                'dicionario': list(dicionario),
+                'tipo_indices': 'uint16' if tipo == '<u2' else 'uint32',
+                'indices': self.numeros(np.asarray(indices, dtype=np.int64), tipo),
+            }
+        elif valores and self._todos(valores, (int,)):
+            inteiros = np.asarray(valores, dtype=np.int64)
+            if np.all(np.abs(inteiros) < 2 ** 31):
+                return {'tipo': 'int32', 'valores': self.numeros(inteiros, '<i4')}
+            return {'tipo': 'int64', 'valores': self.numeros(inteiros, '<i8')}
+        return {'tipo': 'valores', 'valores': valores}
+
+    @staticmethod
+    def _todos(valores, tipos):
+        return all(isinstance(valor, tipos) and not isinstance(valor, bool) for valor in valores)
+
+
+class ColunarMsgpackRenderer(ColunarRenderer):
+    """
+    ColunarRenderer codificado em MessagePack, com as colunas numéricas
+    como bytes little-endian
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+
+    def codificar(self, dados):
+        return msgpack.packb(dados, default=self._padrao, use_bin_type=True)
+
+    def numeros(self, valores, tipo):
+        return valores.astype(tipo).tobytes()
+
+    @staticmethod
+    def _padrao(valor):
+        # Tipos sem equivalente no MessagePack (datas, Decimal, textos lazy...)
+        # usam a mesma representação do JSON
+        return encoders.JSONEncoder().default(valor)
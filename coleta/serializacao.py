@@ -0,0 +1,215 @@
+"""
+Serialização rápida de leitura para listagens grandes
+
+Em vez de instanciar um Imovel (e o User do agente) por linha e passar
+cada campo pelo to_representation do DRF, as linhas são lidas com
+values() apenas com as colunas necessárias e convertidas por uma lista de
+conversores montada uma única vez a partir dos campos do serializer.
+
+O resultado é idêntico ao de serializer.data (mesmas chaves, na mesma
+ordem, e os mesmos valores) e, renderizado com ORJSONRenderer, gera os
+mesmos bytes do JSONRenderer padrão.
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .serializers import FotoMiniaturaField
+
+
+# Floats que o orjson escreve de forma diferente de json.dumps
+# (notação exponencial: "1e-05" x "0.00001", "1e+16" x "1e16")
+_FLOAT_MINIMO = 1e-4
+_FLOAT_MAXIMO = 1e16
+
+
+class FloatJSON(float):
+    """
+    Float que o ORJSONRenderer escreve com o mesmo texto de json.dumps
+    """
+
+
+def float_json(valor):
+    """
+    Retorna o float pronto para o ORJSONRenderer
+    """
+    if valor is None:
+        return None
+    valor = float(valor)
+    if valor == 0 or (_FLOAT_MINIMO <= abs(valor) < _FLOAT_MAXIMO):
+        return valor
+    return FloatJSON(valor)
+
+
+class SerializacaoRapida:
+    """
+    Serialização de leitura equivalente à de um ModelSerializer, a partir
+    de dicionários de values()
+
+    Campos suportados: campos simples do modelo, FloatField, FileField/
+    ImageField (URL absoluta), PrimaryKeyRelatedField, campos com source
+    atravessando uma ForeignKey (ex.: agente_coleta.username) e
+    FotoMiniaturaField (que lê mais de uma coluna e recebe a linha inteira).
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.colunas = []
+        # (nome, coluna, fábrica do conversor, coluna da FK que, nula, omite o campo)
+        # A fábrica recebe o request e retorna conversor(valor), ou é None
+        # quando o valor do banco já é a representação final; com coluna
+        # None o conversor recebe a linha
+        self.campos = []
+
+        for nome, campo in serializer_class().fields.items():
+            if campo.write_only:
+                continue
+            omitir_se_nula = None
+            adicionais = ()
+            if isinstance(campo, FotoMiniaturaField):
+                coluna = None
+                adicionais = campo.COLUNAS
+                fabrica = self._fabrica_miniaturas(campo)
+            elif isinstance(campo, serializers.FileField):
+                coluna = campo.source
+                fabrica = self._fabrica_arquivo(serializer_class.Meta.model, coluna)
+            elif isinstance(campo, serializers.PrimaryKeyRelatedField):
+                coluna = campo.source
+                fabrica = None
+            elif isinstance(campo, serializers.Field) and not isinstance(
+                    campo, (serializers.BaseSerializer, serializers.RelatedField,
+                            serializers.SerializerMethodField, serializers.HiddenField)):
+                coluna = campo.source.replace('.', '__')
+                fabrica = self._fabrica_campo(campo)
+                if '.' in campo.source:
+                    # Como no DRF: sem o objeto relacionado, o campo somente
+                    # leitura é omitido da resposta
+                    omitir_se_nula = campo.source.split('.', 1)[0]
+            else:
+                raise TypeError(f'Campo {nome} ({type(campo).__name__}) não suportado')
+
+            for nome_coluna in (coluna, omitir_se_nula, *adicionais):
+                if nome_coluna and nome_coluna not in self.colunas:
+                    self.colunas.append(nome_coluna)
+            self.campos.append((nome, coluna, fabrica, omitir_se_nula))
+
+    @staticmethod
+    def _fabrica_campo(campo):
+        if type(campo) in (serializers.CharField, serializers.IntegerField, serializers.BooleanField):
+            # str, int e bool do banco já são a representação do DRF
+            return None
+        if isinstance(campo, serializers.FloatField):
+            return lambda request: float_json
+        if (isinstance(campo, serializers.DateTimeField)
+                and getattr(campo, 'format', api_settings.DATETIME_FORMAT) == ISO_8601):
+            return SerializacaoRapida._fabrica_data_hora(campo)
+        return lambda request: campo.to_representation
+
+    @staticmethod
+    def _fabrica_data_hora(campo):
+        """
+        Mesmo resultado de DateTimeField.to_representation no formato
+        ISO 8601, com o fuso horário resolvido uma vez por resposta
+        """
+        def fabrica(request):
+            if not settings.USE_TZ:
+                return campo.to_representation
+            fuso = campo.timezone if hasattr(campo, 'timezone') else campo.default_timezone()
+
+            def converter(valor):
+                if timezone.is_naive(valor):
+                    return campo.to_representation(valor)
+                texto = valor.astimezone(fuso).isoformat()
+                if texto.endswith('+00:00'):
+                    texto = texto[:-6] + 'Z'
+                return texto
+            return converter
+        return fabrica
+
+    @staticmethod
+    def _fabrica_miniaturas(campo):
+        def fabrica(request):
+            return lambda linha: campo.representar(linha['foto'], linha['miniaturas_geradas'], request)
+        return fabrica
+
+    @staticmethod
+    def _fabrica_arquivo(modelo, coluna):
+        storage = modelo._meta.get_field(coluna).storage
+
+        def fabrica(request):
+            def converter(nome):
+                if not nome:
+                    return None
+                url = storage.url(nome)
+                if request is not None:
+                    return request.build_absolute_uri(url)
+                return url
+            return converter
+        return fabrica
+
+    def valores(self, queryset):
+        """
+        Queryset de dicionários apenas com as colunas necessárias
+        """
+        return queryset.values(*self.colunas)
+
+    def valores_por_id(self, queryset, ids):
+        """
+        Linhas dos ids informados, na ordem de ids (em lotes, como in_bulk)
+        """
+        linhas = {}
+        for consulta in self._lotes_por_id(queryset, ids):
+            for linha in consulta:
+                linhas[linha['id']] = linha
+        return [linhas[pk] for pk in ids if pk in linhas]
+
+    async def avalores_por_id(self, queryset, ids):
+        """
+        Versão assíncrona de valores_por_id (ORM assíncrono)
+        """
+        linhas = {}
+        for consulta in self._lotes_por_id(queryset, ids):
+            async for linha in consulta:
+                linhas[linha['id']] = linha
+        return [linhas[pk] for pk in ids if pk in linhas]
+
+    def _lotes_por_id(self, queryset, ids):
+        lote = connections[queryset.db].features.max_query_params or len(ids) or 1
+        colunas = self.colunas if 'id' in self.colunas else self.colunas + ['id']
+        for inicio in range(0, len(ids), lote):
+            yield queryset.filter(id__in=ids[inicio:inicio + lote]).order_by().values(*colunas)
+
+    def representar(self, linhas, request=None):
+        """
+        Converte as linhas de valores() no formato do serializer
+        """
+        campos = [
+            (nome, coluna, fabrica(request) if fabrica is not None else None, omitir_se_nula)
+            for nome, coluna, fabrica, omitir_se_nula in self.campos
+        ]
+        resultado = []
+        for linha in linhas:
+            item = {}
+            for nome, coluna, conversor, omitir_se_nula in campos:
+                if omitir_se_nula is not None and linha[omitir_se_nula] is None:
+                    continue
+                valor = linha[coluna] if coluna is not None else linha
+                if valor is None or conversor is None:
+                    item[nome] = valor
+                else:
+                    item[nome] = conversor(valor)
+            resultado.append(item)
+        return resultado
+
+
+@lru_cache(maxsize=None)
+def serializacao_rapida(serializer_class):
+    """
+    SerializacaoRapida do serializer, montada uma vez por processo
+    """
+    return SerializacaoRapida(serializer_class)
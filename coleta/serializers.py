@@ -3,7 +3,34 @@ Serializers para a API REST do WebGIS de Coleta
 """
 
 from rest_framework import serializers
-from .models import Imovel
+from .fotos import normalizar_foto
+from .miniaturas import urls_miniaturas
+from .models import Imovel, UploadFoto
+from .uploads import expira_em, tamanho_maximo
+
+
+class FotoMiniaturaField(serializers.ReadOnlyField):
+    """
+    URLs das miniaturas da foto ({"128": url, "512": url}), com a URL da
+    foto original enquanto as miniaturas ainda não foram geradas
+    """
+    
+    # Colunas do imóvel usadas na representação
+    COLUNAS = ('foto', 'miniaturas_geradas')
+    
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+    
+    def to_representation(self, imovel):
+        return self.representar(imovel.foto, imovel.miniaturas_geradas, self.context.get('request'))
+    
+    @staticmethod
+    def representar(foto, geradas, request):
+        urls = urls_miniaturas(foto, geradas)
+        if urls is None or request is None:
+            return urls
+        return {tamanho: request.build_absolute_uri(url) for tamanho, url in urls.items()}
 
 
 class ImovelSerializer(serializers.ModelSerializer):
@@ -13,6 +40,7 @@ class ImovelSerializer(serializers.ModelSerializer):
     """
     
     agente_nome = serializers.CharField(source='agente_coleta.username', read_only=True)
+    foto_thumb = FotoMiniaturaField()
     
     class Meta:
         model = Imovel
@@ -27,6 +55,7 @@ class ImovelSerializer(serializers.ModelSerializer):
             'longitude',
             'observacoes',
             'foto',
+            'foto_thumb',
             'agente_coleta',
             'agente_nome',
             'data_coleta',
@@ -34,6 +63,33 @@ class ImovelSerializer(serializers.ModelSerializer):
             'ativo'
         ]
         read_only_fields = ['id', 'data_coleta', 'data_atualizacao']
+        # Podem vir do GPS da foto (ver validate)
+        extra_kwargs = {
+            'latitude': {'required': False},
+            'longitude': {'required': False},
+        }
+    
+    def validate(self, attrs):
+        """
+        Normaliza a foto enviada e, na criação ou na atualização completa
+        (PUT) sem coordenadas, usa as coordenadas GPS da foto, quando ela tem
+        """
+        attrs = super().validate(attrs)
+        
+        coordenadas = None
+        if attrs.get('foto'):
+            attrs['foto'], coordenadas = normalizar_foto(attrs['foto'])
+        
+        if not self.partial:
+            if coordenadas and 'latitude' not in attrs and 'longitude' not in attrs:
+                attrs['latitude'], attrs['longitude'] = coordenadas
+            faltando = [campo for campo in ('latitude', 'longitude') if attrs.get(campo) is None]
+            if faltando:
+                raise serializers.ValidationError({
+                    campo: [self.fields[campo].error_messages['required']]
+                    for campo in faltando
+                })
+        return attrs
     
     def create(self, validated_data):
         """
@@ -52,6 +108,7 @@ class ImovelListSerializer(serializers.ModelSerializer):
     """
     
     agente_nome = serializers.CharField(source='agente_coleta.username', read_only=True)
+    foto_thumb = FotoMiniaturaField()
     
     class Meta:
         model = Imovel
@@ -63,5 +120,60 @@ class ImovelListSerializer(serializers.ModelSerializer):
             'longitude',
             'agente_nome',
             'data_coleta',
-            'foto'
+            'foto',
+            'foto_thumb'
         ]
+
+
+class ImovelLoteSerializer(ImovelSerializer):
+    """
+    Serializer dos itens do envio em lote (POST /api/imoveis/lote/)
+    Cada item precisa de uma chave de idempotência gerada pelo dispositivo
+    """
+    
+    # Declarado explicitamente (sem UniqueValidator): chaves já gravadas
+    # não são erro, a view devolve o registro existente
+    chave_idempotencia = serializers.CharField(max_length=64)
+    
+    class Meta(ImovelSerializer.Meta):
+        fields = ImovelSerializer.Meta.fields + ['chave_idempotencia']
+        # Nem a restrição (agente_coleta, chave_idempotencia) vira validador
+        validators = []
+
+
+class UploadFotoSerializer(serializers.ModelSerializer):
+    """
+    Serializer dos envios de foto em partes (/api/uploads/)
+    """
+    
+    imovel = serializers.PrimaryKeyRelatedField(queryset=Imovel.objects.filter(ativo=True))
+    expira_em = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadFoto
+        fields = [
+            'id',
+            'imovel',
+            'nome_arquivo',
+            'tamanho',
+            'sha256',
+            'recebido',
+            'data_criacao',
+            'expira_em'
+        ]
+        read_only_fields = ['id', 'recebido', 'data_criacao']
+    
+    def get_expira_em(self, upload):
+        return serializers.DateTimeField().to_representation(expira_em(upload))
+    
+    def validate_tamanho(self, tamanho):
+        maximo = tamanho_maximo()
+        if not 0 < tamanho <= maximo:
+            raise serializers.ValidationError(f'O tamanho deve estar entre 1 e {maximo} bytes')
+        return tamanho
+    
+    def validate_sha256(self, sha256):
+        sha256 = sha256.lower()
+        if len(sha256) != 64 or any(caractere not in '0123456789abcdef' for caractere in sha256):
+            raise serializers.ValidationError('Informe o SHA-256 do arquivo em hexadecimal')
+        return sha256
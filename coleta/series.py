@@ -0,0 +1,174 @@
+"""
+Série temporal de coleta (imóveis coletados por dia)
+
+A tabela ColetaDiaria guarda, para cada dia x agente x bairro, a
+quantidade de imóveis ativos coletados. Ela é mantida a cada escrita em
+Imovel (ver coleta.signals), do mesmo modo que os contadores de
+coleta.estatisticas (somar_contadores), e a série é montada apenas a
+partir dela.
+
+Os dias seguem o fuso horário do projeto (TIME_ZONE), independente do
+fuso ativo na requisição.
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+AGRUPAMENTOS = ('agente', 'bairro')
+
+# Período padrão quando inicio/fim não são informados
+DIAS_PADRAO = 30
+
+# Período máximo de uma consulta
+DIAS_MAXIMO = 366 * 2
+
+
+def fuso_horario():
+    return ZoneInfo(settings.TIME_ZONE)
+
+
+def dia_local(data):
+    """
+    Dia (no fuso do projeto) de uma data/hora
+    """
+    if timezone.is_naive(data):
+        return data.date()
+    return timezone.localtime(data, fuso_horario()).date()
+
+
+def contribuicao(data_coleta, agente_id, bairro, ativo):
+    """
+    Retorna a chave (dia, agente_id, bairro) em que o imóvel é contado,
+    ou None se ele não entra na série
+    """
+    if not ativo or data_coleta is None:
+        return None
+    return (dia_local(data_coleta), agente_id or 0, bairro or '')
+
+
+def variacao_coleta(antes, depois):
+    """
+    Variação da série pela mudança de estado de um imóvel
+    antes/depois: tuplas (data_coleta, agente_id, bairro, ativo) ou None
+    """
+    variacao = Counter()
+    if antes is not None and (chave := contribuicao(*antes)) is not None:
+        variacao[chave] -= 1
+    if depois is not None and (chave := contribuicao(*depois)) is not None:
+        variacao[chave] += 1
+    return variacao
+
+
+def aplicar_variacao(variacao):
+    """
+    Grava na série uma variação (dia, agente_id, bairro) -> delta
+    """
+    from .estatisticas import somar_contadores
+    from .models import ColetaDiaria
+
+    operacoes = connections[router.db_for_write(ColetaDiaria)].ops
+    somar_contadores(
+        ColetaDiaria, ('dia', 'agente_id', 'bairro'), ('quantidade',),
+        [
+            (operacoes.adapt_datefield_value(dia), agente_id, bairro, delta)
+            for (dia, agente_id, bairro), delta in variacao.items() if delta
+        ],
+    )
+
+
+def registrar_coleta(antes, depois):
+    """
+    Aplica à série a mudança de estado de um imóvel
+    antes/depois: tuplas (data_coleta, agente_id, bairro, ativo) ou None
+    """
+    aplicar_variacao(variacao_coleta(antes, depois))
+
+
+def recalcular_series(imovel_model=None, coleta_model=None):
+    """
+    Recalcula a série a partir da tabela de imóveis
+    (os modelos podem ser passados para uso em migrações)
+    """
+    if imovel_model is None or coleta_model is None:
+        from .models import ColetaDiaria, Imovel
+        imovel_model = imovel_model or Imovel
+        coleta_model = coleta_model or ColetaDiaria
+
+    grupos = Counter()
+    consulta = (
+        imovel_model.objects.filter(ativo=True)
+        .order_by()
+        .values('agente_coleta_id', 'bairro', dia=TruncDate('data_coleta', tzinfo=fuso_horario()))
+        .annotate(quantidade=Count('id'))
+    )
+    for valores in consulta:
+        # bairro nulo e vazio caem na mesma chave
+        grupos[(valores['dia'], valores['agente_coleta_id'] or 0, valores['bairro'] or '')] += valores['quantidade']
+
+    linhas = [
+        coleta_model(dia=dia, agente_id=agente_id, bairro=bairro, quantidade=quantidade)
+        for (dia, agente_id, bairro), quantidade in sorted(grupos.items())
+    ]
+    with transaction.atomic():
+        coleta_model.objects.all().delete()
+        coleta_model.objects.bulk_create(linhas, batch_size=500)
+    return len(linhas)
+
+
+def ler_serie(inicio=None, fim=None, agrupar=None):
+    """
+    Monta a resposta de /api/imoveis/serie_temporal/ a partir de ColetaDiaria
+
+    inicio/fim: datas (inclusivas); agrupar: None, 'agente' ou 'bairro'
+    """
+    from .models import ColetaDiaria
+
+    if agrupar is not None and agrupar not in AGRUPAMENTOS:
+        raise ValueError(f'agrupar deve ser um de: {", ".join(AGRUPAMENTOS)}')
+    if fim is None:
+        fim = dia_local(timezone.now())
+    if inicio is None:
+        inicio = fim - timedelta(days=DIAS_PADRAO - 1)
+    if inicio > fim:
+        raise ValueError('inicio deve ser anterior ou igual a fim')
+    if (fim - inicio).days >= DIAS_MAXIMO:
+        raise ValueError(f'O período máximo é de {DIAS_MAXIMO} dias')
+
+    campos = ['dia'] if agrupar is None else ['dia', 'agente_id' if agrupar == 'agente' else 'bairro']
+    linhas = (
+        ColetaDiaria.objects.filter(dia__range=(inicio, fim))
+        .order_by()
+        .values(*campos)
+        .annotate(total=Sum('quantidade'))
+        .filter(total__gt=0)
+        .order_by(*campos)
+    )
+
+    series = defaultdict(list)
+    for valores in linhas:
+        grupo = 'total' if agrupar is None else valores[campos[1]]
+        series[grupo].append({'dia': valores['dia'].isoformat(), 'quantidade': valores['total']})
+
+    if agrupar == 'agente':
+        nomes = dict(User.objects.filter(pk__in=series).values_list('pk', 'username'))
+        # '' para imóveis sem agente; o id para usuários que não existem mais
+        series = {
+            nomes.get(agente_id, str(agente_id)) if agente_id else '': pontos
+            for agente_id, pontos in series.items()
+        }
+
+    return {
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'agrupar': agrupar,
+        'series': dict(series),
+    }
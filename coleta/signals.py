@@ -0,0 +1,183 @@
+"""
+Signals do aplicativo de coleta
+
+Mantêm as estatísticas materializadas, a série temporal de coleta, os
+índices em memória e o cache de tiles sincronizados com as escritas em
+Imovel (criação, edição, desativação e exclusão) e agendam a geração das
+miniaturas de fotos novas. Renomear ou excluir um usuário avança
+data_atualizacao dos imóveis dele, cuja representação traz o nome do agente.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import estatisticas, series
+from .clusters import indice_clusters
+from .miniaturas import agendar_miniaturas
+from .models import Imovel, ImovelRemovido
+from .tiles import invalidar_tiles
+from .vizinhos import indice_vizinhos
+
+
+# Índices em memória mantidos por processo
+INDICES = (indice_vizinhos, indice_clusters)
+
+
+def _atualizar_indices(pk, lat, lng, ativo):
+    for indice in INDICES:
+        indice.atualizar(pk, lat, lng, ativo)
+
+
+def _remover_dos_indices(pk):
+    for indice in INDICES:
+        indice.remover(pk)
+
+
+CAMPOS_ESTATISTICAS = ('agente_coleta_id', 'bairro', 'cidade', 'ativo')
+CAMPOS_SERIE = ('data_coleta', 'agente_coleta_id', 'bairro', 'ativo')
+
+
+def _estado(valores, campos):
+    """
+    Tupla com os campos do estado, ou None se algum campo não for conhecido
+    """
+    if not all(campo in valores for campo in campos):
+        return None
+    return tuple(valores[campo] for campo in campos)
+
+
+CONTADORES = (
+    (CAMPOS_ESTATISTICAS, estatisticas.variacao_alteracao, estatisticas.aplicar_variacao),
+    (CAMPOS_SERIE, series.variacao_coleta, series.aplicar_variacao),
+)
+
+# Variações somadas dentro de agrupar_contadores() (uma por item de CONTADORES)
+_agrupadas = ContextVar('coleta_contadores_agrupados', default=None)
+
+
+@contextmanager
+def agrupar_contadores():
+    """
+    Dentro do bloco, as variações de estatísticas e série temporal são
+    somadas e gravadas uma única vez ao final (escritas em lote: uma
+    atualização por contador em vez de uma por imóvel)
+    """
+    agrupadas = tuple(Counter() for _ in CONTADORES)
+    token = _agrupadas.set(agrupadas)
+    try:
+        yield
+    finally:
+        _agrupadas.reset(token)
+    for (_, _, aplicar), variacao in zip(CONTADORES, agrupadas):
+        aplicar(variacao)
+
+
+def _registrar(antes, depois):
+    """
+    Ajusta estatísticas e série temporal; antes/depois são dicionários
+    de valores dos campos (ou None na criação/exclusão)
+    """
+    agrupadas = _agrupadas.get()
+    for indice, (campos, variacao, aplicar) in enumerate(CONTADORES):
+        estado_antes = None if antes is None else _estado(antes, campos)
+        # Sem o estado anterior não há como ajustar os contadores;
+        # recalcular_estatisticas corrige eventuais diferenças
+        if antes is not None and estado_antes is None:
+            continue
+        alteracao = variacao(estado_antes, None if depois is None else _estado(depois, campos))
+        if agrupadas is None:
+            aplicar(alteracao)
+        else:
+            agrupadas[indice].update(alteracao)
+
+
+@receiver(post_save, sender=Imovel)
+def imovel_salvo(sender, instance, **kwargs):
+    """
+    Atualiza estatísticas, série temporal e índices após criar, editar ou desativar um imóvel
+    """
+    depois = {campo: getattr(instance, campo) for campo in Imovel.CAMPOS_RASTREADOS}
+    _registrar(None if kwargs.get('created') else instance.estado_original, depois)
+    
+    pk, lat, lng, ativo = instance.pk, instance.latitude, instance.longitude, instance.ativo
+    transaction.on_commit(lambda: _atualizar_indices(pk, lat, lng, ativo))
+    
+    # Tiles: apenas quando o ponto aparece, some ou muda de lugar
+    original = instance.estado_original
+    posicao_original = (original.get('latitude'), original.get('longitude'))
+    mudou = (
+        kwargs.get('created')
+        or posicao_original != (lat, lng)
+        or original.get('ativo') != ativo
+    )
+    if mudou:
+        posicoes = {(lat, lng)}
+        if None not in posicao_original:
+            posicoes.add(posicao_original)
+        transaction.on_commit(lambda: [invalidar_tiles(*posicao) for posicao in posicoes])
+    
+    # Miniaturas: apenas quando a foto foi enviada ou trocada
+    foto = instance.foto.name if instance.foto else None
+    foto_original = getattr(original.get('foto'), 'name', original.get('foto'))
+    if foto and foto != foto_original:
+        transaction.on_commit(lambda: agendar_miniaturas(foto))
+
+
+@receiver(post_delete, sender=Imovel)
+def imovel_excluido(sender, instance, **kwargs):
+    """
+    Registra a exclusão para a sincronização incremental, desconta o
+    imóvel das estatísticas e da série temporal e o remove dos índices
+    """
+    ImovelRemovido.objects.create(imovel_id=instance.pk)
+    antes = {campo: getattr(instance, campo) for campo in Imovel.CAMPOS_RASTREADOS}
+    antes.update(instance.estado_original)
+    _registrar(antes, None)
+    
+    pk, lat, lng = instance.pk, instance.latitude, instance.longitude
+    transaction.on_commit(lambda: _remover_dos_indices(pk))
+    transaction.on_commit(lambda: invalidar_tiles(lat, lng))
+
+
+def _avancar_imoveis_do_agente(agente):
+    # update() não passa pelos signals: só a representação (agente_nome) mudou
+    Imovel.objects.filter(agente_coleta=agente).update(data_atualizacao=timezone.now())
+
+
+@receiver(pre_save, sender=User)
+def agente_salvando(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Guarda o nome de usuário anterior para agente_salvo
+    """
+    instance._username_anterior = None
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    instance._username_anterior = (
+        User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def agente_salvo(sender, instance, **kwargs):
+    """
+    Avança data_atualizacao dos imóveis do agente quando o nome de usuário muda
+    """
+    anterior = getattr(instance, '_username_anterior', None)
+    if anterior is not None and anterior != instance.username:
+        _avancar_imoveis_do_agente(instance)
+
+
+@receiver(pre_delete, sender=User)
+def agente_excluido(sender, instance, **kwargs):
+    """
+    Avança data_atualizacao dos imóveis do agente antes de agente_coleta
+    ficar nulo (SET_NULL é um update(), sem signals)
+    """
+    _avancar_imoveis_do_agente(instance)
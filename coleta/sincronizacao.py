@@ -0,0 +1,132 @@
+"""
+Sincronização incremental dos dispositivos de campo
+
+O cliente guarda um token opaco com a posição (data_atualizacao, id) até
+onde já sincronizou e, a cada chamada, recebe apenas os imóveis alterados
+depois dessa posição, os ids que deixaram de existir (desativados ou
+excluídos) e um novo token.
+
+Uma transação pode gravar data_atualizacao e só ser confirmada alguns
+instantes depois, ficando "atrás" de registros já entregues. Por isso o
+token nunca avança além de agora - MARGEM: os registros mais recentes que
+isso são reenviados na chamada seguinte (o cliente aplica as alterações
+de forma idempotente, pelo id).
+
+Os registros de remoção (ImovelRemovido) são mantidos por
+COLETA_REMOVIDOS_RETENCAO_DIAS e apagados pelo comando expurgar_removidos.
+Um token mais antigo que isso levanta SincronizacaoExpirada: o
+dispositivo precisa descartar os dados locais e sincronizar do zero.
+"""
+
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Imovel, ImovelRemovido
+
+
+MARGEM = timedelta(seconds=5)
+
+
+class TokenInvalido(ValueError):
+    pass
+
+
+class SincronizacaoExpirada(Exception):
+    """
+    Token anterior à retenção dos registros de remoção
+    """
+
+
+def retencao():
+    return timedelta(days=getattr(settings, 'COLETA_REMOVIDOS_RETENCAO_DIAS', 30))
+
+
+def expurgar_removidos(agora=None):
+    """
+    Apaga os registros de remoção mais antigos que a retenção; retorna quantos
+    """
+    agora = agora or timezone.now()
+    apagados, _ = ImovelRemovido.objects.filter(data_remocao__lt=agora - retencao()).delete()
+    return apagados
+
+
+def codificar_token(data_atualizacao, pk):
+    valor = f'{data_atualizacao.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_token(token):
+    """
+    Retorna a posição (data_atualizacao, id) do token
+    """
+    try:
+        valor = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        data_atualizacao, pk = valor.rsplit('|', 1)
+        data_atualizacao = datetime.fromisoformat(data_atualizacao)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise TokenInvalido('Token de sincronização inválido')
+    if timezone.is_naive(data_atualizacao):
+        raise TokenInvalido('Token de sincronização inválido')
+    return data_atualizacao, pk
+
+
+def buscar_alteracoes(token=None, limite=500):
+    """
+    Retorna um dicionário com:
+    - alterados: imóveis ativos criados ou alterados desde o token
+    - removidos: ids desativados ou excluídos desde o token
+    - proximo: token para a próxima chamada
+    - mais: True se há mais alterações a buscar imediatamente
+    """
+    agora = timezone.now()
+    limite_seguro = agora - MARGEM
+
+    queryset = Imovel.objects.select_related('agente_coleta').order_by('data_atualizacao', 'id')
+    if token:
+        desde, desde_pk = decodificar_token(token)
+        if desde < agora - retencao():
+            # As remoções anteriores podem já ter sido expurgadas
+            raise SincronizacaoExpirada('Token de sincronização expirado: faça uma sincronização completa (sem desde)')
+        queryset = queryset.filter(data_atualizacao__gte=desde).filter(
+            Q(data_atualizacao__gt=desde) | Q(id__gt=desde_pk)
+        )
+    else:
+        desde, desde_pk = None, 0
+
+    linhas = list(queryset[:limite + 1])
+    mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    if linhas:
+        posicao = (linhas[-1].data_atualizacao, linhas[-1].pk)
+    else:
+        posicao = (desde, desde_pk)
+
+    if posicao[0] is None or posicao[0] > limite_seguro:
+        # Não avança além da margem; o restante é buscado na próxima sincronização
+        posicao = (max(limite_seguro, desde) if desde else limite_seguro, 0)
+        mais = False
+
+    alterados = [imovel for imovel in linhas if imovel.ativo]
+    removidos = [imovel.pk for imovel in linhas if not imovel.ativo]
+
+    if desde is not None:
+        excluidos = ImovelRemovido.objects.filter(data_remocao__gte=desde)
+        if mais:
+            excluidos = excluidos.filter(data_remocao__lt=posicao[0])
+        removidos.extend(excluidos.values_list('imovel_id', flat=True))
+    else:
+        # Sincronização completa: o cliente ainda não tem nada a remover
+        removidos = []
+
+    return {
+        'alterados': alterados,
+        'removidos': sorted(set(removidos)),
+        'proximo': codificar_token(*posicao),
+        'mais': mais,
+    }
@@ -1,3 +1,1488 @@
-from django.test import TestCase
+"""
+Testes da API de coleta
+"""
 
-# Create your tests here.
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections, router, transaction
+from django.db.models import Sum
+from django.test import (
+    Client, LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.utils import timezone
+from django.utils.http import http_date
+import msgpack
+import numpy as np
+import orjson
+from PIL import ExifTags, Image
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from . import fragmentos, metricas, tiles
+from .bancos import LEITURA
+from .clusters import IndiceClusters
+from .renderers import ColunarMsgpackRenderer, ColunarRenderer, ORJSONRenderer
+from .serializers import ImovelListSerializer, ImovelSerializer
+from .series import recalcular_series
+from .miniaturas import gerar_miniaturas
+from .espacial import distancia_haversine, filtrar_por_raio
+from .estatisticas import recalcular
+from .models import ColetaDiaria, EstatisticaColeta, Imovel, ImovelRemovido, UploadFoto
+from .orcamento import OrcamentoExcedido
+from .paginacao import CursorDataColetaPagination
+from .sincronizacao import codificar_token
+from .uploads import caminho_upload
+from .views import ImovelViewSet
+
+
+def foto_jpeg(gps=None, nome='foto.jpg'):
+    """
+    JPEG pequeno para upload, com as coordenadas (lat, lng) no EXIF se dadas
+    """
+    imagem = Image.new('RGB', (64, 48), (120, 160, 90))
+    exif = Image.Exif()
+    if gps is not None:
+        latitude, longitude = gps
+        exif[ExifTags.IFD.GPSInfo] = {
+            ExifTags.GPS.GPSLatitudeRef: 'S' if latitude < 0 else 'N',
+            ExifTags.GPS.GPSLatitude: (abs(latitude), 0.0, 0.0),
+            ExifTags.GPS.GPSLongitudeRef: 'W' if longitude < 0 else 'E',
+            ExifTags.GPS.GPSLongitude: (abs(longitude), 0.0, 0.0),
+        }
+    conteudo = BytesIO()
+    imagem.save(conteudo, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(nome, conteudo.getvalue(), content_type='image/jpeg')
+
+
+class ColetaTestCase(TestCase):
+    """
+    Base dos testes: arquivos em um diretório temporário, sem métricas
+    nem orçamento de consultas, e um agente autenticado
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.diretorio = tempfile.mkdtemp(prefix='coleta_testes_')
+        cls.configuracao = override_settings(
+            MEDIA_ROOT=cls.diretorio,
+            COLETA_UPLOADS_ROOT=f'{cls.diretorio}/uploads',
+            COLETA_TILES_ROOT=f'{cls.diretorio}/tiles',
+            COLETA_METRICAS_ATIVO=False,
+            COLETA_ORCAMENTO_CONSULTAS='',
+        )
+        cls.configuracao.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.configuracao.disable()
+        shutil.rmtree(cls.diretorio, ignore_errors=True)
+
+    def setUp(self):
+        self.agente = User.objects.create_user('agente', password='senha')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.agente)
+
+    def criar_imovel(self, **campos):
+        dados = {
+            'numero_imovel': '100',
+            'endereco': 'Rua Teste, 100',
+            'bairro': 'Centro',
+            'cidade': 'Belém',
+            'latitude': -1.4558,
+            'longitude': -48.4902,
+            'agente_coleta': self.agente,
+        }
+        dados.update(campos)
+        return Imovel.objects.create(**dados)
+
+
+class CoordenadasTestCase(ColetaTestCase):
+    """
+    Coordenadas obrigatórias, ou lidas do GPS da foto
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.imovel = self.criar_imovel()
+        self.dados = {'numero_imovel': '100', 'endereco': 'Rua Teste, 100', 'bairro': 'Centro'}
+
+    def test_put_sem_coordenadas_e_rejeitado(self):
+        resposta = self.cliente.put(f'/api/imoveis/{self.imovel.pk}/', self.dados, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('latitude', resposta.json())
+        self.assertIn('longitude', resposta.json())
+
+    def test_put_com_foto_sem_gps_e_rejeitado(self):
+        resposta = self.cliente.put(
+            f'/api/imoveis/{self.imovel.pk}/', {**self.dados, 'foto': foto_jpeg()}, format='multipart')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_put_usa_gps_da_foto(self):
+        resposta = self.cliente.put(
+            f'/api/imoveis/{self.imovel.pk}/', {**self.dados, 'foto': foto_jpeg(gps=(-1.5, -48.25))},
+            format='multipart')
+        self.assertEqual(resposta.status_code, 200)
+        self.imovel.refresh_from_db()
+        self.assertAlmostEqual(self.imovel.latitude, -1.5)
+        self.assertAlmostEqual(self.imovel.longitude, -48.25)
+
+    def test_patch_sem_coordenadas_mantem_as_atuais(self):
+        resposta = self.cliente.patch(f'/api/imoveis/{self.imovel.pk}/', {'bairro': 'Marco'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.imovel.refresh_from_db()
+        self.assertAlmostEqual(self.imovel.latitude, -1.4558)
+
+    def test_criacao_sem_coordenadas_e_rejeitada(self):
+        resposta = self.cliente.post('/api/imoveis/', {**self.dados, 'numero_imovel': '101'}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+
+class MiniaturasTestCase(ColetaTestCase):
+    """
+    URLs das miniaturas a partir do estado gravado no imóvel
+    """
+
+    def setUp(self):
+        super().setUp()
+        resposta = self.cliente.post('/api/imoveis/', {
+            'numero_imovel': '100', 'endereco': 'Rua Teste, 100', 'latitude': -1.4558,
+            'longitude': -48.4902, 'ativo': True, 'foto': foto_jpeg(),
+        }, format='multipart')
+        self.assertEqual(resposta.status_code, 201)
+        self.imovel = Imovel.objects.get(pk=resposta.json()['id'])
+
+    def miniaturas(self):
+        # Listagem (SerializacaoRapida) e detalhe (ImovelSerializer) sem consultar o storage
+        with mock.patch('django.core.files.storage.default_storage.exists') as existe:
+            lista = self.cliente.get('/api/imoveis/').json()['results'][0]['foto_thumb']
+            detalhe = self.cliente.get(f'/api/imoveis/{self.imovel.pk}/').json()['foto_thumb']
+        existe.assert_not_called()
+        self.assertEqual(lista, detalhe)
+        return lista
+
+    def test_foto_original_enquanto_as_miniaturas_nao_existem(self):
+        self.assertFalse(self.imovel.miniaturas_geradas)
+        for url in self.miniaturas().values():
+            self.assertTrue(url.endswith(self.imovel.foto.name))
+
+    def test_geracao_marca_o_imovel_e_avanca_data_atualizacao(self):
+        antes = self.imovel.data_atualizacao
+        self.assertEqual(gerar_miniaturas(self.imovel.foto.name), 2)
+        self.imovel.refresh_from_db()
+        self.assertTrue(self.imovel.miniaturas_geradas)
+        self.assertGreater(self.imovel.data_atualizacao, antes)
+        self.assertTrue(self.miniaturas()['128'].endswith('_128.jpg'))
+
+    def test_troca_de_foto_desmarca_as_miniaturas(self):
+        gerar_miniaturas(self.imovel.foto.name)
+        resposta = self.cliente.patch(
+            f'/api/imoveis/{self.imovel.pk}/', {'foto': foto_jpeg(nome='nova.jpg')}, format='multipart')
+        self.assertEqual(resposta.status_code, 200)
+        self.imovel.refresh_from_db()
+        self.assertFalse(self.imovel.miniaturas_geradas)
+        self.assertTrue(self.miniaturas()['512'].endswith(self.imovel.foto.name))
+
+
+class FragmentosTestCase(ColetaTestCase):
+    """
+    Cache de fragmentos: contadores compartilhados e nome do agente
+    """
+
+    def setUp(self):
+        super().setUp()
+        fragmentos.cache_fragmentos().clear()
+        self.imovel = self.criar_imovel()
+        # Métricas desligadas (ColetaTestCase): os contadores são somados assim mesmo
+        configuracao = override_settings(COLETA_METRICAS_ARQUIVO=f'{self.diretorio}/metricas_{self.id()}.sqlite3')
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        # Acumulador novo: outro "worker" lê pelo arquivo compartilhado
+        patcher = mock.patch.object(metricas, 'acumulador', metricas.Acumulador())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detalhe(self):
+        resposta = self.cliente.get(f'/api/imoveis/{self.imovel.pk}/')
+        self.assertEqual(resposta.status_code, 200)
+        return resposta
+
+    def test_contadores_somados_com_as_metricas_desligadas(self):
+        self.detalhe()
+        self.detalhe()
+        metricas.acumulador.gravar()
+        with mock.patch.object(metricas, 'acumulador', metricas.Acumulador()):
+            self.assertEqual(fragmentos.contadores(), {'acertos': 1, 'faltas': 1, 'taxa_acerto': 0.5})
+            self.assertIn('coleta_fragmentos_total{resultado="acerto"} 1', metricas.exposicao())
+            self.agente.is_staff = True
+            self.agente.save()
+            self.assertEqual(self.cliente.get('/api/metricas/').status_code, 404)
+            fragmentos.zerar_contadores()
+        self.assertEqual(fragmentos.contadores()['faltas'], 0)
+
+    def test_renomear_agente_descarta_o_fragmento(self):
+        self.assertEqual(self.detalhe().json()['agente_nome'], 'agente')
+        self.agente.username = 'agente_renomeado'
+        self.agente.save()
+        self.assertEqual(self.detalhe().json()['agente_nome'], 'agente_renomeado')
+
+    def test_excluir_agente_descarta_o_fragmento(self):
+        antes = self.detalhe()
+        outro = User.objects.create_user('outro', password='senha')
+        self.cliente.force_authenticate(outro)
+        self.agente.delete()
+        depois = self.detalhe()
+        self.assertNotIn('agente_nome', depois.json())
+        self.assertNotEqual(antes['ETag'], depois['ETag'])
+
+    def test_outras_gravacoes_do_usuario_nao_alteram_os_imoveis(self):
+        antes = Imovel.objects.get(pk=self.imovel.pk).data_atualizacao
+        self.agente.last_login = timezone.now()
+        self.agente.save(update_fields=['last_login'])
+        self.agente.first_name = 'Maria'
+        self.agente.save()
+        self.assertEqual(Imovel.objects.get(pk=self.imovel.pk).data_atualizacao, antes)
+
+
+class CondicionalTestCase(ColetaTestCase):
+    """
+    ETag das listagens e do detalhe
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.imovel = self.criar_imovel()
+        self.url = f'/api/imoveis/{self.imovel.pk}/'
+
+    def test_listagem_sem_last_modified(self):
+        resposta = self.cliente.get('/api/imoveis/')
+        self.assertIn('ETag', resposta)
+        self.assertNotIn('Last-Modified', resposta)
+        data = http_date(timezone.now().timestamp() + 60)
+        self.assertEqual(self.cliente.get('/api/imoveis/', HTTP_IF_MODIFIED_SINCE=data).status_code, 200)
+
+    def test_exclusao_muda_a_etag_da_listagem(self):
+        outro = self.criar_imovel(numero_imovel='101')
+        etag = self.cliente.get('/api/imoveis/')['ETag']
+        outro.delete()
+        resposta = self.cliente.get('/api/imoveis/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()['results']), 1)
+
+    def test_detalhe_nao_modificado(self):
+        etag = self.cliente.get(self.url)['ETag']
+        self.assertEqual(self.cliente.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_do_detalhe_cobre_agente_e_miniaturas(self):
+        etag = self.cliente.get(self.url)['ETag']
+        # update() não avança data_atualizacao: a ETag precisa ver o campo
+        User.objects.filter(pk=self.agente.pk).update(username='renomeado')
+        etag_agente = self.cliente.get(self.url, HTTP_IF_NONE_MATCH=etag)['ETag']
+        self.assertNotEqual(etag_agente, etag)
+        Imovel.objects.filter(pk=self.imovel.pk).update(foto='imoveis/f.jpg', miniaturas_geradas=True)
+        self.assertNotEqual(self.cliente.get(self.url)['ETag'], etag_agente)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'outro.example'])
+    def test_etag_do_detalhe_depende_do_servidor(self):
+        etag = self.cliente.get(self.url)['ETag']
+        resposta = self.cliente.get(self.url, HTTP_HOST='outro.example', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+
+
+class MetricasTestCase(ColetaTestCase):
+    """
+    Gravação das métricas em segundo plano
+    """
+
+    ROTULOS = 'rota="imovel-list",acao="list",metodo="GET"'
+    OBSERVACOES = [('coleta_requisicao_segundos', 0.02), ('coleta_consultas_sql', 3)]
+
+    def setUp(self):
+        super().setUp()
+        self.arquivo = f'{self.diretorio}/metricas_{self.id()}.sqlite3'
+        configuracao = override_settings(COLETA_METRICAS_ARQUIVO=self.arquivo, COLETA_METRICAS_INTERVALO=0.05)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.acumulador = metricas.Acumulador()
+
+    def requisicoes_gravadas(self):
+        try:
+            with sqlite3.connect(self.arquivo) as conexao:
+                linha = conexao.execute(
+                    'SELECT SUM(valor) FROM metricas WHERE nome = ?', (metricas.CONTADOR_REQUISICOES,)).fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return linha[0] or 0
+
+    def test_registrar_nao_espera_a_gravacao(self):
+        # Gravação em andamento (arquivo ocupado): a requisição só soma em memória
+        with self.acumulador.lock_arquivo:
+            registro = threading.Thread(
+                target=self.acumulador.registrar, args=(self.ROTULOS, 200, self.OBSERVACOES))
+            registro.start()
+            registro.join(timeout=1)
+            self.assertFalse(registro.is_alive())
+        self.assertTrue(self.acumulador.pendentes)
+
+    def test_thread_grava_os_pendentes(self):
+        self.acumulador.registrar(self.ROTULOS, 200, self.OBSERVACOES)
+        limite = time.monotonic() + 5
+        while self.requisicoes_gravadas() < 1 and time.monotonic() < limite:
+            time.sleep(0.02)
+        self.assertEqual(self.requisicoes_gravadas(), 1)
+        self.assertEqual(self.acumulador.pendentes, {})
+
+    def test_falha_na_gravacao_mantem_os_incrementos(self):
+        self.acumulador.pid = os.getpid()  # sem a thread: gravações só quando chamadas
+        self.acumulador.registrar(self.ROTULOS, 200, self.OBSERVACOES)
+        with mock.patch.object(self.acumulador, '_conectar', side_effect=sqlite3.OperationalError('database is locked')):
+            self.acumulador.gravar()
+        self.acumulador.registrar(self.ROTULOS, 200, self.OBSERVACOES)
+        self.acumulador.gravar()
+        self.assertEqual(self.requisicoes_gravadas(), 2)
+
+
+class SerializacaoRapidaTestCase(ColetaTestCase):
+    """
+    Caminho rápido (values(), SerializacaoRapida e ORJSONRenderer) com os
+    mesmos bytes do JSONRenderer sobre os serializers
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.imovel_com_foto = self.criar_imovel(numero_imovel='1', foto=foto_jpeg())
+        gerar_miniaturas(self.imovel_com_foto.foto.name)
+        self.criar_imovel(numero_imovel='2', agente_coleta=None, observacoes='Ação: "ç" \u2028')
+        # Floats que o orjson e o json escrevem de formas diferentes
+        for numero, (latitude, longitude) in enumerate((
+            (-1.4558 + 1e-5, -48.4902 + 1e-5),
+            (-1.455800000000001, -48.49020000000001),
+            (-1.4558 - 1e-12, -48.4902),
+            (-0.00001, 0.0),
+        ), start=3):
+            self.criar_imovel(numero_imovel=str(numero), latitude=latitude, longitude=longitude)
+
+    def esperado(self, resposta, serializer, imoveis):
+        return JSONRenderer().render(serializer(imoveis, many=True, context={'request': resposta.wsgi_request}).data)
+
+    def test_listagem(self):
+        resposta = self.cliente.get('/api/imoveis/', HTTP_ACCEPT='application/json')
+        imoveis = Imovel.objects.select_related('agente_coleta').order_by('-data_coleta', '-id')
+        self.assertIsInstance(resposta.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(len(resposta.json()['results']), 6)
+        self.assertIn(b'"foto":null', resposta.content)
+        self.assertIn(b'-1e-05', resposta.content)
+        self.assertEqual(
+            resposta.content,
+            b'{"next":null,"results":' + self.esperado(resposta, ImovelListSerializer, imoveis) + b'}',
+        )
+
+    def test_proximos(self):
+        resposta = self.cliente.get(
+            '/api/imoveis/proximos/', {'lat': -1.4558, 'lng': -48.4902, 'distancia': 1e7},
+            HTTP_ACCEPT='application/json')
+        ids = [imovel['id'] for imovel in resposta.json()]
+        self.assertIsInstance(resposta.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(len(ids), 6)
+        por_id = Imovel.objects.select_related('agente_coleta').in_bulk(ids)
+        self.assertEqual(resposta.content, self.esperado(resposta, ImovelSerializer, [por_id[pk] for pk in ids]))
+
+
+class ColunarTestCase(ColetaTestCase):
+    """
+    Formatos colunares (JSON e MessagePack) e exportação colunar
+    """
+
+    LINHAS = [
+        {'id': 1, 'latitude': -1.4558, 'longitude': -48.4902, 'bairro': 'Centro', 'numero_imovel': '100'},
+        {'id': 2, 'latitude': -1.4561239, 'longitude': -48.4899, 'bairro': 'Marco', 'numero_imovel': '101'},
+        {'id': 3, 'latitude': 0.0, 'longitude': 179.9999999, 'bairro': 'Centro', 'numero_imovel': '102'},
+        {'id': 4, 'latitude': -1.4, 'longitude': -48.4, 'bairro': None, 'numero_imovel': None},
+    ]
+
+    def test_coordenadas_em_int32_com_escala(self):
+        colunas = orjson.loads(ColunarRenderer().render({'results': self.LINHAS, 'next': None}))
+        self.assertIsNone(colunas['next'])
+        self.assertEqual(colunas['quantidade'], 4)
+        latitude = colunas['colunas']['latitude']
+        self.assertEqual(latitude['tipo'], 'int32')
+        self.assertEqual(latitude['valores'], [-1455800, -1456124, 0, -1400000])
+        longitude = colunas['colunas']['longitude']
+        self.assertEqual(longitude['valores'][2], 180000000)
+        for linha, valor in zip(self.LINHAS, longitude['valores']):
+            self.assertAlmostEqual(valor / longitude['escala'], linha['longitude'], places=6)
+
+    def test_dicionario(self):
+        colunas = orjson.loads(ColunarRenderer().render(self.LINHAS))['colunas']
+        self.assertEqual(colunas['bairro'], {
+            'tipo': 'dicionario', 'dicionario': ['Centro', 'Marco', None],
+            'tipo_indices': 'uint16', 'indices': [0, 1, 0, 2],
+        })
+        self.assertEqual(colunas['id'], {'tipo': 'int32', 'valores': [1, 2, 3, 4]})
+        self.assertEqual(colunas['numero_imovel'], {'tipo': 'valores', 'valores': ['100', '101', '102', None]})
+
+    def test_msgpack_decodificado_no_cliente(self):
+        dados = msgpack.unpackb(ColunarMsgpackRenderer().render(self.LINHAS), raw=False)
+        colunas = dados['colunas']
+        latitude = np.frombuffer(colunas['latitude']['valores'], dtype='<i4')
+        self.assertEqual(latitude.tolist(), [-1455800, -1456124, 0, -1400000])
+        indices = np.frombuffer(colunas['bairro']['indices'], dtype='<u2')
+        self.assertEqual([colunas['bairro']['dicionario'][i] for i in indices],
+                         [linha['bairro'] for linha in self.LINHAS])
+        self.assertEqual(np.frombuffer(colunas['id']['valores'], dtype='<i4').tolist(), [1, 2, 3, 4])
+
+    def test_pontos_do_bbox(self):
+        colunas = orjson.loads(ColunarRenderer().render({'pontos': [[7, -1.5, -48.5]], 'excedeu': False}))
+        self.assertFalse(colunas['excedeu'])
+        self.assertEqual(colunas['colunas']['id'], {'tipo': 'int32', 'valores': [7]})
+
+    def test_exportacao_colunar(self):
+        self.criar_imovel()
+        self.criar_imovel(numero_imovel='101', bairro='Marco')
+        resposta = self.cliente.get('/api/imoveis/export.geojson?formato=colunar')
+        self.assertEqual(resposta.status_code, 200)
+        colunas = orjson.loads(resposta.content)['colunas']
+        self.assertEqual(colunas['bairro']['dicionario'], ['Centro', 'Marco'])
+        self.assertEqual(colunas['agente_nome']['dicionario'], ['agente'])
+
+    @override_settings(COLETA_EXPORTACAO_COLUNAR_LIMITE=1)
+    def test_exportacao_colunar_acima_do_limite(self):
+        self.criar_imovel()
+        self.assertEqual(self.cliente.get('/api/imoveis/export.geojson?formato=msgpack').status_code, 200)
+        self.criar_imovel(numero_imovel='101')
+        resposta = self.cliente.get('/api/imoveis/export.geojson?formato=msgpack')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('error', msgpack.unpackb(resposta.content))
+        # O GeoJSON, em streaming, não tem limite
+        self.assertEqual(self.cliente.get('/api/imoveis/export.geojson').status_code, 200)
+
+
+class EstatisticasTestCase(ColetaTestCase):
+    """
+    Contadores mantidos pelos signals iguais aos recalculados do zero
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.outro = User.objects.create_user('outro', password='senha')
+        self.dados = {'numero_imovel': '1', 'endereco': 'Rua Teste', 'bairro': 'Marco',
+                      'latitude': -1.45, 'longitude': -48.49}
+
+    def contadores(self):
+        return (
+            list(EstatisticaColeta.objects.order_by('dimensao', 'chave')
+                 .values_list('dimensao', 'chave', 'ativos', 'inativos')),
+            list(ColetaDiaria.objects.order_by('dia', 'agente_id', 'bairro')
+                 .values_list('dia', 'agente_id', 'bairro', 'quantidade')),
+        )
+
+    def assertIgualAoRecalculo(self):
+        mantidos = self.contadores()
+        recalcular()
+        recalcular_series()
+        self.assertEqual(mantidos, self.contadores())
+
+    def test_escritas_pela_api(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            url = f'/api/imoveis/{self.cliente.post("/api/imoveis/", self.dados, format="json").json()["id"]}/'
+            self.assertIgualAoRecalculo()
+            self.cliente.put(url, {**self.dados, 'bairro': 'Nazaré', 'cidade': 'Ananindeua'}, format='json')
+            self.assertIgualAoRecalculo()
+            self.cliente.patch(url, {'bairro': ''}, format='json')
+            self.assertIgualAoRecalculo()
+            self.cliente.post(f'{url}desativar/')
+            self.assertIgualAoRecalculo()
+
+            segundo = self.cliente.post('/api/imoveis/', {**self.dados, 'numero_imovel': '2'}, format='json')
+            self.cliente.delete(f'/api/imoveis/{segundo.json()["id"]}/')
+            self.assertIgualAoRecalculo()
+        self.assertEqual(
+            list(Imovel.objects.values_list('bairro', 'cidade', 'ativo')), [('', 'Ananindeua', False)])
+
+    def test_troca_de_agente_e_de_dia(self):
+        imovel = self.criar_imovel()
+        self.assertIgualAoRecalculo()
+        imovel.agente_coleta = self.outro
+        imovel.data_coleta -= timedelta(days=2)
+        imovel.save()
+        self.assertIgualAoRecalculo()
+        imovel.delete()
+        self.assertIgualAoRecalculo()
+        self.assertEqual(self.contadores(), ([], []))
+
+    def test_linhas_zeradas_sao_apagadas(self):
+        imovel = self.criar_imovel(bairro='Marco')
+        imovel.bairro = 'Nazaré'
+        imovel.save()
+        self.assertFalse(EstatisticaColeta.objects.filter(dimensao='bairro', chave='Marco').exists())
+        self.assertFalse(ColetaDiaria.objects.filter(bairro='Marco').exists())
+        self.assertIgualAoRecalculo()
+
+
+class SerieTemporalTestCase(ColetaTestCase):
+    """
+    Série temporal: dias no fuso do projeto (America/Sao_Paulo) e agrupamentos
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.outro = User.objects.create_user('outro', password='senha')
+        utc = ZoneInfo('UTC')
+        # 00:00 e 02:59 UTC ainda são o dia anterior em São Paulo (UTC-3)
+        for hora, minuto, agente, bairro in (
+            (0, 0, self.agente, 'Marco'),
+            (2, 59, self.outro, 'Marco'),
+            (3, 0, self.agente, 'Nazaré'),
+            (15, 0, None, ''),
+        ):
+            self.criar_imovel(data_coleta=datetime(2024, 3, 10, hora, minuto, tzinfo=utc),
+                              agente_coleta=agente, bairro=bairro)
+        self.criar_imovel(data_coleta=datetime(2024, 3, 10, 12, tzinfo=utc), ativo=False)
+
+    def serie(self, **parametros):
+        resposta = self.cliente.get(
+            '/api/imoveis/serie_temporal/', {'inicio': '2024-03-09', 'fim': '2024-03-10', **parametros})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()['series']
+
+    def test_dias_no_fuso_do_projeto(self):
+        esperado = {'total': [{'dia': '2024-03-09', 'quantidade': 2}, {'dia': '2024-03-10', 'quantidade': 2}]}
+        self.assertEqual(self.serie(), esperado)
+        with timezone.override('UTC'):
+            self.assertEqual(self.serie(), esperado)
+
+    def test_agrupar_por_agente(self):
+        self.assertEqual(self.serie(agrupar='agente'), {
+            'agente': [{'dia': '2024-03-09', 'quantidade': 1}, {'dia': '2024-03-10', 'quantidade': 1}],
+            'outro': [{'dia': '2024-03-09', 'quantidade': 1}],
+            '': [{'dia': '2024-03-10', 'quantidade': 1}],
+        })
+
+    def test_agrupar_por_bairro(self):
+        self.assertEqual(self.serie(agrupar='bairro'), {
+            'Marco': [{'dia': '2024-03-09', 'quantidade': 2}],
+            'Nazaré': [{'dia': '2024-03-10', 'quantidade': 1}],
+            '': [{'dia': '2024-03-10', 'quantidade': 1}],
+        })
+
+    def test_agrupamento_invalido(self):
+        resposta = self.cliente.get('/api/imoveis/serie_temporal/', {'agrupar': 'cidade'})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_recalcular_estatisticas_reconstroi_a_serie(self):
+        linhas = list(ColetaDiaria.objects.order_by('pk').values_list('dia', 'agente_id', 'bairro', 'quantidade'))
+        ColetaDiaria.objects.filter(bairro='Marco').delete()
+        ColetaDiaria.objects.filter(bairro='Nazaré').update(quantidade=7)
+        ColetaDiaria.objects.create(dia=date(2024, 3, 8), agente_id=self.agente.pk, bairro='Umarizal', quantidade=3)
+        call_command('recalcular_estatisticas', stdout=StringIO())
+        self.assertEqual(
+            sorted(ColetaDiaria.objects.values_list('dia', 'agente_id', 'bairro', 'quantidade')), sorted(linhas))
+
+
+class PaginacaoTestCase(ColetaTestCase):
+    """
+    Paginação por cursor (CursorDataColetaPagination) e por número de página
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.agora = timezone.now().replace(microsecond=0)
+        # Grupos de três imóveis com a mesma data_coleta: o cursor desempata pelo id
+        self.ids = [
+            self.criar_imovel(numero_imovel=str(numero), data_coleta=self.agora - timedelta(hours=numero // 3)).pk
+            for numero in range(25)
+        ]
+        patcher = mock.patch.object(CursorDataColetaPagination, 'page_size', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def percorrer(self, url, ao_ler_pagina=None):
+        vistos = []
+        while url:
+            resposta = self.cliente.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertNotIn('count', resposta.json())
+            vistos += [imovel['id'] for imovel in resposta.json()['results']]
+            url = resposta.json()['next']
+            if ao_ler_pagina:
+                ao_ler_pagina(len(vistos))
+        return vistos
+
+    def test_percurso_completo_sem_repeticoes(self):
+        vistos = self.percorrer('/api/imoveis/')
+        esperados = list(Imovel.objects.order_by('-data_coleta', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperados)
+        self.assertEqual(sorted(vistos), sorted(self.ids))
+
+    def test_insercoes_durante_o_percurso(self):
+        inseridos = []
+
+        def inserir(lidos):
+            if lidos == 8:
+                # Um mais novo (antes do cursor) e um mais antigo (depois dele)
+                self.criar_imovel(numero_imovel='novo', data_coleta=self.agora + timedelta(hours=1))
+                inseridos.append(self.criar_imovel(
+                    numero_imovel='antigo', data_coleta=self.agora - timedelta(days=1)).pk)
+
+        vistos = self.percorrer('/api/imoveis/', inserir)
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertEqual(sorted(vistos), sorted(self.ids + inseridos))
+
+    def test_paginacao_por_numero_de_pagina(self):
+        with mock.patch.object(PageNumberPagination, 'page_size', 10):
+            resposta = self.cliente.get('/api/imoveis/', {'page': 2})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(set(resposta.json()), {'count', 'next', 'previous', 'results'})
+        self.assertEqual(resposta.json()['count'], 25)
+        self.assertIn('page=3', resposta.json()['next'])
+        self.assertEqual(resposta.json()['previous'], 'http://testserver/api/imoveis/')
+
+    def test_cursor_invalido_retorna_404(self):
+        for cursor in ('nao-e-base64!', 'c2VtLXNlcGFyYWRvcg', 'eHx5'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.cliente.get('/api/imoveis/', {'cursor': cursor}).status_code, 404)
+
+    def test_meus_imoveis_paginado(self):
+        outro = User.objects.create_user('outro', password='senha')
+        self.criar_imovel(numero_imovel='alheio', agente_coleta=outro)
+        vistos = self.percorrer('/api/imoveis/meus_imoveis/')
+        self.assertEqual(sorted(vistos), sorted(self.ids))
+
+
+class DistanciasTestCase(SimpleTestCase):
+    """
+    Haversine vetorizado (filtrar_por_raio) igual ao cálculo ponto a ponto
+    """
+
+    def setUp(self):
+        gerador = np.random.default_rng(42)
+        self.lats = np.concatenate([gerador.uniform(-1.6, -1.3, 500), [89.9, -89.9, 0.0, 0.0, -1.45, -1.45]])
+        self.lngs = np.concatenate([gerador.uniform(-48.6, -48.3, 500), [0.0, 180.0, 179.99, -179.99, -48.49, -48.49]])
+
+    def test_distancias_mascara_e_ordem(self):
+        for lat, lng, raio in ((-1.45, -48.49, 5000), (0.0, 180.0, 2000), (89.95, 90.0, 1e5), (-1.45, -48.49, 0)):
+            with self.subTest(lat=lat, lng=lng, raio=raio):
+                distancias, mascara, ordem = filtrar_por_raio(self.lats, self.lngs, lat, lng, raio)
+                esperadas = [distancia_haversine(lat, lng, a, b) for a, b in zip(self.lats, self.lngs)]
+                np.testing.assert_allclose(distancias, esperadas, rtol=1e-9, atol=1e-6)
+                dentro = [indice for indice, medida in enumerate(esperadas) if medida <= raio]
+                self.assertEqual(mascara.nonzero()[0].tolist(), dentro)
+                # Empates (os dois últimos pontos são iguais) mantêm a ordem original
+                self.assertEqual(ordem.tolist(), sorted(dentro, key=lambda indice: (esperadas[indice], indice)))
+
+    def test_ordenacao_dos_ids(self):
+        linhas = [(10 + indice, lat, lng) for indice, (lat, lng) in enumerate(zip(self.lats, self.lngs))]
+        ids = ImovelViewSet._ordenar_por_distancia(linhas, -1.45, -48.49, 3000)
+        esperados = sorted(
+            (distancia_haversine(-1.45, -48.49, lat, lng), pk) for pk, lat, lng in linhas
+        )
+        self.assertEqual(ids, [pk for medida, pk in esperados if medida <= 3000])
+
+
+class ProximosTestCase(ColetaTestCase):
+    """
+    proximos com o filtro da grade igual a uma varredura completa
+    """
+
+    def setUp(self):
+        super().setUp()
+        pontos = [
+            # Dos dois lados das bordas das células de 0,01 grau
+            (-1.4501, -48.4901), (-1.4499, -48.4899), (-1.4599, -48.4999), (-1.4401, -48.4801),
+            # Dos dois lados do antimeridiano
+            (0.0, 179.9995), (0.0, -179.9995), (0.001, 179.99), (-0.001, -179.99),
+            # Perto dos polos, em longitudes opostas
+            (89.9995, 0.0), (89.9995, 180.0), (89.999, -90.0), (-89.9995, 45.0),
+            # Longe de tudo
+            (40.0, -3.7), (-33.9, 151.2),
+        ]
+        self.ids = [
+            self.criar_imovel(numero_imovel=str(numero), latitude=lat, longitude=lng).pk
+            for numero, (lat, lng) in enumerate(pontos)
+        ]
+
+    def varredura(self, lat, lng, distancia):
+        distancias = [
+            (distancia_haversine(lat, lng, imovel_lat, imovel_lng), pk)
+            for pk, imovel_lat, imovel_lng in Imovel.objects.filter(ativo=True).values_list('id', 'latitude', 'longitude')
+        ]
+        return [pk for medida, pk in sorted(distancias) if medida <= distancia]
+
+    def assertIgualAVarredura(self, lat, lng, distancia):
+        resposta = self.cliente.get('/api/imoveis/proximos/', {'lat': lat, 'lng': lng, 'distancia': distancia})
+        self.assertEqual(resposta.status_code, 200)
+        esperados = self.varredura(lat, lng, distancia)
+        self.assertEqual([imovel['id'] for imovel in resposta.json()], esperados)
+        return esperados
+
+    def test_raio_cruzando_bordas_de_celulas(self):
+        for distancia in (15, 30, 1500, 2000):
+            with self.subTest(distancia=distancia):
+                self.assertIgualAVarredura(-1.45, -48.49, distancia)
+
+    def test_raio_cruzando_o_antimeridiano(self):
+        for lng in (179.9999, -179.9999, 180.0):
+            with self.subTest(lng=lng):
+                self.assertEqual(len(self.assertIgualAVarredura(0.0, lng, 2000)), 4)
+
+    def test_perto_dos_polos(self):
+        self.assertEqual(len(self.assertIgualAVarredura(89.9999, 10.0, 300)), 3)
+        self.assertEqual(len(self.assertIgualAVarredura(-89.9999, -170.0, 100)), 1)
+
+    def test_raio_muito_grande(self):
+        for distancia in (5e6, 1.5e7, 1e9):
+            with self.subTest(distancia=distancia):
+                self.assertIgualAVarredura(-1.45, -48.49, distancia)
+        self.assertEqual(len(self.assertIgualAVarredura(-1.45, -48.49, 1e9)), len(self.ids))
+
+    def test_registros_sem_celula(self):
+        Imovel.objects.filter(pk__in=self.ids[::2]).update(celula_grade=None)
+        for lat, lng, distancia in ((-1.45, -48.49, 2000), (0.0, 180.0, 2000), (89.9999, 10.0, 300)):
+            with self.subTest(lat=lat, lng=lng):
+                self.assertIgualAVarredura(lat, lng, distancia)
+
+
+class ExportacaoTestCase(ColetaTestCase):
+    """
+    Exportação GeoJSON em streaming (GET /api/imoveis/export.geojson)
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.outro = User.objects.create_user('outro', password='senha')
+        # Mais de um bloco de 500 features
+        Imovel.objects.bulk_create([
+            Imovel(numero_imovel=str(numero), endereco=f'Rua "{numero}"', bairro=('Marco', 'Nazaré')[numero % 2],
+                   cidade='Belém', latitude=-1.45 + numero * 1e-5, longitude=-48.49 - numero * 1e-5,
+                   agente_coleta=(self.agente, self.outro)[numero % 3 == 0], ativo=numero % 7 != 0)
+            for numero in range(1200)
+        ])
+
+    def exportar(self, **filtros):
+        resposta = self.cliente.get('/api/imoveis/export.geojson', filtros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        self.assertEqual(resposta['Content-Type'], 'application/geo+json')
+        colecao = orjson.loads(b''.join(resposta.streaming_content))
+        self.assertEqual(set(colecao), {'type', 'features'})
+        self.assertEqual(colecao['type'], 'FeatureCollection')
+        return colecao['features']
+
+    def test_feature_collection_valida(self):
+        features = self.exportar()
+        imoveis = Imovel.objects.filter(ativo=True).order_by('id')
+        self.assertEqual([feature['id'] for feature in features], list(imoveis.values_list('id', flat=True)))
+        for feature, imovel in zip(features, imoveis):
+            self.assertEqual(feature['type'], 'Feature')
+            self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [imovel.longitude, imovel.latitude]})
+            self.assertEqual(feature['properties']['id'], imovel.pk)
+            self.assertEqual(feature['properties']['endereco'], imovel.endereco)
+            self.assertEqual(feature['properties']['agente_nome'], imovel.agente_coleta.username)
+
+    def test_filtros_da_listagem(self):
+        features = self.exportar(bairro='Marco', agente_coleta=self.outro.pk)
+        esperados = Imovel.objects.filter(ativo=True, bairro='Marco', agente_coleta=self.outro).order_by('id')
+        self.assertEqual([feature['id'] for feature in features], list(esperados.values_list('id', flat=True)))
+        self.assertTrue(features)
+        self.assertEqual(self.exportar(bairro='Umarizal'), [])
+
+
+class AssincronoTestCase(ColetaTestCase):
+    """
+    Endpoints assíncronos (/api/assincrono/imoveis/) com as mesmas
+    respostas das versões síncronas
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.outro = User.objects.create_user('outro', password='senha')
+        for numero in range(7):
+            self.criar_imovel(numero_imovel=str(numero), bairro=('Marco', 'Nazaré')[numero % 2],
+                              latitude=-1.45 + numero * 1e-3, longitude=-48.49 + numero * 1e-5,
+                              agente_coleta=(self.agente, self.outro, None)[numero % 3],
+                              foto=foto_jpeg() if numero == 2 else None)
+        self.criar_imovel(numero_imovel='inativo', ativo=False)
+        # Sessão: as views assíncronas autenticam como o ImovelViewSet
+        self.navegador = Client()
+        self.navegador.force_login(self.agente)
+        patcher = mock.patch.object(CursorDataColetaPagination, 'page_size', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMesmaResposta(self, caminho, parametros=None):
+        sincrona = self.navegador.get(f'/api/imoveis/{caminho}', parametros, HTTP_ACCEPT='application/json')
+        assincrona = self.navegador.get(
+            f'/api/assincrono/imoveis/{caminho}', parametros, HTTP_ACCEPT='application/json')
+        self.assertEqual(sincrona.status_code, assincrona.status_code)
+        self.assertEqual(sincrona.get('ETag'), assincrona.get('ETag'))
+        self.assertEqual(
+            sincrona.content.replace(b'/api/imoveis/', b'/api/assincrono/imoveis/'), assincrona.content)
+        return sincrona
+
+    def test_listagem(self):
+        primeira = self.assertMesmaResposta('')
+        cursor = primeira.json()['next'].split('cursor=')[1]
+        self.assertMesmaResposta('', {'cursor': cursor})
+        self.assertMesmaResposta('', {'page': 2})
+        self.assertMesmaResposta('', {'bairro': 'Marco', 'agente_coleta': self.agente.pk})
+        self.assertEqual(self.assertMesmaResposta('', {'cursor': 'invalido!'}).status_code, 404)
+
+    def test_bbox(self):
+        self.assertMesmaResposta('', {'bbox': '-48.5,-1.46,-48.48,-1.446'})
+        with override_settings(COLETA_BBOX_LIMITE=2):
+            self.assertTrue(self.assertMesmaResposta('', {'bbox': '-48.5,-1.5,-48.4,-1.4'}).json()['excedeu'])
+        self.assertEqual(self.assertMesmaResposta('', {'bbox': '1,2'}).status_code, 400)
+
+    def test_proximos(self):
+        self.assertEqual(
+            len(self.assertMesmaResposta('proximos/', {'lat': -1.45, 'lng': -48.49, 'distancia': 150}).json()), 2)
+        self.assertEqual(
+            len(self.assertMesmaResposta('proximos/', {'lat': -1.45, 'lng': -48.49, 'distancia': 5000}).json()), 7)
+        self.assertEqual(self.assertMesmaResposta('proximos/', {'lat': 'x', 'lng': 1}).status_code, 400)
+
+    def test_estatisticas(self):
+        resposta = self.assertMesmaResposta('estatisticas/')
+        self.assertEqual(resposta.json()['total_imoveis'], 7)
+        nao_modificada = self.navegador.get('/api/assincrono/imoveis/estatisticas/',
+                                            HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(nao_modificada.status_code, 304)
+
+
+class BenchmarkTestCase(ColetaTestCase):
+    """
+    Comandos de dados sintéticos e de benchmark em uma base pequena
+    """
+
+    def sinteticos(self):
+        return list(Imovel.objects.order_by('numero_imovel').values_list(
+            'numero_imovel', 'bairro', 'latitude', 'longitude', 'agente_coleta__username', 'ativo', 'foto'))
+
+    def test_gerar_dados_sinteticos(self):
+        call_command('gerar_dados_sinteticos', quantidade=60, agentes=3, stdout=StringIO())
+        self.assertEqual(Imovel.objects.count(), 60)
+        self.assertEqual(User.objects.filter(username__startswith='agente_sintetico_').count(), 3)
+        self.assertFalse(Imovel.objects.filter(celula_grade__isnull=True).exists())
+        # Contadores e série refeitos depois do bulk_create
+        self.assertEqual(
+            EstatisticaColeta.objects.get(dimensao='total').ativos, Imovel.objects.filter(ativo=True).count())
+        self.assertEqual(
+            ColetaDiaria.objects.aggregate(total=Sum('quantidade'))['total'], Imovel.objects.filter(ativo=True).count())
+
+        # Mesma semente, mesmos dados; sem apagar, a semente é recusada
+        with self.assertRaises(CommandError):
+            call_command('gerar_dados_sinteticos', quantidade=60, agentes=3, stdout=StringIO())
+        gerados = self.sinteticos()
+        Imovel.objects.all().delete()
+        call_command('gerar_dados_sinteticos', quantidade=60, agentes=3, stdout=StringIO())
+        self.assertEqual(self.sinteticos(), gerados)
+
+    def test_benchmark_endpoints_no_banco_atual(self):
+        call_command('gerar_dados_sinteticos', quantidade=40, agentes=2, stdout=StringIO())
+        saida = Path(self.diretorio) / 'benchmark.json'
+        argumentos = ['--banco-atual', '--repeticoes', '3', '--aquecimento', '1', '--saida', str(saida)]
+        # O executor de testes já preparou o ambiente de testes
+        with mock.patch('coleta.management.commands.benchmark_endpoints.setup_test_environment'), \
+                mock.patch('coleta.management.commands.benchmark_endpoints.teardown_test_environment'):
+            call_command('benchmark_endpoints', *argumentos, stdout=StringIO())
+            resultado = orjson.loads(saida.read_bytes())
+            texto = StringIO()
+            call_command('benchmark_endpoints', *argumentos, '--comparar', str(saida), stdout=texto)
+
+        medidas = resultado['resultados']['atual-40']
+        self.assertEqual(set(medidas), {'list', 'retrieve', 'proximos', 'meus_imoveis', 'estatisticas', 'create'})
+        for nome, medida in medidas.items():
+            with self.subTest(endpoint=nome):
+                self.assertGreater(medida['consultas'], 0)
+                self.assertLessEqual(medida['p50_ms'], medida['p99_ms'])
+        self.assertIn('Comparação com', texto.getvalue())
+        # Os imóveis criados pelo benchmark são removidos
+        self.assertEqual(Imovel.objects.count(), 40)
+
+
+class SimularCargaTestCase(LiveServerTestCase):
+    """
+    simular_carga contra o servidor de testes, com poucas sessões
+
+    LiveServerTestCase porque o comando fala HTTP com um servidor de
+    verdade; a carga é uma sessão por vez, já que o servidor de testes
+    compartilha a conexão do SQLite em memória entre as threads.
+    """
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp(prefix='coleta_carga_')
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        configuracao = override_settings(
+            MEDIA_ROOT=self.diretorio,
+            COLETA_UPLOADS_ROOT=f'{self.diretorio}/uploads',
+            COLETA_TILES_ROOT=f'{self.diretorio}/tiles',
+            COLETA_METRICAS_ATIVO=False,
+            COLETA_ORCAMENTO_CONSULTAS='',
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_simular_carga(self):
+        saida = Path(self.diretorio) / 'carga.json'
+        with mock.patch('coleta.signals.agendar_miniaturas'):
+            call_command(
+                'simular_carga', '--url', self.live_server_url, '--duracao', '2', '--taxa', '3',
+                '--ciclos', '2', '--pausa', '0', '--usuarios', '2', '--max-sessoes', '1',
+                '--intervalo', '0.5', '--timeout', '10', '--saida', str(saida), stdout=StringIO(),
+            )
+
+        resumo = orjson.loads(saida.read_bytes())['resumo']
+        self.assertGreater(resumo['sessoes_iniciadas'], 0)
+        self.assertGreater(resumo['total']['requisicoes'], 0)
+        self.assertEqual(resumo['total']['erros'], 0)
+        # Sessões de agente e de mapa
+        self.assertLessEqual({'login', 'create', 'list'}, set(resumo['por_tipo']))
+        self.assertEqual(User.objects.filter(username__startswith='carga_usuario_').count(), 2)
+        # Os imóveis criados pela carga (e suas fotos) são removidos ao final
+        self.assertFalse(Imovel.objects.filter(numero_imovel__startswith='CARGA-').exists())
+        self.assertFalse(any(Path(self.diretorio).rglob('*.jpg')))
+
+
+class ParametrosTestCase(ColetaTestCase):
+    """
+    Parâmetros de consulta inválidos retornam 400
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.criar_imovel()
+
+    def test_vizinhos_rejeita_coordenadas_nao_finitas(self):
+        for lat, lng in (('nan', '-48.49'), ('-1.45', 'nan'), ('inf', '-48.49'), ('-1.45', '-inf')):
+            with self.subTest(lat=lat, lng=lng):
+                resposta = self.cliente.get('/api/imoveis/vizinhos/', {'lat': lat, 'lng': lng})
+                self.assertEqual(resposta.status_code, 400)
+
+    def test_vizinhos_com_coordenadas_validas(self):
+        resposta = self.cliente.get('/api/imoveis/vizinhos/', {'lat': '-1.45', 'lng': '-48.49', 'k': '5'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()), 1)
+
+    def test_bbox_rejeita_valores_nao_finitos(self):
+        for bbox in ('nan,-1.5,-48.4,-1.4', '-48.5,-1.5,inf,-1.4', '-inf,-1.5,-48.4,-1.4'):
+            for caminho in ('/api/imoveis/', '/api/imoveis/clusters/'):
+                with self.subTest(bbox=bbox, caminho=caminho):
+                    resposta = self.cliente.get(caminho, {'bbox': bbox, 'zoom': '13'})
+                    self.assertEqual(resposta.status_code, 400)
+                    self.assertIn('bbox', resposta.json()['error'])
+
+    def test_bbox_valido(self):
+        resposta = self.cliente.get('/api/imoveis/', {'bbox': '-48.5,-1.5,-48.4,-1.4'})
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_clusters_rejeita_zoom_negativo(self):
+        for zoom in ('-1', '-20', 'abc'):
+            with self.subTest(zoom=zoom):
+                resposta = self.cliente.get('/api/imoveis/clusters/', {'bbox': '-48.5,-1.5,-48.4,-1.4', 'zoom': zoom})
+                self.assertEqual(resposta.status_code, 400)
+                self.assertEqual(resposta.json()['error'], 'Parâmetro zoom inválido')
+
+    def test_clusters_com_zoom_valido(self):
+        for zoom in ('0', '13', '18'):
+            with self.subTest(zoom=zoom):
+                resposta = self.cliente.get('/api/imoveis/clusters/', {'bbox': '-48.5,-1.5,-48.4,-1.4', 'zoom': zoom})
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(resposta.json()['zoom'], int(zoom))
+
+
+class ClustersTestCase(ColetaTestCase):
+    """
+    Representantes dos clusters e o limite do zoom alto
+    """
+    bbox = (-48.5, -1.5, -48.4, -1.4)
+
+    def setUp(self):
+        super().setUp()
+        self.indice = IndiceClusters()
+        # Três imóveis na mesma célula do zoom máximo
+        self.ids = [
+            self.criar_imovel(numero_imovel=str(numero), longitude=-48.4902 + numero * 1e-6).pk
+            for numero in range(3)
+        ]
+
+    def representantes(self, zoom):
+        return [cluster['id'] for cluster in self.indice.buscar(*self.bbox, zoom)]
+
+    @override_settings(COLETA_INDICES_SINCRONIA_SEGUNDOS=3600)
+    def test_representante_removido_e_trocado_sem_consultas(self):
+        self.assertEqual(self.representantes(16), [self.ids[2]])
+        self.indice.remover(self.ids[2])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.representantes(10), [self.ids[1]])
+            self.assertEqual(self.representantes(16), [self.ids[1]])
+
+    @override_settings(COLETA_INDICES_SINCRONIA_SEGUNDOS=3600)
+    def test_representante_considera_os_pontos_alterados(self):
+        extra = self.criar_imovel(numero_imovel='9', latitude=-1.42, longitude=-48.45).pk
+        self.representantes(16)
+        self.indice.atualizar(self.ids[2], -1.4558, -48.4902 + 3e-6)
+        self.indice.atualizar(extra, -1.4558, -48.4902 + 4e-6)
+        self.indice.atualizar(extra, -1.4558, -48.4902 + 4e-6, ativo=False)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.representantes(16), [self.ids[2]])
+
+    def test_zoom_alto_indica_limite_excedido(self):
+        parametros = {'bbox': ','.join(map(str, self.bbox)), 'zoom': 18}
+        with override_settings(COLETA_BBOX_LIMITE=2):
+            resposta = self.cliente.get('/api/imoveis/clusters/', parametros).json()
+        self.assertTrue(resposta['excedeu'])
+        self.assertEqual(resposta['limite'], 2)
+        self.assertEqual(resposta['clusters'], [])
+
+        resposta = self.cliente.get('/api/imoveis/clusters/', parametros).json()
+        self.assertFalse(resposta['excedeu'])
+        self.assertEqual(sorted(cluster['id'] for cluster in resposta['clusters']), self.ids)
+
+
+class TilesTestCase(ColetaTestCase):
+    """
+    Cache em disco dos tiles vetoriais
+    """
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(tiles.diretorio_tiles(), ignore_errors=True)
+        self.imovel = self.criar_imovel()
+        self.z = 16
+        self.x, self.y = tiles.tile_do_ponto(self.imovel.latitude, self.imovel.longitude, self.z)
+
+    def arquivos(self):
+        return sorted(str(caminho.relative_to(tiles.diretorio_tiles()))
+                      for caminho in tiles.diretorio_tiles().rglob('*') if caminho.is_file())
+
+    def test_tile_gerado_antes_da_invalidacao_nao_e_gravado(self):
+        # Leitura do banco anterior à escrita...
+        geracao = tiles.reservar_geracao(self.z, self.x, self.y)
+        conteudo = tiles.gerar_tile(self.z, self.x, self.y)
+        # ...cuja invalidação (on_commit) acontece antes da gravação do tile
+        tiles.invalidar_tiles(self.imovel.latitude, self.imovel.longitude)
+        self.assertFalse(tiles.salvar_tile(self.z, self.x, self.y, conteudo, geracao))
+        self.assertIsNone(tiles.tile_em_cache(self.z, self.x, self.y))
+
+    def test_escrita_invalida_o_tile(self):
+        antes = tiles.obter_tile(self.z, self.x, self.y)
+        self.assertEqual(tiles.tile_em_cache(self.z, self.x, self.y), antes)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_imovel(numero_imovel='101', latitude=self.imovel.latitude + 1e-5)
+        self.assertIsNone(tiles.tile_em_cache(self.z, self.x, self.y))
+        self.assertGreater(len(tiles.obter_tile(self.z, self.x, self.y)), len(antes))
+
+    def test_tile_expirado_e_gerado_de_novo(self):
+        tiles.obter_tile(self.z, self.x, self.y)
+        tiles.caminho_tile(self.z, self.x, self.y).write_bytes(b'desatualizado')
+        self.assertEqual(tiles.obter_tile(self.z, self.x, self.y), b'desatualizado')
+        with self.settings(COLETA_TILES_VALIDADE=0):
+            self.assertNotEqual(tiles.obter_tile(self.z, self.x, self.y), b'desatualizado')
+
+    def test_invalidacao_nao_cria_arquivos(self):
+        tiles.obter_tile(self.z, self.x, self.y)
+        self.assertEqual(self.arquivos(), [f'{self.z}/{self.x}/{self.y}.geracao', f'{self.z}/{self.x}/{self.y}.pbf'])
+        for _ in range(3):
+            tiles.invalidar_tiles(self.imovel.latitude, self.imovel.longitude)
+            tiles.invalidar_tiles(self.imovel.latitude + 1, self.imovel.longitude + 1)
+        self.assertEqual(self.arquivos(), [])
+
+    def test_limpeza_apaga_expirados_e_orfaos(self):
+        tiles.obter_tile(self.z, self.x, self.y)
+        tiles.obter_tile(self.z, self.x + 1, self.y)
+        # Geração interrompida: geração sem tile
+        tiles.reservar_geracao(self.z, self.x + 2, self.y)
+        agora = time.time() + tiles.GERACAO_ORFA_SEGUNDOS
+        self.assertEqual(tiles.limpar_tiles(agora), (0, 1))
+        self.assertEqual(len(self.arquivos()), 4)
+        with self.settings(COLETA_TILES_VALIDADE=60):
+            saida = StringIO()
+            with mock.patch('time.time', return_value=time.time() + 60):
+                call_command('limpar_tiles', stdout=saida)
+        self.assertIn('2 tiles expirados', saida.getvalue())
+        self.assertEqual(self.arquivos(), [])
+        self.assertEqual(list(tiles.diretorio_tiles().iterdir()), [])
+
+    def test_rota_do_tile(self):
+        resposta = self.cliente.get(f'/api/tiles/{self.z}/{self.x}/{self.y}.pbf')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Type'], 'application/vnd.mapbox-vector-tile')
+
+
+@override_settings(COLETA_REMOVIDOS_RETENCAO_DIAS=30)
+class UploadsTestCase(ColetaTestCase):
+    """
+    Envio de fotos em partes (/api/uploads/)
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.imovel = self.criar_imovel()
+        self.conteudo = foto_jpeg().read()
+        self.metade = len(self.conteudo) // 2
+
+    def iniciar(self, sha256=None):
+        resposta = self.cliente.post('/api/uploads/', {
+            'imovel': self.imovel.pk, 'nome_arquivo': 'foto.jpg', 'tamanho': len(self.conteudo),
+            'sha256': sha256 or hashlib.sha256(self.conteudo).hexdigest(),
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        return f'/api/uploads/{resposta.json()["id"]}/'
+
+    def enviar(self, url, offset, parte):
+        return self.cliente.put(f'{url}?offset={offset}', parte, content_type='application/octet-stream')
+
+    def enviar_tudo(self, url):
+        self.assertEqual(self.enviar(url, 0, self.conteudo[:self.metade]).status_code, 200)
+        self.assertEqual(self.enviar(url, self.metade, self.conteudo[self.metade:]).status_code, 200)
+
+    def test_offset_diferente_do_recebido_retorna_409(self):
+        url = self.iniciar()
+        resposta = self.enviar(url, 10, self.conteudo[10:20])
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json()['recebido'], 0)
+
+    def test_retomada_depois_de_envio_parcial(self):
+        url = self.iniciar()
+        self.enviar(url, 0, self.conteudo[:self.metade])
+        # A resposta se perdeu: o cliente consulta de onde continuar
+        self.assertEqual(self.cliente.get(url).json()['recebido'], self.metade)
+        repetida = self.enviar(url, 0, self.conteudo[:self.metade])
+        self.assertEqual((repetida.status_code, repetida.json()['recebido']), (409, self.metade))
+        resposta = self.enviar(url, self.metade, self.conteudo[self.metade:])
+        self.assertEqual(resposta.json()['recebido'], len(self.conteudo))
+        self.assertEqual(self.cliente.post(f'{url}concluir/').status_code, 200)
+
+    def test_sha256_divergente_reinicia_o_envio(self):
+        url = self.iniciar(sha256='0' * 64)
+        self.enviar_tudo(url)
+        resposta = self.cliente.post(f'{url}concluir/')
+        self.assertEqual((resposta.status_code, resposta.json()['recebido']), (400, 0))
+        upload = UploadFoto.objects.get()
+        self.assertEqual(upload.recebido, 0)
+        self.assertEqual(caminho_upload(upload).stat().st_size, 0)
+        self.assertFalse(Imovel.objects.get(pk=self.imovel.pk).foto)
+
+    def test_conclusao_anexa_a_foto_e_agenda_as_miniaturas(self):
+        url = self.iniciar()
+        self.enviar_tudo(url)
+        upload = UploadFoto.objects.get()
+        with mock.patch('coleta.signals.agendar_miniaturas') as agendar, \
+                self.captureOnCommitCallbacks(execute=True):
+            resposta = self.cliente.post(f'{url}concluir/')
+        self.assertEqual(resposta.status_code, 200)
+        self.imovel.refresh_from_db()
+        self.assertTrue(self.imovel.foto)
+        self.assertFalse(self.imovel.miniaturas_geradas)
+        agendar.assert_called_once_with(self.imovel.foto.name)
+        self.assertFalse(UploadFoto.objects.exists())
+        self.assertFalse(caminho_upload(upload).exists())
+
+    def test_limpar_uploads_apaga_os_expirados(self):
+        expirado = UploadFoto.objects.get(pk=self.iniciar().split('/')[-2])
+        recente = UploadFoto.objects.get(pk=self.iniciar().split('/')[-2])
+        antigo = timezone.now() - timedelta(days=2)
+        UploadFoto.objects.filter(pk=expirado.pk).update(data_atualizacao=antigo)
+        orfao = caminho_upload(expirado).with_name('orfao.parte')
+        orfao.touch()
+        os.utime(orfao, (antigo.timestamp(), antigo.timestamp()))
+
+        saida = StringIO()
+        call_command('limpar_uploads', stdout=saida)
+        self.assertIn('1 envios expirados e 1 arquivos órfãos apagados', saida.getvalue())
+        self.assertEqual(list(UploadFoto.objects.values_list('pk', flat=True)), [recente.pk])
+        self.assertFalse(caminho_upload(expirado).exists())
+        self.assertFalse(orfao.exists())
+        self.assertTrue(caminho_upload(recente).exists())
+
+
+class SincronizacaoTestCase(ColetaTestCase):
+    """
+    Sincronização incremental e retenção dos registros de remoção
+    """
+
+    def alteracoes(self, desde):
+        return self.cliente.get('/api/imoveis/alteracoes/', {'desde': codificar_token(desde, 0)})
+
+    def test_remocao_recente_e_entregue(self):
+        imovel = self.criar_imovel()
+        pk = imovel.pk
+        desde = timezone.now() - timedelta(days=1)
+        imovel.delete()
+        resposta = self.alteracoes(desde)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(pk, resposta.json()['removidos'])
+
+    def test_token_anterior_a_retencao_exige_sincronizacao_completa(self):
+        resposta = self.alteracoes(timezone.now() - timedelta(days=31))
+        self.assertEqual(resposta.status_code, 410)
+        self.assertTrue(resposta.json()['sincronizacao_completa'])
+
+    def test_expurgo_apaga_apenas_registros_vencidos(self):
+        agora = timezone.now()
+        antigo = ImovelRemovido.objects.create(imovel_id=1, data_remocao=agora - timedelta(days=31))
+        recente = ImovelRemovido.objects.create(imovel_id=2, data_remocao=agora - timedelta(days=29))
+        call_command('expurgar_removidos', stdout=StringIO())
+        self.assertFalse(ImovelRemovido.objects.filter(pk=antigo.pk).exists())
+        self.assertTrue(ImovelRemovido.objects.filter(pk=recente.pk).exists())
+
+
+class LoteTestCase(ColetaTestCase):
+    """
+    Envio em lote idempotente (POST /api/imoveis/lote/)
+    """
+
+    def enviar(self, cliente, *chaves):
+        itens = [
+            {'chave_idempotencia': chave, 'numero_imovel': chave, 'endereco': 'Rua Teste',
+             'latitude': -1.4558, 'longitude': -48.4902}
+            for chave in chaves
+        ]
+        return cliente.post('/api/imoveis/lote/', itens, format='json')
+
+    def test_reenvio_aponta_para_o_registro_existente(self):
+        primeiro = self.enviar(self.cliente, 'tablet-1', 'tablet-2').json()
+        segundo = self.enviar(self.cliente, 'tablet-1', 'tablet-2').json()
+        self.assertEqual(primeiro['criados'], 2)
+        self.assertEqual(segundo['existentes'], 2)
+        self.assertEqual(
+            [resultado['id'] for resultado in primeiro['resultados']],
+            [resultado['id'] for resultado in segundo['resultados']],
+        )
+
+    def test_chave_de_outro_agente_nao_devolve_o_registro_dele(self):
+        original = self.enviar(self.cliente, 'tablet-1').json()['resultados'][0]
+        outro = APIClient()
+        outro.force_authenticate(User.objects.create_user('outro', password='senha'))
+        resposta = self.enviar(outro, 'tablet-1').json()
+        self.assertEqual(resposta['criados'], 1)
+        self.assertNotEqual(resposta['resultados'][0]['id'], original['id'])
+        self.assertEqual(Imovel.objects.get(pk=original['id']).agente_coleta, self.agente)
+
+    def test_lote_sem_itens_aceitos_retorna_400(self):
+        resposta = self.cliente.post('/api/imoveis/lote/', [{'numero_imovel': '1'}, {}], format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['erros'], 2)
+        self.assertEqual([resultado['status'] for resultado in resposta.json()['resultados']], ['erro', 'erro'])
+        self.assertFalse(Imovel.objects.exists())
+
+    def test_chave_repetida_no_lote(self):
+        item = {'chave_idempotencia': 'tablet-1', 'numero_imovel': '1', 'endereco': 'Rua Teste',
+                'latitude': -1.4558, 'longitude': -48.4902}
+        resposta = self.cliente.post(
+            '/api/imoveis/lote/', [item, dict(item), {**item, 'numero_imovel': '2'}], format='json')
+        self.assertEqual(resposta.status_code, 200)
+        primeiro, igual, diferente = resposta.json()['resultados']
+        self.assertEqual((primeiro['status'], igual['status']), ('criado', 'criado'))
+        self.assertEqual(primeiro['id'], igual['id'])
+        self.assertEqual(diferente['status'], 'erro')
+        self.assertIn('chave_idempotencia', diferente['erros'])
+        self.assertEqual(Imovel.objects.get().numero_imovel, '1')
+
+    def test_conflito_repetido_retorna_409(self):
+        with mock.patch.object(ImovelViewSet, '_gravar_lote', side_effect=IntegrityError) as gravar:
+            resposta = self.enviar(self.cliente, 'tablet-1')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(gravar.call_count, 2)
+
+
+class OrcamentoTestCase(ColetaTestCase):
+    """
+    Orçamento de consultas por requisição (OrcamentoConsultasMiddleware)
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.criar_imovel(numero_imovel=str(numero)).pk for numero in range(6)]
+
+    def cliente_com_middleware(self):
+        # O middleware é carregado na primeira requisição de cada cliente
+        cliente = APIClient()
+        cliente.force_authenticate(self.agente)
+        return cliente
+
+    def estatisticas_com(self, modo, acao):
+        with override_settings(COLETA_ORCAMENTO_CONSULTAS=modo), \
+                mock.patch.object(ImovelViewSet, 'estatisticas', acao):
+            return self.cliente_com_middleware().get('/api/imoveis/estatisticas/')
+
+    def test_consulta_repetida_e_apontada(self):
+        def n_mais_1(view, request):
+            return Response([Imovel.objects.filter(pk=pk).exists() for pk in self.ids])
+
+        with self.assertLogs('coleta.orcamento', 'WARNING') as registro:
+            resposta = self.estatisticas_com('avisar', n_mais_1)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(registro.output), 1)
+        self.assertIn('consulta repetida 6 vezes (N+1?)', registro.output[0])
+
+    def test_varredura_completa_e_apontada(self):
+        def varredura(view, request):
+            return Response(Imovel.objects.filter(endereco='Rua Teste, 100').count())
+
+        with self.assertLogs('coleta.orcamento', 'WARNING') as registro:
+            self.estatisticas_com('avisar', varredura)
+        self.assertEqual(len(registro.output), 1)
+        self.assertIn('varredura completa de coleta_imovel', registro.output[0])
+
+    def test_modo_falhar_levanta_excecao(self):
+        def por_chave(view, request):
+            return Response(Imovel.objects.filter(pk=self.ids[0]).exists())
+
+        with mock.patch.dict(ImovelViewSet.ORCAMENTO_CONSULTAS, {'estatisticas': 0}):
+            with self.assertRaisesMessage(OrcamentoExcedido, '1 consultas SQL, orçamento de 0'):
+                self.estatisticas_com('falhar', por_chave)
+        self.assertEqual(self.estatisticas_com('falhar', por_chave)['X-Consultas-SQL'], '1/7')
+
+    @override_settings(COLETA_ORCAMENTO_CONSULTAS='falhar')
+    def test_escritas_dentro_do_orcamento(self):
+        # Bairros, agente e dia sem contadores: o pior caso de cada escrita
+        cliente = self.cliente_com_middleware()
+        dados = {'numero_imovel': '200', 'endereco': 'Rua Nova', 'latitude': -1.45, 'longitude': -48.49}
+        with self.captureOnCommitCallbacks(execute=True):
+            criado = cliente.post('/api/imoveis/', {**dados, 'bairro': 'Marco'}, format='json')
+            url = f'/api/imoveis/{criado.json()["id"]}/'
+            respostas = [
+                criado,
+                cliente.put(url, {**dados, 'bairro': 'Nazaré'}, format='json'),
+                cliente.patch(url, {'bairro': 'Umarizal', 'cidade': 'Ananindeua'}, format='json'),
+                cliente.post('/api/imoveis/lote/', [
+                    {**dados, 'chave_idempotencia': f'tablet-{numero}', 'bairro': f'Bairro {numero % 3}'}
+                    for numero in range(20)
+                ], format='json'),
+                cliente.post(f'/api/imoveis/{self.ids[0]}/desativar/'),
+                cliente.delete(f'/api/imoveis/{self.ids[1]}/'),
+            ]
+        self.assertEqual([resposta.status_code for resposta in respostas], [201, 200, 200, 200, 200, 204])
+        self.assertEqual(respostas[3].json()['criados'], 20)
+
+
+class ConcorrenciaTestCase(TransactionTestCase):
+    """
+    Perfil de produção do SQLite (coleta/bancos.py): WAL, conexão de
+    leitura e RoteadorBancos
+
+    TransactionTestCase porque o roteamento depende de estar ou não em um
+    bloco atômico (TestCase roda cada teste dentro de um).
+    """
+
+    ESCRITAS = 20
+    LOTE = 200
+    LEITORES = 4
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp(prefix='coleta_concorrencia_')
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        configuracao = override_settings(
+            COLETA_SQLITE_PRODUCAO=True,
+            DATABASE_ROUTERS=['coleta.bancos.RoteadorBancos'],
+            COLETA_METRICAS_ATIVO=False,
+            COLETA_ORCAMENTO_CONSULTAS='',
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def usar_arquivo(self):
+        """
+        Copia o banco de testes para um arquivo e aponta default e LEITURA
+        para ele, como em config/settings.py; só as conexões novas (das
+        threads) usam o arquivo, a desta thread continua no banco de testes
+        """
+        caminho = f'{self.diretorio}/coleta.sqlite3'
+        conexao = connections[DEFAULT_DB_ALIAS]
+        conexao.ensure_connection()
+        destino = sqlite3.connect(caminho)
+        conexao.connection.backup(destino)
+        destino.close()
+
+        anteriores = connections.settings[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = {**anteriores, 'NAME': caminho}
+        connections.settings[LEITURA] = {**anteriores, 'NAME': Path(caminho).resolve().as_uri() + '?mode=ro'}
+
+        def restaurar():
+            connections.settings[DEFAULT_DB_ALIAS] = anteriores
+            del connections.settings[LEITURA]
+        self.addCleanup(restaurar)
+
+    def test_roteamento(self):
+        self.assertEqual(router.db_for_read(Imovel), LEITURA)
+        self.assertEqual(Imovel.objects.all().db, LEITURA)
+        self.assertEqual(router.db_for_write(Imovel), DEFAULT_DB_ALIAS)
+        with transaction.atomic():
+            # Leituras dentro da transação precisam ver o que ela ainda não gravou
+            self.assertEqual(router.db_for_read(Imovel), DEFAULT_DB_ALIAS)
+            self.assertEqual(Imovel.objects.all().db, DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(Imovel), LEITURA)
+        self.assertFalse(router.allow_migrate(LEITURA, 'coleta'))
+
+    def test_leituras_concorrentes_com_escritas_em_lote(self):
+        self.usar_arquivo()
+        erros, bancos, modos, leituras = [], set(), {}, []
+        terminou = threading.Event()
+
+        def escritor():
+            try:
+                modos['escrita'] = connections[DEFAULT_DB_ALIAS].cursor().execute(
+                    'PRAGMA journal_mode').fetchone()[0]
+                for lote in range(self.ESCRITAS):
+                    with transaction.atomic():
+                        Imovel.objects.bulk_create(
+                            Imovel(numero_imovel=f'{lote}-{n}', endereco='Rua Teste',
+                                   latitude=-1.45 + n / 1e5, longitude=-48.49)
+                            for n in range(self.LOTE)
+                        )
+                        # Lida pela mesma conexão, dentro da transação
+                        consulta = Imovel.objects.filter(numero_imovel__startswith=f'{lote}-')
+                        bancos.add(consulta.db)
+                        if consulta.count() != self.LOTE:
+                            erros.append(f'lote {lote} não visível na própria transação')
+            except OperationalError as erro:
+                erros.append(f'escrita: {erro}')
+            finally:
+                terminou.set()
+                connections.close_all()
+
+        def leitor():
+            try:
+                modos['leitura'] = connections[LEITURA].cursor().execute('PRAGMA query_only').fetchone()[0]
+                while not terminou.is_set():
+                    pagina = Imovel.objects.filter(ativo=True).order_by('-data_coleta', '-id')[:50]
+                    bancos.add(pagina.db)
+                    list(pagina.values_list('id', flat=True))
+                    Imovel.objects.filter(latitude__range=(-1.46, -1.44)).count()
+                    leituras.append(1)
+            except OperationalError as erro:
+                erros.append(f'leitura: {erro}')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=escritor)]
+        threads += [threading.Thread(target=leitor) for _ in range(self.LEITORES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        self.assertEqual(erros, [])
+        self.assertGreater(len(leituras), self.LEITORES)
+        self.assertEqual(modos, {'escrita': 'wal', 'leitura': 1})
+        self.assertEqual(bancos, {DEFAULT_DB_ALIAS, LEITURA})
+        with sqlite3.connect(f'{self.diretorio}/coleta.sqlite3') as conexao:
+            total, = conexao.execute(f'SELECT COUNT(*) FROM {Imovel._meta.db_table}').fetchone()
+        self.assertEqual(total, self.ESCRITAS * self.LOTE)
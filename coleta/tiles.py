@@ -0,0 +1,321 @@
+"""
+Tiles vetoriais (Mapbox Vector Tile) dos imóveis ativos
+
+Os tiles são codificados no próprio processo (sem servidor de tiles
+externo) e guardados em disco em COLETA_TILES_ROOT/{z}/{x}/{y}.pbf, fora
+do MEDIA_ROOT. Quando um imóvel é criado, movido, desativado ou excluído,
+apenas os tiles que contêm a posição afetada (um por nível de zoom) são
+apagados.
+
+Um tile gerado a partir de uma leitura anterior a uma escrita pode
+terminar de ser gravado depois da invalidação dessa escrita. Por isso
+cada tile tem uma geração ({y}.geracao, conteúdo aleatório), criada por
+quem vai gerá-lo antes de consultar o banco: o tile só é gravado se a
+geração ainda é a mesma, e é apagado se ela sumir durante a gravação. A
+invalidação apaga a geração e depois o tile, sem gravar nada; assim só
+existem gerações de tiles em cache ou sendo gerados.
+
+Tiles com mais de COLETA_TILES_VALIDADE segundos são gerados de novo; o
+comando limpar_tiles apaga os expirados, com suas gerações, e as
+gerações que sobraram de gerações interrompidas.
+
+Cada imóvel vira uma feição do tipo ponto na camada "imoveis", com o id
+do imóvel como id da feição.
+"""
+
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .espacial import mercator, mercator_inverso
+
+
+NOME_CAMADA = 'imoveis'
+EXTENT = 4096
+ZOOM_MAXIMO_TILES = 20
+# Gerações sem tile mais antigas que isso são de gerações interrompidas
+GERACAO_ORFA_SEGUNDOS = 600
+
+_PONTO = 1
+_COMANDO_MOVE_TO_1 = (1 & 0x7) | (1 << 3)
+
+
+def _varint(valor):
+    partes = bytearray()
+    while True:
+        byte = valor & 0x7F
+        valor >>= 7
+        if valor:
+            partes.append(byte | 0x80)
+        else:
+            partes.append(byte)
+            return bytes(partes)
+
+
+def _zigzag(valor):
+    return (valor << 1) ^ (valor >> 31)
+
+
+def _campo_varint(numero, valor):
+    return _varint(numero << 3) + _varint(valor)
+
+
+def _campo_bytes(numero, conteudo):
+    return _varint((numero << 3) | 2) + _varint(len(conteudo)) + conteudo
+
+
+def tile_valido(z, x, y):
+    return 0 <= z <= ZOOM_MAXIMO_TILES and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def limites_tile(z, x, y):
+    """
+    Retorna (min_lng, min_lat, max_lng, max_lat) do tile
+    """
+    n = 2 ** z
+    lats, lngs = mercator_inverso([x / n, (x + 1) / n], [(y + 1) / n, y / n])
+    return float(lngs[0]), float(lats[0]), float(lngs[1]), float(lats[1])
+
+
+def tile_do_ponto(lat, lng, z):
+    """
+    Retorna (x, y) do tile que contém a coordenada no zoom z
+    """
+    n = 2 ** z
+    mx, my = mercator([lat], [lng])
+    return min(int(mx[0] * n), n - 1), min(int(my[0] * n), n - 1)
+
+
+def codificar_tile(pontos, z, x, y):
+    """
+    Codifica uma lista de (id, latitude, longitude) como tile MVT
+    """
+    if not pontos:
+        return b''
+
+    ids = np.array([ponto[0] for ponto in pontos], dtype=np.int64)
+    mx, my = mercator([ponto[1] for ponto in pontos], [ponto[2] for ponto in pontos])
+    n = 2 ** z
+    # Mesmo critério de tile_do_ponto para decidir a qual tile o ponto pertence
+    dentro = (
+        (np.minimum((mx * n).astype(np.int64), n - 1) == x)
+        & (np.minimum((my * n).astype(np.int64), n - 1) == y)
+    )
+    px = np.clip(np.floor((mx * n - x) * EXTENT), 0, EXTENT - 1).astype(np.int64)
+    py = np.clip(np.floor((my * n - y) * EXTENT), 0, EXTENT - 1).astype(np.int64)
+
+    feicoes = bytearray()
+    for pk, coluna, linha in zip(ids[dentro].tolist(), px[dentro].tolist(), py[dentro].tolist()):
+        geometria = _varint(_COMANDO_MOVE_TO_1) + _varint(_zigzag(coluna)) + _varint(_zigzag(linha))
+        feicao = (
+            _campo_varint(1, pk)
+            + _campo_varint(3, _PONTO)
+            + _campo_bytes(4, geometria)
+        )
+        feicoes += _campo_bytes(2, feicao)
+
+    camada = (
+        _campo_varint(15, 2)
+        + _campo_bytes(1, NOME_CAMADA.encode())
+        + bytes(feicoes)
+        + _campo_varint(5, EXTENT)
+    )
+    return _campo_bytes(3, camada)
+
+
+def diretorio_tiles():
+    return Path(getattr(settings, 'COLETA_TILES_ROOT', Path(settings.BASE_DIR) / 'tiles'))
+
+
+def caminho_tile(z, x, y):
+    return diretorio_tiles() / str(z) / str(x) / f'{y}.pbf'
+
+
+def caminho_geracao(z, x, y):
+    return diretorio_tiles() / str(z) / str(x) / f'{y}.geracao'
+
+
+def gerar_tile(z, x, y):
+    """
+    Consulta os imóveis ativos do tile e retorna o tile codificado
+    """
+    from .models import Imovel
+
+    min_lng, min_lat, max_lng, max_lat = limites_tile(z, x, y)
+    # Margem para arredondamentos da projeção; codificar_tile descarta
+    # os pontos que pertencem aos tiles vizinhos
+    margem = 1e-9
+    pontos = list(
+        Imovel.objects.filter(
+            ativo=True,
+            latitude__range=(min_lat - margem, max_lat + margem),
+            longitude__range=(min_lng - margem, max_lng + margem),
+        )
+        .order_by()
+        .values_list('id', 'latitude', 'longitude')
+    )
+    return codificar_tile(pontos, z, x, y)
+
+
+def _gravar(caminho, conteudo):
+    """
+    Grava o arquivo de forma atômica
+    """
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=caminho.parent, suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def _apagar(caminho):
+    try:
+        caminho.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def geracao_tile(z, x, y):
+    try:
+        return caminho_geracao(z, x, y).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def reservar_geracao(z, x, y):
+    """
+    Geração atual do tile, criada se ainda não existe; deve ser obtida
+    antes de consultar o banco (ver salvar_tile)
+    """
+    geracao = geracao_tile(z, x, y)
+    if geracao is not None:
+        return geracao
+    caminho = caminho_geracao(z, x, y)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=caminho.parent, suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as arquivo:
+        arquivo.write(uuid.uuid4().bytes)
+    try:
+        # link() não sobrescreve: com dois processos, vale a geração do primeiro
+        os.link(temporario, caminho)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temporario)
+    return geracao_tile(z, x, y)
+
+
+def salvar_tile(z, x, y, conteudo, geracao):
+    """
+    Grava o tile no cache se ele não foi invalidado desde geracao (obtida
+    com reservar_geracao antes de consultar o banco)
+    """
+    if geracao is None:
+        return False
+    if geracao_tile(z, x, y) != geracao:
+        return False
+    caminho = caminho_tile(z, x, y)
+    _gravar(caminho, conteudo)
+    # Invalidação entre a conferência e a gravação: o tile gravado pode
+    # não ter a escrita (a invalidação apaga a geração antes do tile)
+    if geracao_tile(z, x, y) != geracao:
+        _apagar(caminho)
+        return False
+    return True
+
+
+def gerar_e_salvar_tile(z, x, y):
+    """
+    Gera o tile e o grava no cache; retorna o tile codificado
+    """
+    geracao = reservar_geracao(z, x, y)
+    conteudo = gerar_tile(z, x, y)
+    salvar_tile(z, x, y, conteudo, geracao)
+    return conteudo
+
+
+def tile_em_cache(z, x, y):
+    """
+    Retorna o tile do cache em disco, ou None se não existe ou expirou
+    """
+    caminho = caminho_tile(z, x, y)
+    try:
+        if time.time() - caminho.stat().st_mtime >= validade():
+            descartar_tile(z, x, y)
+            return None
+        return caminho.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def validade():
+    return getattr(settings, 'COLETA_TILES_VALIDADE', 86400)
+
+
+def descartar_tile(z, x, y):
+    """
+    Apaga o tile e sua geração (a geração primeiro, ver salvar_tile)
+    """
+    _apagar(caminho_geracao(z, x, y))
+    _apagar(caminho_tile(z, x, y))
+
+
+def obter_tile(z, x, y):
+    """
+    Retorna o tile do cache em disco, gerando-o se necessário
+    """
+    conteudo = tile_em_cache(z, x, y)
+    if conteudo is None:
+        conteudo = gerar_e_salvar_tile(z, x, y)
+    return conteudo
+
+
+def invalidar_tiles(lat, lng):
+    """
+    Apaga do cache os tiles (de todos os zooms) que contêm a coordenada
+    """
+    for z in range(ZOOM_MAXIMO_TILES + 1):
+        descartar_tile(z, *tile_do_ponto(lat, lng, z))
+
+
+def limpar_tiles(agora=None):
+    """
+    Apaga os tiles expirados e suas gerações, as gerações sem tile e os
+    temporários deixados por gerações interrompidas (mais antigos que
+    GERACAO_ORFA_SEGUNDOS) e os diretórios vazios; retorna (tiles, arquivos)
+    apagados
+    """
+    agora = time.time() if agora is None else agora
+    tiles = arquivos = 0
+    raiz = diretorio_tiles()
+    if not raiz.exists():
+        return tiles, arquivos
+    for diretorio, subdiretorios, nomes in os.walk(raiz, topdown=False):
+        for nome in nomes:
+            caminho = Path(diretorio) / nome
+            try:
+                idade = agora - caminho.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if caminho.suffix == '.pbf':
+                if idade >= validade():
+                    # A geração primeiro, como em descartar_tile
+                    _apagar(caminho.with_suffix('.geracao'))
+                    _apagar(caminho)
+                    tiles += 1
+            elif idade >= GERACAO_ORFA_SEGUNDOS and not (
+                    caminho.suffix == '.geracao' and caminho.with_suffix('.pbf').exists()):
+                _apagar(caminho)
+                arquivos += 1
+        if Path(diretorio) != raiz:
+            try:
+                os.rmdir(diretorio)
+            except OSError:
+                # Não está vazio
+                pass
+    return tiles, arquivos
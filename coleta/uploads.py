@@ -0,0 +1,147 @@
+"""
+Envio de fotos em partes (uploads retomáveis)
+
+Fluxo:
+1. POST /api/uploads/ cria o envio (imóvel, nome, tamanho e SHA-256);
+2. PUT /api/uploads/{id}/?offset=N grava uma parte a partir do byte N,
+   que deve ser igual ao total já recebido; em caso de queda da conexão,
+   GET /api/uploads/{id}/ informa de onde continuar;
+3. POST /api/uploads/{id}/concluir/ confere o SHA-256 do arquivo montado
+   e anexa a foto ao imóvel.
+
+As partes são gravadas direto em um arquivo por envio em
+COLETA_UPLOADS_ROOT, fora do MEDIA_ROOT.
+"""
+
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image
+
+from .fotos import normalizar_foto
+
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class UploadInvalido(ValueError):
+    pass
+
+
+def diretorio_uploads():
+    return Path(getattr(settings, 'COLETA_UPLOADS_ROOT', Path(settings.BASE_DIR) / 'uploads'))
+
+
+def caminho_upload(upload):
+    return diretorio_uploads() / f'{upload.pk}.parte'
+
+
+def tamanho_maximo():
+    return getattr(settings, 'COLETA_UPLOADS_TAMANHO_MAXIMO', 30 * 1024 * 1024)
+
+
+def validade():
+    return timedelta(hours=getattr(settings, 'COLETA_UPLOADS_EXPIRACAO_HORAS', 24))
+
+
+def criar_arquivo(upload):
+    caminho = caminho_upload(upload)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.touch()
+
+
+def gravar_parte(upload, offset, conteudo):
+    """
+    Grava a parte no arquivo do envio a partir de offset
+
+    A posição é conferida antes pela view; gravar de novo os mesmos bytes
+    (reenvio de uma parte já recebida) não altera o arquivo.
+    """
+    if offset + len(conteudo) > upload.tamanho:
+        raise UploadInvalido('A parte ultrapassa o tamanho declarado do arquivo')
+    descritor = os.open(caminho_upload(upload), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        os.lseek(descritor, offset, os.SEEK_SET)
+        enviado = memoryview(conteudo)
+        while enviado:
+            enviado = enviado[os.write(descritor, enviado):]
+    finally:
+        os.close(descritor)
+
+
+def calcular_sha256(upload):
+    resumo = hashlib.sha256()
+    with open(caminho_upload(upload), 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def remover_arquivo(upload):
+    try:
+        caminho_upload(upload).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def anexar_foto(upload):
+    """
+    Confere o arquivo montado e o grava como foto do imóvel do envio
+    (passando pela mesma normalização das fotos enviadas de uma vez)
+    """
+    if upload.recebido != upload.tamanho:
+        raise UploadInvalido('O envio ainda não está completo')
+    if calcular_sha256(upload) != upload.sha256:
+        # Não há como saber qual parte veio corrompida: o envio recomeça do zero
+        os.truncate(caminho_upload(upload), 0)
+        upload.recebido = 0
+        upload.save(update_fields=['recebido', 'data_atualizacao'])
+        raise UploadInvalido('O SHA-256 do arquivo recebido não confere; envie o arquivo novamente')
+
+    with open(caminho_upload(upload), 'rb') as arquivo:
+        try:
+            foto, _ = normalizar_foto(File(arquivo, name=upload.nome_arquivo))
+        except (OSError, Image.DecompressionBombError):
+            raise UploadInvalido('O arquivo enviado não é uma imagem válida')
+
+    imovel = upload.imovel
+    imovel.foto = foto
+    imovel.save()
+    return imovel
+
+
+def expira_em(upload):
+    return upload.data_atualizacao + validade()
+
+
+def limpar_expirados(agora=None):
+    """
+    Apaga envios sem atividade há mais que a validade, além de arquivos
+    de partes sem envio correspondente; retorna (envios, arquivos) apagados
+    """
+    from .models import UploadFoto
+
+    agora = agora or timezone.now()
+    expirados = UploadFoto.objects.filter(data_atualizacao__lt=agora - validade())
+    envios = 0
+    for upload in expirados.iterator():
+        remover_arquivo(upload)
+        envios += 1
+    expirados.delete()
+
+    arquivos = 0
+    diretorio = diretorio_uploads()
+    if diretorio.exists():
+        ativos = {str(pk) for pk in UploadFoto.objects.values_list('pk', flat=True)}
+        limite = (agora - validade()).timestamp()
+        for caminho in diretorio.glob('*.parte'):
+            # Arquivos recentes podem pertencer a um envio sendo criado agora
+            if caminho.stem not in ativos and caminho.stat().st_mtime < limite:
+                caminho.unlink(missing_ok=True)
+                arquivos += 1
+    return envios, arquivos
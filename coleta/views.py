@@ -2,13 +2,45 @@
 Views para a API REST do WebGIS de Coleta
 """
 
-from rest_framework import viewsets, status
+import hmac
+import json
+from datetime import date
+from math import isfinite
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.fields import DateTimeField
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.permissions import BasePermission, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Imovel
-from .serializers import ImovelSerializer, ImovelListSerializer
+from .clusters import indice_clusters
+from .condicional import condicional, validadores_colecao, validadores_detalhe
+from .espacial import filtrar_por_raio, filtro_celulas_no_raio
+from . import fragmentos, metricas
+from .estatisticas import ler_estatisticas
+from .models import Imovel, UploadFoto
+from .negociacao import NegociacaoFormato
+from .paginacao import ImovelPagination
+from .parsers import BinarioParser, NDJSONParser
+from .renderers import ColunarMsgpackRenderer, ColunarRenderer, ORJSONRenderer
+from .serializacao import float_json, serializacao_rapida
+from .series import ler_serie
+from .signals import agrupar_contadores
+from .serializers import ImovelSerializer, ImovelListSerializer, ImovelLoteSerializer, UploadFotoSerializer
+from .sincronizacao import SincronizacaoExpirada, TokenInvalido, buscar_alteracoes
+from .tiles import obter_tile, tile_valido
+from .uploads import UploadInvalido, anexar_foto, criar_arquivo, gravar_parte, remover_arquivo
+from .vizinhos import indice_vizinhos
 
 
 class ImovelViewSet(viewsets.ModelViewSet):
@@ -17,21 +49,69 @@ class ImovelViewSet(viewsets.ModelViewSet):
     
     Endpoints disponíveis:
     - GET /api/imoveis/ - Listar todos os imóveis
+    - GET /api/imoveis/?bbox=minLng,minLat,maxLng,maxLat - Pontos da área visível do mapa
     - POST /api/imoveis/ - Criar novo imóvel
+    - POST /api/imoveis/lote/ - Criar vários imóveis de uma vez (idempotente)
     - GET /api/imoveis/{id}/ - Obter detalhes de um imóvel
     - PUT /api/imoveis/{id}/ - Atualizar um imóvel
     - DELETE /api/imoveis/{id}/ - Deletar um imóvel
     - GET /api/imoveis/meus_imoveis/ - Listar imóveis do usuário
     - GET /api/imoveis/proximos/ - Buscar imóveis próximos
+    - GET /api/imoveis/vizinhos/ - Buscar os k imóveis mais próximos
+    - GET /api/imoveis/clusters/ - Imóveis agrupados por nível de zoom
     - GET /api/imoveis/estatisticas/ - Obter estatísticas
+    - GET /api/imoveis/serie_temporal/ - Imóveis coletados por dia
+    - GET /api/imoveis/alteracoes/ - Sincronização incremental
     - POST /api/imoveis/{id}/desativar/ - Desativar um imóvel
+    - GET /api/imoveis/export.geojson - Exportar imóveis em GeoJSON (streaming)
     """
     queryset = Imovel.objects.filter(ativo=True).select_related('agente_coleta')
     serializer_class = ImovelSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ImovelPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['numero_imovel', 'bairro', 'cidade', 'agente_coleta']
     
+    content_negotiation_class = NegociacaoFormato
+    
+    # Ações servidas por SerializacaoRapida e renderizadas com orjson
+    ACOES_SERIALIZACAO_RAPIDA = ('list', 'proximos')
+    
+    # Ações serializadas pelo ImovelSerializer com o cache de fragmentos
+    # (também renderizadas com orjson)
+    ACOES_FRAGMENTOS = ('retrieve', 'meus_imoveis', 'alteracoes')
+    
+    # Ações que aceitam o formato colunar (?formato=colunar ou msgpack)
+    ACOES_COLUNARES = ('list', 'exportar_geojson')
+    
+    # Máximo de consultas SQL por requisição de cada action, contando sessão
+    # e usuário (ver coleta/orcamento.py e o comando verificar_consultas):
+    # o medido no pior caso mais uma folga de uma ou duas. Nas escritas, os
+    # contadores de estatísticas e da série custam uma instrução por tabela
+    # (somar_contadores), existam ou não as linhas, mais uma para apagar as
+    # linhas zeradas quando há decrementos; no lote não crescem com os itens
+    ORCAMENTO_CONSULTAS = {
+        'list': 6,
+        'retrieve': 5,
+        'create': 9,
+        'update': 12,
+        'partial_update': 12,
+        'destroy': 13,
+        'lote': 10,
+        'meus_imoveis': 6,
+        'proximos': 5,
+        'vizinhos': 5,
+        'clusters': 4,
+        'alteracoes': 4,
+        'estatisticas': 7,
+        'serie_temporal': 4,
+        'exportar_geojson': 4,
+        'desativar': 11,
+    }
+    
+    # Ações que percorrem a tabela de imóveis inteira por definição
+    ACOES_VARREDURA = ('exportar_geojson',)
+    
     def get_serializer_class(self):
         """
         Retorna serializer apropriado para a ação
@@ -40,20 +120,262 @@ class ImovelViewSet(viewsets.ModelViewSet):
             return ImovelListSerializer
         return ImovelSerializer
     
+    def get_renderers(self):
+        """
+        Listagens grandes usam o ORJSONRenderer (mesmos bytes do JSONRenderer)
+        e, quando solicitado, os renderers colunares
+        """
+        renderers = super().get_renderers()
+        acoes_orjson = self.ACOES_SERIALIZACAO_RAPIDA
+        if fragmentos.ativo():
+            # Sem fragmentos, os floats do serializer seriam escritos pelo orjson
+            acoes_orjson += self.ACOES_FRAGMENTOS
+        if self.action in acoes_orjson:
+            renderers = [
+                ORJSONRenderer() if type(renderer) is JSONRenderer else renderer
+                for renderer in renderers
+            ]
+        if self.action in self.ACOES_COLUNARES:
+            renderers += [ColunarRenderer(), ColunarMsgpackRenderer()]
+        return renderers
+    
+    @condicional(validadores_colecao)
+    def list(self, request, *args, **kwargs):
+        """
+        Lista imóveis; com o parâmetro bbox retorna apenas os pontos da área
+        
+        Lida com values() e SerializacaoRapida, sem instanciar os modelos
+        """
+        if 'bbox' in request.query_params:
+            return self._listar_bbox(request)
+        
+        serializacao = serializacao_rapida(ImovelListSerializer)
+        queryset = serializacao.valores(self.filter_queryset(self.get_queryset()))
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializacao.representar(page, request))
+        return Response(serializacao.representar(queryset, request))
+    
+    @condicional(validadores_detalhe)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Detalhe de um imóvel, com ETag/Last-Modified de data_atualizacao
+        """
+        dados, = self._representar([self.get_object()])
+        return Response(dados)
+    
+    def _listar_bbox(self, request):
+        """
+        Retorna os pontos (id, latitude, longitude) dentro de um retângulo
+        Query param: bbox=minLng,minLat,maxLng,maxLat
+        
+        Se a área tiver mais imóveis que o limite, nenhum ponto é retornado
+        e a resposta indica que o mapa deve ser aproximado.
+        """
+        try:
+            bbox = self._ler_bbox(request)
+        except ValueError as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        limite = getattr(settings, 'COLETA_BBOX_LIMITE', 5000)
+        pontos = list(self._consulta_bbox(self.filter_queryset(self.get_queryset()), bbox, limite))
+        return Response(self._resposta_bbox(pontos, limite))
+    
+    @staticmethod
+    def _resposta_bbox(pontos, limite):
+        """
+        Monta a resposta do modo bbox a partir de até limite + 1 pontos
+        """
+        excedeu = len(pontos) > limite
+        resposta = {
+            'excedeu': excedeu,
+            'limite': limite,
+            'quantidade': 0 if excedeu else len(pontos),
+            'pontos': [] if excedeu else [[pk, float_json(lat), float_json(lng)] for pk, lat, lng in pontos],
+        }
+        if excedeu:
+            resposta['mensagem'] = 'Muitos imóveis nesta área, aproxime o mapa'
+        return resposta
+    
+    def _ler_bbox(self, request):
+        """
+        Lê o parâmetro bbox=minLng,minLat,maxLng,maxLat
+        Levanta ValueError com a mensagem de erro se for inválido
+        """
+        try:
+            min_lng, min_lat, max_lng, max_lat = (
+                float(valor) for valor in request.query_params.get('bbox', '').split(',')
+            )
+        except ValueError:
+            raise ValueError('bbox deve ter o formato minLng,minLat,maxLng,maxLat')
+        
+        if not all(isfinite(valor) for valor in (min_lng, min_lat, max_lng, max_lat)):
+            raise ValueError('bbox deve ter apenas valores finitos')
+        if min_lng > max_lng or min_lat > max_lat:
+            raise ValueError('bbox inválido')
+        return min_lng, min_lat, max_lng, max_lat
+    
+    @staticmethod
+    def _consulta_bbox(queryset, bbox, limite):
+        """
+        Consulta de até limite + 1 tuplas (id, latitude, longitude) dentro do bbox
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox
+        # Sem ordenação para que o SQLite percorra apenas o índice
+        # (latitude, longitude, ativo) e pare ao atingir o limite
+        return (
+            queryset
+            .filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+            .order_by()
+            .values_list('id', 'latitude', 'longitude')[:limite + 1]
+        )
+    
     def perform_create(self, serializer):
         """
         Define o agente de coleta ao criar
         """
         serializer.save(agente_coleta=self.request.user)
     
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def lote(self, request):
+        """
+        Cria vários imóveis coletados offline em uma única transação
+        Body: lista JSON (ou NDJSON, um imóvel por linha); cada item precisa
+        de uma chave_idempotencia gerada pelo dispositivo
+        
+        Itens cuja chave já foi gravada pelo mesmo agente não são criados de
+        novo: o resultado aponta para o registro existente, então reenviar o
+        lote é seguro. Se nenhum item for aceito, a resposta é 400.
+        """
+        itens = request.data
+        if not isinstance(itens, list):
+            return Response(
+                {'error': 'O corpo deve ser uma lista de imóveis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        maximo = getattr(settings, 'COLETA_LOTE_MAXIMO', 500)
+        if len(itens) > maximo:
+            return Response(
+                {'error': f'O lote pode ter no máximo {maximo} imóveis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resultados = [None] * len(itens)
+        validos = {}  # chave -> (índices, dados validados)
+        for indice, item in enumerate(itens):
+            serializer = ImovelLoteSerializer(data=item, context=self.get_serializer_context())
+            if not serializer.is_valid():
+                resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': serializer.errors}
+                continue
+            chave = serializer.validated_data['chave_idempotencia']
+            # A mesma chave repetida no lote com os mesmos dados é tratada
+            # como um único imóvel; com dados diferentes, é um conflito
+            indices, dados = validos.setdefault(chave, ([], serializer.validated_data))
+            if dados != serializer.validated_data:
+                resultados[indice] = {
+                    'indice': indice,
+                    'status': 'erro',
+                    'erros': {'chave_idempotencia': [
+                        f'Chave repetida no lote com dados diferentes dos do item {indices[0]}'
+                    ]},
+                }
+                continue
+            indices.append(indice)
+        
+        if itens and not validos:
+            return Response({
+                'criados': 0,
+                'existentes': 0,
+                'erros': len(resultados),
+                'resultados': resultados
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            criados, existentes = self._gravar_lote(validos)
+        except IntegrityError:
+            # Outro envio do mesmo lote gravou alguma chave ao mesmo tempo
+            try:
+                criados, existentes = self._gravar_lote(validos)
+            except IntegrityError:
+                return Response(
+                    {'error': 'Conflito com outro envio do mesmo lote; reenvie o lote'},
+                    status=status.HTTP_409_CONFLICT
+                )
+        
+        for chave, (indices, _) in validos.items():
+            if chave in criados:
+                situacao, pk = 'criado', criados[chave]
+            else:
+                situacao, pk = 'existente', existentes[chave]
+            for indice in indices:
+                resultados[indice] = {
+                    'indice': indice,
+                    'status': situacao,
+                    'id': pk,
+                    'chave_idempotencia': chave
+                }
+        
+        return Response({
+            'criados': len(criados),
+            'existentes': len(existentes),
+            'erros': sum(1 for resultado in resultados if resultado['status'] == 'erro'),
+            'resultados': resultados
+        })
+    
+    def _gravar_lote(self, validos):
+        """
+        Grava com bulk_create os itens cujas chaves ainda não existem para o agente
+        Retorna os dicionários chave -> id dos criados e dos já existentes
+        """
+        with transaction.atomic():
+            existentes = dict(
+                Imovel.objects
+                .filter(agente_coleta=self.request.user, chave_idempotencia__in=list(validos))
+                .values_list('chave_idempotencia', 'id')
+            )
+            novos = []
+            for chave, (_, dados) in validos.items():
+                if chave in existentes:
+                    continue
+                imovel = Imovel(**dados)
+                imovel.agente_coleta = self.request.user
+                imovel.atualizar_celula_grade()
+                novos.append(imovel)
+            
+            Imovel.objects.bulk_create(novos, batch_size=200)
+            
+            # bulk_create não dispara post_save; os signals mantêm os
+            # índices e caches derivados atualizados, com os contadores
+            # gravados uma vez para o lote inteiro
+            with agrupar_contadores():
+                for imovel in novos:
+                    post_save.send(sender=Imovel, instance=imovel, created=True,
+                                   update_fields=None, raw=False, using=imovel._state.db)
+        
+        criados = {imovel.chave_idempotencia: imovel.pk for imovel in novos}
+        return criados, existentes
+    
+    def _representar(self, imoveis):
+        """
+        Representações de imóveis pelo ImovelSerializer, com o cache de
+        fragmentos
+        """
+        return fragmentos.representar(
+            self.request, ImovelSerializer, imoveis,
+            lambda faltantes: self.get_serializer(faltantes, many=True).data,
+        )
+    
     @action(detail=False, methods=['get'])
+    @condicional(validadores_colecao, por_usuario=True)
     def meus_imoveis(self, request):
         """
         Retorna apenas os imóveis coletados pelo usuário autenticado
         """
         imoveis = self.queryset.filter(agente_coleta=request.user)
-        serializer = self.get_serializer(imoveis, many=True)
-        return Response(serializer.data)
+        pagina = self.paginate_queryset(imoveis)
+        return self.get_paginated_response(self._representar(pagina))
     
     @action(detail=False, methods=['get'])
     def proximos(self, request):
@@ -78,44 +400,278 @@ class ImovelViewSet(viewsets.ModelViewSet):
             lng = float(lng)
             distancia = float(distancia)
             
-            # Buscar todos os imóveis e calcular distância
-            imoveis_com_distancia = []
-            for imovel in self.queryset:
-                dist = imovel.get_distancia_para(lat, lng)
-                if dist <= distancia:
-                    imoveis_com_distancia.append((imovel, dist))
+            # Buscar apenas os candidatos das células da grade que
+            # intersectam o raio e calcular as distâncias de uma só vez
+            candidatos = self.queryset
+            filtro = filtro_celulas_no_raio(lat, lng, distancia)
+            if filtro is not None:
+                candidatos = candidatos.filter(filtro)
             
-            # Ordenar por distância
-            imoveis_com_distancia.sort(key=lambda x: x[1])
-            imoveis_ordenados = [imovel for imovel, _ in imoveis_com_distancia]
+            ids = self._ids_no_raio(candidatos, lat, lng, distancia)
             
-            serializer = self.get_serializer(imoveis_ordenados, many=True)
-            return Response(serializer.data)
+            serializacao = serializacao_rapida(ImovelSerializer)
+            linhas = serializacao.valores_por_id(candidatos, ids)
+            return Response(serializacao.representar(linhas, request))
         except ValueError:
             return Response(
                 {'error': 'Coordenadas inválidas'},
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    def _ids_no_raio(self, queryset, lat, lng, distancia):
+        """
+        Retorna os ids dos imóveis do queryset dentro do raio, ordenados pela
+        distância (empates mantêm a ordenação do queryset)
+        """
+        linhas = list(queryset.values_list('id', 'latitude', 'longitude'))
+        return self._ordenar_por_distancia(linhas, lat, lng, distancia)
+    
+    @staticmethod
+    def _ordenar_por_distancia(linhas, lat, lng, distancia):
+        """
+        Ids das linhas (id, latitude, longitude) dentro do raio, do mais
+        próximo ao mais distante
+        """
+        coordenadas = np.array(linhas, dtype=np.float64).reshape(-1, 3)
+        _, _, ordem = filtrar_por_raio(coordenadas[:, 1], coordenadas[:, 2], lat, lng, distancia)
+        return coordenadas[ordem, 0].astype(np.int64).tolist()
+    
+    @action(detail=False, methods=['get'])
+    def vizinhos(self, request):
+        """
+        Busca os k imóveis mais próximos de uma coordenada
+        Query params: lat, lng, k (padrão 20, máximo 200)
+        
+        Exemplo: /api/imoveis/vizinhos/?lat=-1.4558&lng=-48.4902&k=20
+        """
+        lat = request.query_params.get('lat')
+        lng = request.query_params.get('lng')
+        k = request.query_params.get('k', 20)
+        
+        if not lat or not lng:
+            return Response(
+                {'error': 'Parâmetros lat e lng são obrigatórios'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            lat = float(lat)
+            lng = float(lng)
+            k = min(max(int(k), 1), 200)
+            if not (isfinite(lat) and isfinite(lng)):
+                raise ValueError('coordenadas não finitas')
+        except ValueError:
+            return Response(
+                {'error': 'Parâmetros inválidos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Imóveis excluídos por outros workers ainda podem estar no índice;
+        # eles são descartados aqui e a busca é refeita
+        for _ in range(3):
+            resultado = indice_vizinhos.buscar(lat, lng, k)
+            imoveis = self.queryset.in_bulk([pk for pk, _ in resultado])
+            faltando = [pk for pk, _ in resultado if pk not in imoveis]
+            if not faltando:
+                break
+            for pk in faltando:
+                indice_vizinhos.remover(pk)
+        
+        resultado = [(pk, dist) for pk, dist in resultado if pk in imoveis]
+        serializer = self.get_serializer([imoveis[pk] for pk, _ in resultado], many=True)
+        dados = serializer.data
+        for item, (_, dist) in zip(dados, resultado):
+            item['distancia'] = round(dist, 2)
+        return Response(dados)
+    
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Retorna os imóveis agrupados para o nível de zoom do mapa
+        Query params: bbox=minLng,minLat,maxLng,maxLat, zoom
+        
+        Exemplo: /api/imoveis/clusters/?bbox=-48.55,-1.50,-48.40,-1.35&zoom=13
+        """
+        try:
+            bbox = self._ler_bbox(request)
+            zoom = int(request.query_params.get('zoom', ''))
+            if zoom < 0:
+                raise ValueError('zoom negativo')
+        except ValueError as erro:
+            mensagem = str(erro) if 'bbox' in str(erro) else 'Parâmetro zoom inválido'
+            return Response({'error': mensagem}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if zoom <= indice_clusters.ZOOM_MAXIMO:
+            return Response({'zoom': zoom, 'excedeu': False, 'clusters': indice_clusters.buscar(*bbox, zoom)})
+        
+        # Zoom alto: poucos imóveis na tela, retornados individualmente, com
+        # o mesmo limite (e a mesma indicação) do modo bbox
+        limite = getattr(settings, 'COLETA_BBOX_LIMITE', 5000)
+        pontos = list(self._consulta_bbox(self.queryset, bbox, limite))
+        excedeu = len(pontos) > limite
+        resposta = {
+            'zoom': zoom,
+            'excedeu': excedeu,
+            'clusters': [] if excedeu else [
+                {'latitude': lat, 'longitude': lng, 'quantidade': 1, 'id': pk} for pk, lat, lng in pontos
+            ],
+        }
+        if excedeu:
+            resposta['limite'] = limite
+            resposta['mensagem'] = 'Muitos imóveis nesta área, aproxime o mapa'
+        return Response(resposta)
+    
+    @action(detail=False, methods=['get'])
+    def alteracoes(self, request):
+        """
+        Sincronização incremental para os dispositivos de campo
+        Query param: desde (token retornado pela chamada anterior; sem ele,
+        retorna todos os imóveis ativos; com um token mais antigo que a
+        retenção das remoções, 410 e o dispositivo sincroniza do zero)
+        
+        Exemplo: /api/imoveis/alteracoes/?desde=MjAyNC0xMS0wNlQxMzozMDow...
+        """
+        try:
+            resultado = buscar_alteracoes(request.query_params.get('desde'))
+        except TokenInvalido as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        except SincronizacaoExpirada as erro:
+            return Response(
+                {'error': str(erro), 'sincronizacao_completa': True},
+                status=status.HTTP_410_GONE
+            )
+        
+        resultado['alterados'] = self._representar(resultado['alterados'])
+        return Response(resultado)
+    
     @action(detail=False, methods=['get'])
+    @condicional(validadores_colecao, por_usuario=True)
     def estatisticas(self, request):
         """
         Retorna estatísticas de coleta
+        
+        Lidas dos contadores materializados (EstatisticaColeta), sem
+        percorrer a tabela de imóveis
+        """
+        return Response(ler_estatisticas(request.user))
+    
+    @action(detail=False, methods=['get'])
+    def serie_temporal(self, request):
+        """
+        Retorna a quantidade de imóveis coletados por dia
+        
+        Parâmetros: inicio e fim (AAAA-MM-DD, padrão: últimos 30 dias)
+        e agrupar (agente ou bairro, opcional). Lida apenas da tabela
+        ColetaDiaria.
+        """
+        inicio = request.query_params.get('inicio')
+        fim = request.query_params.get('fim')
+        try:
+            inicio = date.fromisoformat(inicio) if inicio else None
+            fim = date.fromisoformat(fim) if fim else None
+        except ValueError:
+            return Response(
+                {'error': 'Datas devem estar no formato AAAA-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            serie = ler_serie(inicio, fim, request.query_params.get('agrupar') or None)
+        except ValueError as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serie)
+    
+    # Campos exportados como propriedades das feições GeoJSON
+    CAMPOS_EXPORTACAO = [
+        'id',
+        'numero_imovel',
+        'numero_hidrometro',
+        'endereco',
+        'bairro',
+        'cidade',
+        'observacoes',
+        'foto',
+        'agente_coleta',
+        'agente_coleta__username',
+        'data_coleta',
+        'data_atualizacao',
+    ]
+    
+    def exportar_geojson(self, request):
         """
-        total = self.queryset.count()
-        meus = self.queryset.filter(agente_coleta=request.user).count()
+        Exporta os imóveis (com os filtros da listagem) como FeatureCollection
+        GeoJSON, gerada e enviada aos poucos para manter a memória constante
         
-        por_agente = {}
-        for imovel in self.queryset.values('agente_coleta__username').annotate():
-            agente = imovel.get('agente_coleta__username')
-            if agente:
-                por_agente[agente] = por_agente.get(agente, 0) + 1
+        Rota registrada em config/urls.py: GET /api/imoveis/export.geojson
         
-        return Response({
-            'total_imoveis': total,
-            'meus_imoveis': meus,
-            'por_agente': por_agente
-        })
+        Com ?formato=colunar ou msgpack, retorna as mesmas propriedades
+        (mais latitude e longitude) em colunas, em uma única resposta
+        montada em memória: até COLETA_EXPORTACAO_COLUNAR_LIMITE imóveis,
+        acima disso responde 400
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        linhas = queryset.values('latitude', 'longitude', *self.CAMPOS_EXPORTACAO)
+        
+        if isinstance(request.accepted_renderer, ColunarRenderer):
+            limite = getattr(settings, 'COLETA_EXPORTACAO_COLUNAR_LIMITE', 50000)
+            linhas = list(linhas[:limite + 1])
+            if len(linhas) > limite:
+                return Response(
+                    {'error': f'A exportação colunar é limitada a {limite} imóveis; '
+                              'use filtros ou a exportação GeoJSON'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            formatar_data = DateTimeField().to_representation
+            return Response([
+                self._propriedades_exportacao(request, linha, formatar_data)
+                for linha in linhas
+            ])
+        
+        linhas = linhas.iterator(chunk_size=2000)
+        
+        resposta = StreamingHttpResponse(
+            self._gerar_geojson(request, linhas),
+            content_type='application/geo+json'
+        )
+        resposta['Content-Disposition'] = 'attachment; filename="imoveis.geojson"'
+        return resposta
+    
+    def _gerar_geojson(self, request, linhas):
+        formatar_data = DateTimeField().to_representation
+        
+        yield '{"type":"FeatureCollection","features":['
+        bloco = []
+        separador = ''
+        for linha in linhas:
+            longitude = linha.pop('longitude')
+            latitude = linha.pop('latitude')
+            linha = self._propriedades_exportacao(request, linha, formatar_data)
+            
+            bloco.append(separador + json.dumps({
+                'type': 'Feature',
+                'id': linha['id'],
+                'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+                'properties': linha,
+            }, ensure_ascii=False, separators=(',', ':')))
+            separador = ','
+            if len(bloco) >= 500:
+                yield ''.join(bloco)
+                bloco = []
+        if bloco:
+            yield ''.join(bloco)
+        yield ']}'
+    
+    def _propriedades_exportacao(self, request, linha, formatar_data):
+        """
+        Converte uma linha de values(CAMPOS_EXPORTACAO) nas propriedades exportadas
+        """
+        linha['agente_nome'] = linha.pop('agente_coleta__username')
+        if linha['foto']:
+            linha['foto'] = request.build_absolute_uri(default_storage.url(linha['foto']))
+        else:
+            linha['foto'] = None
+        linha['data_coleta'] = formatar_data(linha['data_coleta'])
+        linha['data_atualizacao'] = formatar_data(linha['data_atualizacao'])
+        return linha
     
     @action(detail=True, methods=['post'])
     def desativar(self, request, pk=None):
@@ -126,3 +682,146 @@ class ImovelViewSet(viewsets.ModelViewSet):
         imovel.ativo = False
         imovel.save()
         return Response({'status': 'Imóvel desativado'})
+
+
+class TileView(APIView):
+    """
+    Tiles vetoriais (Mapbox Vector Tile) dos imóveis ativos
+    
+    Endpoint: GET /api/tiles/{z}/{x}/{y}.pbf
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, z, x, y):
+        if not tile_valido(z, x, y):
+            return Response(
+                {'error': 'Tile inválido'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return HttpResponse(obter_tile(z, x, y), content_type='application/vnd.mapbox-vector-tile')
+
+
+class PermissaoMetricas(BasePermission):
+    """
+    Administradores (sessão ou Basic) ou, se COLETA_METRICAS_TOKEN estiver
+    definido, o cabeçalho Authorization: Bearer <token> (coletor do Prometheus)
+    """
+    
+    def has_permission(self, request, view):
+        token = getattr(settings, 'COLETA_METRICAS_TOKEN', '')
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricasView(APIView):
+    """
+    Métricas de desempenho por rota, no formato de exposição do Prometheus,
+    somadas entre os workers
+    
+    Endpoint: GET /api/metricas/
+    """
+    permission_classes = [PermissaoMetricas]
+    
+    def get(self, request):
+        if not metricas.ativo():
+            return Response(
+                {'error': 'Métricas desativadas (COLETA_METRICAS_ATIVO)'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return HttpResponse(metricas.exposicao(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UploadFotoViewSet(mixins.CreateModelMixin,
+                        mixins.RetrieveModelMixin,
+                        mixins.DestroyModelMixin,
+                        viewsets.GenericViewSet):
+    """
+    Envio de fotos em partes, retomável após quedas de conexão
+    
+    Endpoints:
+    - POST /api/uploads/ - Iniciar envio (imovel, nome_arquivo, tamanho, sha256)
+    - GET /api/uploads/{id}/ - Consultar quantos bytes já foram recebidos
+    - PUT /api/uploads/{id}/?offset=N - Enviar uma parte (application/octet-stream)
+    - POST /api/uploads/{id}/concluir/ - Conferir o arquivo e anexá-lo ao imóvel
+    - DELETE /api/uploads/{id}/ - Cancelar envio
+    """
+    serializer_class = UploadFotoSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, BinarioParser]
+    
+    def get_queryset(self):
+        return UploadFoto.objects.filter(usuario=self.request.user).select_related('imovel')
+    
+    def perform_create(self, serializer):
+        upload = serializer.save(usuario=self.request.user)
+        criar_arquivo(upload)
+    
+    def perform_destroy(self, instance):
+        remover_arquivo(instance)
+        instance.delete()
+    
+    def _conflito(self, upload, mensagem):
+        return Response(
+            {'error': mensagem, 'recebido': upload.recebido},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    def update(self, request, pk=None):
+        """
+        Grava uma parte do arquivo a partir do byte offset
+        
+        O offset deve ser igual ao total já recebido; caso contrário
+        retorna 409 com o valor de recebido, de onde o cliente deve
+        continuar (por exemplo, quando a resposta anterior se perdeu).
+        """
+        upload = self.get_object()
+        conteudo = request.data
+        if not isinstance(conteudo, bytes) or not conteudo:
+            return Response(
+                {'error': 'Envie a parte como application/octet-stream'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            offset = int(request.query_params['offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Parâmetro offset é obrigatório'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset != upload.recebido:
+            return self._conflito(upload, 'offset diferente do total já recebido')
+        
+        try:
+            gravar_parte(upload, offset, conteudo)
+        except UploadInvalido as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Só avança se nenhuma outra requisição gravou esta parte antes
+        atualizados = UploadFoto.objects.filter(pk=upload.pk, recebido=offset).update(
+            recebido=offset + len(conteudo),
+            data_atualizacao=timezone.now()
+        )
+        upload.refresh_from_db()
+        if not atualizados:
+            return self._conflito(upload, 'offset diferente do total já recebido')
+        return Response(self.get_serializer(upload).data)
+    
+    @action(detail=True, methods=['post'])
+    def concluir(self, request, pk=None):
+        """
+        Confere o SHA-256 do arquivo montado e o anexa como foto do imóvel
+        """
+        upload = self.get_object()
+        try:
+            imovel = anexar_foto(upload)
+        except UploadInvalido as erro:
+            return Response(
+                {'error': str(erro), 'recebido': upload.recebido},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        remover_arquivo(upload)
+        upload.delete()
+        serializer = ImovelSerializer(imovel, context=self.get_serializer_context())
+        return Response(serializer.data)
@@ -0,0 +1,157 @@
+"""
+Versões assíncronas (ASGI) dos endpoints de leitura mais acessados
+
+Endpoints (mesmos parâmetros, formatos e respostas das versões síncronas
+em /api/imoveis/):
+- GET /api/assincrono/imoveis/ - Listagem (inclusive ?bbox=)
+- GET /api/assincrono/imoveis/proximos/ - Imóveis próximos
+- GET /api/assincrono/imoveis/estatisticas/ - Estatísticas
+
+Servidas por um servidor ASGI (config.asgi, por exemplo com o worker do
+uvicorn no gunicorn), as consultas usam o ORM assíncrono do Django e o
+processo segue atendendo outras conexões enquanto uma requisição espera o
+banco ou um cliente lento. Autenticação, permissões, filtros, negociação
+de formato e erros reutilizam o ImovelViewSet; apenas a leitura dos dados
+é assíncrona. No Django 4.2 o ORM assíncrono ainda executa as consultas em
+uma thread do processo (sync_to_async), então o ganho está na espera, não
+em consultas em paralelo.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from .condicional import avalidadores_colecao, incluir_validadores, nao_modificado
+from .espacial import filtro_celulas_no_raio
+from .estatisticas import aler_estatisticas
+from .serializacao import serializacao_rapida
+from .serializers import ImovelListSerializer, ImovelSerializer
+from .views import ImovelViewSet
+
+
+async def _executar(request, acao, leitura, condicional=None):
+    """
+    Executa a leitura assíncrona com o ciclo de requisição do ImovelViewSet
+
+    As etapas síncronas do DRF que podem consultar o banco (sessão/usuário
+    e validação dos filtros) rodam via sync_to_async; a resposta JSON é
+    renderizada aqui, para o Django não precisar de outra thread para isso.
+    condicional: opções de avalidadores_colecao (ETag), ou None
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    view = ImovelViewSet(action_map={'get': acao}, basename='imovel', detail=False,
+                         format_kwarg=None, args=(), kwargs={})
+    view.headers = view.default_response_headers
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+
+    try:
+        await sync_to_async(view.initial)(drf_request)
+        if condicional is None:
+            resposta = await leitura(view, drf_request)
+        else:
+            etag, ultima = await avalidadores_colecao(view, drf_request, **condicional)
+            resposta = nao_modificado(drf_request, etag, ultima)
+            if resposta is None:
+                resposta = await leitura(view, drf_request)
+                if resposta.status_code == 200:
+                    incluir_validadores(resposta, etag, ultima)
+    except Exception as exc:
+        resposta = view.handle_exception(exc)
+
+    resposta = view.finalize_response(drf_request, resposta)
+    if not isinstance(resposta, Response):
+        return resposta
+    if isinstance(resposta.accepted_renderer, BrowsableAPIRenderer):
+        # A API navegável monta formulários consultando o banco
+        await sync_to_async(resposta.render)()
+    else:
+        resposta.render()
+    renderizada = HttpResponse(resposta.content, status=resposta.status_code)
+    for cabecalho, valor in resposta.items():
+        renderizada[cabecalho] = valor
+    return renderizada
+
+
+async def _filtrar(view):
+    # DjangoFilterBackend valida os filtros (agente_coleta consulta o
+    # usuário) e devolve o queryset ainda não avaliado
+    return await sync_to_async(view.filter_queryset)(view.get_queryset())
+
+
+async def _listar(view, request):
+    if 'bbox' in request.query_params:
+        return await _listar_bbox(view, request)
+
+    serializacao = serializacao_rapida(ImovelListSerializer)
+    queryset = serializacao.valores(await _filtrar(view))
+    paginacao = view.paginator
+    pagina = await paginacao.apaginate_queryset(queryset, request, view)
+    return paginacao.get_paginated_response(serializacao.representar(pagina, request))
+
+
+async def _listar_bbox(view, request):
+    try:
+        bbox = view._ler_bbox(request)
+    except ValueError as erro:
+        return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+
+    limite = getattr(settings, 'COLETA_BBOX_LIMITE', 5000)
+    consulta = view._consulta_bbox(await _filtrar(view), bbox, limite)
+    pontos = [ponto async for ponto in consulta]
+    return Response(view._resposta_bbox(pontos, limite))
+
+
+async def _proximos(view, request):
+    lat = request.query_params.get('lat')
+    lng = request.query_params.get('lng')
+    distancia = request.query_params.get('distancia', 1000)
+
+    if not lat or not lng:
+        return Response(
+            {'error': 'Parâmetros lat e lng são obrigatórios'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        lat = float(lat)
+        lng = float(lng)
+        distancia = float(distancia)
+
+        candidatos = view.queryset
+        filtro = filtro_celulas_no_raio(lat, lng, distancia)
+        if filtro is not None:
+            candidatos = candidatos.filter(filtro)
+
+        linhas = [linha async for linha in candidatos.values_list('id', 'latitude', 'longitude')]
+        ids = view._ordenar_por_distancia(linhas, lat, lng, distancia)
+
+        serializacao = serializacao_rapida(ImovelSerializer)
+        linhas = await serializacao.avalores_por_id(candidatos, ids)
+        return Response(serializacao.representar(linhas, request))
+    except ValueError:
+        return Response(
+            {'error': 'Coordenadas inválidas'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+async def _estatisticas(view, request):
+    return Response(await aler_estatisticas(request.user))
+
+
+async def listar_imoveis(request):
+    return await _executar(request, 'list', _listar, condicional={})
+
+
+async def imoveis_proximos(request):
+    return await _executar(request, 'proximos', _proximos)
+
+
+async def estatisticas(request):
+    return await _executar(request, 'estatisticas', _estatisticas, condicional={'por_usuario': True})
@@ -0,0 +1,189 @@
+"""
+Índice em memória para busca dos k vizinhos mais próximos
+
+Cada processo (worker do gunicorn) mantém sua própria árvore KD sobre as
+coordenadas dos imóveis ativos (ver coleta.indices). As coordenadas são
+convertidas para vetores unitários 3D, de modo que a distância euclidiana
+(corda) preserva a ordem da distância de Haversine.
+"""
+
+import heapq
+from math import asin
+
+import numpy as np
+
+from .espacial import RAIO_TERRA_M
+from .indices import IndiceEmMemoria
+
+
+def coordenadas_para_vetores(lats, lngs):
+    """
+    Converte arrays de latitude/longitude (graus) em vetores unitários 3D
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_lat = np.cos(lats)
+    return np.column_stack((cos_lat * np.cos(lngs), cos_lat * np.sin(lngs), np.sin(lats)))
+
+
+def corda_para_metros(corda2):
+    """
+    Converte o quadrado da distância de corda (esfera unitária) em metros
+    """
+    return 2 * RAIO_TERRA_M * asin(min(1.0, (corda2 ** 0.5) / 2))
+
+
+class ArvoreKD:
+    """
+    Árvore KD estática sobre pontos 3D
+    """
+
+    TAMANHO_FOLHA = 32
+
+    def __init__(self, ids, pontos):
+        ids = np.asarray(ids, dtype=np.int64)
+        pontos = np.asarray(pontos, dtype=np.float64).reshape(-1, 3)
+        indices = np.arange(len(ids))
+
+        # Nós: dimensão do corte (-1 para folhas), valor do corte,
+        # filhos e intervalo [inicio, fim) dos pontos da folha
+        self.dimensoes = []
+        self.cortes = []
+        self.esquerda = []
+        self.direita = []
+        self.inicios = []
+        self.fins = []
+
+        if len(ids):
+            self._novo_no(0, len(ids))
+        pilha = [0] if len(ids) else []
+        while pilha:
+            no = pilha.pop()
+            inicio, fim = self.inicios[no], self.fins[no]
+            if fim - inicio <= self.TAMANHO_FOLHA:
+                continue
+            bloco = indices[inicio:fim]
+            coordenadas = pontos[bloco]
+            dimensao = int(np.argmax(np.ptp(coordenadas, axis=0)))
+            meio = (fim - inicio) // 2
+            particao = np.argpartition(coordenadas[:, dimensao], meio)
+            indices[inicio:fim] = bloco[particao]
+
+            self.dimensoes[no] = dimensao
+            self.cortes[no] = float(pontos[indices[inicio + meio], dimensao])
+            self.esquerda[no] = self._novo_no(inicio, inicio + meio)
+            self.direita[no] = self._novo_no(inicio + meio, fim)
+            pilha.extend((self.esquerda[no], self.direita[no]))
+
+        # Pontos reordenados para que cada folha seja um bloco contíguo
+        self.ids = ids[indices]
+        self.pontos = pontos[indices]
+        self.ids_ordenados = np.sort(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _novo_no(self, inicio, fim):
+        self.dimensoes.append(-1)
+        self.cortes.append(0.0)
+        self.esquerda.append(-1)
+        self.direita.append(-1)
+        self.inicios.append(inicio)
+        self.fins.append(fim)
+        return len(self.inicios) - 1
+
+    def contem(self, pk):
+        posicao = np.searchsorted(self.ids_ordenados, pk)
+        return posicao < len(self.ids_ordenados) and self.ids_ordenados[posicao] == pk
+
+    def buscar(self, ponto, k, ignorar=frozenset()):
+        """
+        Retorna até k pares (corda2, id) mais próximos de ponto,
+        desconsiderando os ids em ignorar
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+
+        melhores = []  # heap de (-corda2, -id)
+        pilha = [(0, 0.0)]
+        while pilha:
+            no, limite = pilha.pop()
+            if len(melhores) == k and limite >= -melhores[0][0]:
+                continue
+
+            dimensao = self.dimensoes[no]
+            if dimensao < 0:
+                inicio, fim = self.inicios[no], self.fins[no]
+                distancias = ((self.pontos[inicio:fim] - ponto) ** 2).sum(axis=1)
+                for pk, corda2 in zip(self.ids[inicio:fim].tolist(), distancias.tolist()):
+                    if pk in ignorar:
+                        continue
+                    if len(melhores) < k:
+                        heapq.heappush(melhores, (-corda2, -pk))
+                    elif (-corda2, -pk) > melhores[0]:
+                        heapq.heapreplace(melhores, (-corda2, -pk))
+                continue
+
+            diferenca = ponto[dimensao] - self.cortes[no]
+            if diferenca < 0:
+                perto, longe = self.esquerda[no], self.direita[no]
+            else:
+                perto, longe = self.direita[no], self.esquerda[no]
+            pilha.append((longe, max(limite, diferenca * diferenca)))
+            pilha.append((perto, limite))
+
+        return [(-corda2, -pk) for corda2, pk in melhores]
+
+
+class IndiceVizinhos(IndiceEmMemoria):
+    """
+    Índice de vizinhos mais próximos do processo atual
+
+    Atualizações ficam em um buffer (pontos extras e ids removidos) e a
+    árvore só é reconstruída quando o buffer cresce demais.
+    """
+
+    def _limpar_dados(self):
+        self._arvore = None
+        self._extras = {}
+        self._removidos = set()
+
+    def _construir_dados(self, ids, lats, lngs):
+        self._arvore = ArvoreKD(ids, coordenadas_para_vetores(lats, lngs))
+
+    def _precisa_reconstruir(self):
+        pendentes = len(self._extras) + len(self._removidos)
+        return pendentes > max(1000, len(self._arvore) // 20)
+
+    def _inserir(self, pk, lat, lng):
+        if self._arvore.contem(pk):
+            self._removidos.add(pk)
+        self._extras[pk] = coordenadas_para_vetores([lat], [lng])[0]
+
+    def _remover(self, pk):
+        self._extras.pop(pk, None)
+        if self._arvore.contem(pk):
+            self._removidos.add(pk)
+
+    def buscar(self, lat, lng, k):
+        """
+        Retorna até k pares (id, distância em metros) mais próximos de
+        (lat, lng), do mais próximo para o mais distante
+        """
+        with self._lock:
+            self._garantir_atualizado()
+
+            ponto = coordenadas_para_vetores([lat], [lng])[0]
+            candidatos = self._arvore.buscar(ponto, k, self._removidos)
+            if self._extras:
+                ids = np.fromiter(self._extras.keys(), dtype=np.int64, count=len(self._extras))
+                pontos = np.array(list(self._extras.values()))
+                distancias = ((pontos - ponto) ** 2).sum(axis=1)
+                candidatos.extend(zip(distancias.tolist(), ids.tolist()))
+
+        mais_proximos = heapq.nsmallest(k, candidatos)
+        return [(pk, corda_para_metros(corda2)) for corda2, pk in mais_proximos]
+
+
+# Instância única por processo
+indice_vizinhos = IndiceVizinhos()
@@ -5,6 +5,7 @@ Generated by 'django-admin startproject' using Django 4.2.7.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -70,6 +71,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'coleta.orcamento.OrcamentoConsultasMiddleware',  # Orçamento de consultas (desenvolvimento/testes)
+    'coleta.metricas.MetricasMiddleware',  # Métricas por rota (/api/metricas/)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS
@@ -182,3 +185,88 @@ CORS_ALLOW_ALL_ORIGINS = True  # Em produção, especifique os domínios permiti
 # GeoDjango Configuration (descomente quando usar PostGIS)
 # GEOS_LIBRARY_PATH = None  # Será detectado automaticamente
 # GDAL_LIBRARY_PATH = None  # Será detectado automaticamente
+
+# Configurações do aplicativo de coleta
+# Intervalo (segundos) para os índices em memória de cada worker aplicarem
+# alterações gravadas por outros workers
+COLETA_INDICES_SINCRONIA_SEGUNDOS = config('COLETA_INDICES_SINCRONIA_SEGUNDOS', default=2, cast=float)
+# Máximo de pontos retornados pela listagem com bbox (acima disso o cliente deve aproximar o mapa)
+COLETA_BBOX_LIMITE = config('COLETA_BBOX_LIMITE', default=5000, cast=int)
+# Máximo de imóveis da exportação colunar/msgpack, montada inteira em memória
+# (acima disso a API responde 400; o GeoJSON, em streaming, não tem limite)
+COLETA_EXPORTACAO_COLUNAR_LIMITE = config('COLETA_EXPORTACAO_COLUNAR_LIMITE', default=50000, cast=int)
+# Cache em disco dos tiles vetoriais (/api/tiles/{z}/{x}/{y}.pbf): diretório
+# (fora do MEDIA_ROOT, que o DEBUG serve publicamente) e validade (segundos)
+COLETA_TILES_ROOT = BASE_DIR / 'tiles'
+COLETA_TILES_VALIDADE = config('COLETA_TILES_VALIDADE', default=86400, cast=int)
+# Dias em que os registros de imóveis excluídos ficam disponíveis para a
+# sincronização incremental (tokens mais antigos exigem sincronização completa;
+# os registros vencidos são apagados por: python manage.py expurgar_removidos)
+COLETA_REMOVIDOS_RETENCAO_DIAS = config('COLETA_REMOVIDOS_RETENCAO_DIAS', default=30, cast=int)
+# Número máximo de imóveis por envio em lote (POST /api/imoveis/lote/)
+COLETA_LOTE_MAXIMO = config('COLETA_LOTE_MAXIMO', default=500, cast=int)
+# Threads por worker para gerar as miniaturas das fotos em segundo plano
+COLETA_MINIATURAS_WORKERS = config('COLETA_MINIATURAS_WORKERS', default=2, cast=int)
+# Normalização das fotos enviadas: maior lado (px), qualidade e formato (JPEG ou WEBP)
+COLETA_FOTO_LADO_MAXIMO = config('COLETA_FOTO_LADO_MAXIMO', default=2048, cast=int)
+COLETA_FOTO_QUALIDADE = config('COLETA_FOTO_QUALIDADE', default=82, cast=int)
+COLETA_FOTO_FORMATO = config('COLETA_FOTO_FORMATO', default='JPEG')
+# Envios de fotos em partes (/api/uploads/): diretório das partes (fora do MEDIA_ROOT),
+# tamanho máximo do arquivo e de cada parte (bytes) e validade dos envios sem atividade
+COLETA_UPLOADS_ROOT = BASE_DIR / 'uploads'
+COLETA_UPLOADS_TAMANHO_MAXIMO = config('COLETA_UPLOADS_TAMANHO_MAXIMO', default=30 * 1024 * 1024, cast=int)
+COLETA_UPLOADS_PARTE_MAXIMA = config('COLETA_UPLOADS_PARTE_MAXIMA', default=5 * 1024 * 1024, cast=int)
+COLETA_UPLOADS_EXPIRACAO_HORAS = config('COLETA_UPLOADS_EXPIRACAO_HORAS', default=24, cast=int)
+# Caches do Django. O de fragmentos fica em memória em cada worker; para
+# compartilhá-lo entre workers use FileBasedCache (ou Redis/Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragmentos': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': config('COLETA_FRAGMENTOS_MAXIMO', default=50000, cast=int)},
+    },
+}
+# Cache de fragmentos (JSON já renderizado de cada imóvel): alias de CACHES,
+# validade das entradas (segundos) e chave para desligar
+COLETA_FRAGMENTOS_CACHE = config('COLETA_FRAGMENTOS_CACHE', default='fragmentos')
+COLETA_FRAGMENTOS_TIMEOUT = config('COLETA_FRAGMENTOS_TIMEOUT', default=86400, cast=int)
+COLETA_FRAGMENTOS_ATIVO = config('COLETA_FRAGMENTOS_ATIVO', default=True, cast=bool)
+# Métricas de desempenho por rota (GET /api/metricas/, formato do Prometheus):
+# chave para ligar (desligadas por padrão), arquivo SQLite onde os workers
+# somam as métricas (fora do projeto: no diretório temporário, ou em um
+# diretório de dados como /var/lib), intervalo (segundos) entre as gravações
+# de cada worker e token opcional para o coletor (Authorization: Bearer
+# <token>; sem ele, só administradores)
+COLETA_METRICAS_ATIVO = config('COLETA_METRICAS_ATIVO', default=False, cast=bool)
+COLETA_METRICAS_ARQUIVO = config(
+    'COLETA_METRICAS_ARQUIVO', default=os.path.join(tempfile.gettempdir(), 'coleta_metricas.sqlite3')
+)
+COLETA_METRICAS_INTERVALO = config('COLETA_METRICAS_INTERVALO', default=5, cast=float)
+COLETA_METRICAS_TOKEN = config('COLETA_METRICAS_TOKEN', default='')
+# Orçamento de consultas SQL por requisição (coleta/orcamento.py): 'avisar'
+# (log), 'falhar' (erro na requisição, para testes) ou vazio (desligado);
+# e quantas repetições da mesma consulta indicam um N+1
+COLETA_ORCAMENTO_CONSULTAS = config('COLETA_ORCAMENTO_CONSULTAS', default='avisar' if DEBUG else '')
+COLETA_ORCAMENTO_REPETICOES = config('COLETA_ORCAMENTO_REPETICOES', default=5, cast=int)
+# Perfil de produção do SQLite (coleta/bancos.py): WAL e PRAGMAs em cada
+# conexão, conexões persistentes (segundos) e leituras em uma conexão
+# somente leitura ('leitura'), com as escritas no banco principal.
+# Tempo de espera por um lock (ms), cache de páginas (KiB) e mmap (MiB)
+COLETA_SQLITE_PRODUCAO = config('COLETA_SQLITE_PRODUCAO', default=False, cast=bool)
+COLETA_SQLITE_CONN_MAX_AGE = config('COLETA_SQLITE_CONN_MAX_AGE', default=600, cast=int)
+COLETA_SQLITE_BUSY_TIMEOUT = config('COLETA_SQLITE_BUSY_TIMEOUT', default=5000, cast=int)
+COLETA_SQLITE_CACHE_KB = config('COLETA_SQLITE_CACHE_KB', default=65536, cast=int)
+COLETA_SQLITE_MMAP_MB = config('COLETA_SQLITE_MMAP_MB', default=256, cast=int)
+if COLETA_SQLITE_PRODUCAO and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['CONN_MAX_AGE'] = COLETA_SQLITE_CONN_MAX_AGE
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['leitura'] = {
+        **DATABASES['default'],
+        'NAME': Path(DATABASES['default']['NAME']).resolve().as_uri() + '?mode=ro',
+        # Nos testes, o mesmo banco de testes do default
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['coleta.bancos.RoteadorBancos']
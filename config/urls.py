@@ -19,14 +19,27 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
-from coleta.views import ImovelViewSet
+from coleta import views_assincronas
+from coleta.views import ImovelViewSet, MetricasView, TileView, UploadFotoViewSet
 
 # Router da API
 router = DefaultRouter()
 router.register(r'imoveis', ImovelViewSet, basename='imovel')
+router.register(r'uploads', UploadFotoViewSet, basename='upload')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path(
+        'api/imoveis/export.geojson',
+        ImovelViewSet.as_view({'get': 'exportar_geojson'}),
+        name='imovel-export-geojson'
+    ),
+    path('api/tiles/<int:z>/<int:x>/<int:y>.pbf', TileView.as_view(), name='tile'),
+    path('api/metricas/', MetricasView.as_view(), name='metricas'),
+    # Versões assíncronas (ASGI) dos endpoints de leitura
+    path('api/assincrono/imoveis/', views_assincronas.listar_imoveis, name='imovel-list-assincrono'),
+    path('api/assincrono/imoveis/proximos/', views_assincronas.imoveis_proximos, name='imovel-proximos-assincrono'),
+    path('api/assincrono/imoveis/estatisticas/', views_assincronas.estatisticas, name='imovel-estatisticas-assincrono'),
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
 ]
@@ -3,12 +3,15 @@ Configuração do Gunicorn para produção
 """
 
 import multiprocessing
+import os
 
 # Número de workers
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
 
-# Tipo de worker
-worker_class = "sync"
+# Tipo de worker. Para servir a aplicação ASGI (endpoints em /api/assincrono/):
+#   GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+#   gunicorn config.asgi:application -c gunicorn_config.py
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
 
 # Bind
 bind = "0.0.0.0:8000"